@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# asyncio version of PVoutput_Connection (python 3 only), with the same methods as coroutines, for
+# one process uploading to many systems without a thread each.  Connections come from an
+# AsyncHTTPClient that can be shared (along with its connection limits), requests are paced by the
+# same per API key rate limit as PVoutput_Connection, and every call takes a timeout (its deadline).
+
+import asyncio
+import datetime
+from urllib.parse import urlencode
+import PVoutput.pvoutput as pvoutput
+from PVoutput.pvoutput import PVoutputError, rate_limit, rate_limit_exceeded, output_params, status_params, \
+		status_batch_data, statuses_not_added, output_row, batch_output_results, parse_status_history, \
+		pvo_batchStatusLimit, pvo_batchOutputLimit, pvo_statusHistoryLimit
+from async_http import AsyncHTTPClient, AsyncHTTPError
+
+
+class AsyncPVoutputConnection():
+	def __init__(self, api_key, system_id, client=None, timeout=None):
+		"""
+		client is an AsyncHTTPClient to share with other connections, one is created (and owned) if it is None
+		"""
+		self.host = pvoutput.pvo_host
+		self.scheme = 'https' if pvoutput.pvo_https else 'http'
+		self.api_key = api_key
+		self.system_id = system_id
+		self.timeout = timeout if timeout is not None else pvoutput.pvo_timeout
+		self.rate_limit = rate_limit(api_key)
+		if client is None:
+			self.client = AsyncHTTPClient(timeout=self.timeout)
+			self.__owns_client = True
+		else:
+			self.client = client
+			self.__owns_client = False
+
+	async def add_output(self, date, generated, exported=None, peak_power=None, peak_time=None, condition=None,
+			min_temp=None, max_temp=None, comments=None, import_peak=None, import_offpeak=None, import_shoulder=None,
+			system_id=None, timeout=None):
+		"""
+		Uploads end of day output information
+		"""
+		params = output_params(date, generated, exported, peak_power, peak_time, condition, min_temp, max_temp, comments,
+				import_peak, import_offpeak, import_shoulder)
+		response = await self.make_request('POST', '/service/r1/addoutput.jsp', params, system_id, timeout)
+		self.__check(response)
+
+	async def add_status(self, date, time, energy_exp=None, power_exp=None, energy_imp=None, power_imp=None, temp=None, vdc=None,
+			cumulative=False, system_id=None, timeout=None):
+		"""
+		Uploads live output data
+		"""
+		params = status_params(date, time, energy_exp, power_exp, energy_imp, power_imp, temp, vdc, cumulative)
+		response = await self.make_request('POST', '/service/r2/addstatus.jsp', params, system_id, timeout)
+		self.__check(response)
+
+	async def add_batch_status(self, statuses, cumulative=False, batch_size=pvo_batchStatusLimit, system_id=None, timeout=None):
+		"""
+		Uploads many statuses, batch_size per request - returns the statuses that weren't added
+		"""
+		failed = []
+		for start in range(0, len(statuses), batch_size):
+			batch = statuses[start:start + batch_size]
+			params = {'data': status_batch_data(batch)}
+			if cumulative:
+				params['c1'] = 1
+			response = await self.make_request('POST', '/service/r2/addbatchstatus.jsp', params, system_id, timeout)
+			self.__check(response)
+			failed.extend(statuses_not_added(batch, response.read()))
+		return failed
+
+	async def add_batch_output(self, outputs, batch_size=pvo_batchOutputLimit, system_id=None, timeout=None):
+		"""
+		Uploads many days of end of day output, batch_size days per request - returns {date: outcome}
+		as PVoutput_Connection.add_batch_output() does
+		"""
+		outcomes = {}
+		rows = []
+		for output in outputs:
+			try:
+				rows.append((str(output['date']), output_row(output)))
+			except (KeyError, TypeError, ValueError) as e:
+				outcomes[str(output.get('date'))] = 'invalid - %s' % (e)
+
+		for start in range(0, len(rows), batch_size):
+			batch = rows[start:start + batch_size]
+			params = {'data': ';'.join(row for (date, row) in batch)}
+			response = await self.make_request('POST', '/service/r1/addbatchoutput.jsp', params, system_id, timeout)
+			if response.status == 400:
+				for (date, row) in batch:
+					outcomes[date] = 'not added - %s' % (response.read().decode('utf-8', 'replace').strip())
+				continue
+			self.__check(response)
+			results = batch_output_results(response.read())
+			for (date, row) in batch:
+				outcomes[date] = 'added' if results.get(date) == '1' else 'not added'
+		return outcomes
+
+	async def get_status(self, date=None, time=None, system_id=None, timeout=None):
+		"""
+		Retrieves status information
+		"""
+		params = {}
+		if date:
+			params['d'] = date
+		if time:
+			params['t'] = time
+		response = await self.make_request('GET', '/service/r1/getstatus.jsp', params, system_id, timeout)
+		self.__check(response)
+		return response.read()
+
+	async def get_status_history(self, date_from, date_to=None, time_from=None, time_to=None, limit=pvo_statusHistoryLimit,
+			system_id=None, timeout=None):
+		"""
+		Async generator of the StatusRows from date_from to date_to (YYYYMMDD), oldest day first
+		"""
+		day = datetime.datetime.strptime(str(date_from), '%Y%m%d').date()
+		last_day = datetime.datetime.strptime(str(date_to or date_from), '%Y%m%d').date()
+		while day <= last_day:
+			params = {'d': day.strftime('%Y%m%d'), 'h': 1, 'asc': 1, 'limit': limit}
+			if time_from:
+				params['from'] = time_from
+			if time_to:
+				params['to'] = time_to
+			response = await self.make_request('GET', '/service/r1/getstatus.jsp', params, system_id, timeout)
+			if not (response.status == 400 and b'No status found' in response.read()):
+				self.__check(response)
+				for row in parse_status_history(response.read()):
+					yield row
+			day += datetime.timedelta(days=1)
+
+	async def delete_status(self, date, time, system_id=None, timeout=None):
+		"""
+		Removes an existing status
+		"""
+		response = await self.make_request('POST', '/service/r1/deletestatus.jsp', {'d': date, 't': time}, system_id, timeout)
+		self.__check(response)
+		return response.read()
+
+	def __check(self, response):
+		if response.status == 400:
+			raise ValueError(response.read())
+		if response.status != 200:
+			raise PVoutputError(response.read())
+
+	async def __acquire(self):
+		while True:
+			wait = self.rate_limit.try_acquire()
+			if wait <= 0:
+				return
+			self.rate_limit.waits += 1
+			await asyncio.sleep(wait)
+
+	async def make_request(self, method, path, params=None, system_id=None, timeout=None):
+		"""
+		Sends a request, paced by the API key's rate limit (waiting for the reset, and sending it once
+		more, if pvoutput.org still says the limit was exceeded).  timeout is the deadline for each
+		attempt (the connection's timeout if None), asyncio.TimeoutError is raised when it passes.
+		"""
+		headers = {
+				'Accept': 'text/plain',
+				'X-Pvoutput-Apikey': self.api_key,
+				'X-Pvoutput-SystemId': system_id or self.system_id,
+				'X-Rate-Limit': '1'
+				}
+		url = '%s://%s%s' % (self.scheme, self.host, path)
+		if timeout is None:
+			timeout = self.timeout
+
+		for attempt in range(2):
+			await self.__acquire()
+			try:
+				if method == 'GET':
+					response = await self.client.get(url, params, headers, timeout)
+				else:
+					response = await self.client.post(url, urlencode(params or {}), headers, timeout)
+			except AsyncHTTPError as e:
+				raise PVoutputError('%s: request failed - %s' % (self.__class__.__name__, e))
+			if not rate_limit_exceeded(response):
+				self.rate_limit.update(response)
+				return response
+			print('%s: rate limit exceeded, waiting for the reset' % (self.__class__.__name__))
+			self.rate_limit.exhausted(response)
+		return response
+
+	def connection_stats(self):
+		return self.client.stats()
+
+	def rate_limit_stats(self):
+		return self.rate_limit.stats()
+
+	async def close(self):
+		if self.__owns_client:
+			await self.client.close()
+
+	async def __aenter__(self):
+		return self
+
+	async def __aexit__(self, exc_type, exc_value, traceback):
+		await self.close()
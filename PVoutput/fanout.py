@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Sends the same data to many PVoutput systems at once, e.g. a plant mirrored to several systems,
+# or many systems run under a few API keys.  Systems sharing an API key share its connection (and
+# so its connection pool and rate limit), and each system is sent to on its own, so one that is
+# slow or failing doesn't hold up the others.
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from PVoutput.pvoutput import PVoutput_Connection, PVoutputError
+
+default_max_per_key = 2        # requests in flight at the same time per API key
+
+
+class FanOut():
+	def __init__(self, targets, max_workers=None, max_per_key=default_max_per_key):
+		"""
+		targets is a list of (api_key, system_id) pairs
+		"""
+		self.targets = [(str(api_key), str(system_id)) for (api_key, system_id) in targets]
+		self.connections = {}
+		self.__key_semaphores = {}
+		for (api_key, system_id) in self.targets:
+			if api_key not in self.connections:
+				self.connections[api_key] = PVoutput_Connection(api_key, system_id)
+				self.__key_semaphores[api_key] = threading.BoundedSemaphore(max_per_key)
+		self.__executor = ThreadPoolExecutor(max_workers=max_workers or max(1, len(self.targets)))
+
+	def __call(self, fn, api_key, system_id):
+		with self.__key_semaphores[api_key]:
+			return fn(self.connections[api_key], system_id)
+
+	def run(self, fn, timeout=None):
+		"""
+		Calls fn(pvout, system_id) for every system at the same time.  Returns (results, failures),
+		both {system_id: ...} - what fn returned, or the exception it raised (a system still going
+		after timeout seconds is a failure, it carries on in the background).
+		"""
+		futures = dict(((api_key, system_id), self.__executor.submit(self.__call, fn, api_key, system_id))
+				for (api_key, system_id) in self.targets)
+		wait(futures.values(), timeout)
+
+		results = {}
+		failures = {}
+		for ((api_key, system_id), future) in futures.items():
+			if not future.done():
+				failures[system_id] = PVoutputError('system %s still going after %ss' % (system_id, timeout))
+				continue
+			try:
+				results[system_id] = future.result()
+			except Exception as e:
+				print('%s: system %s failed - %s' % (self.__class__.__name__, system_id, e))
+				failures[system_id] = e
+		return (results, failures)
+
+	def add_status(self, date, time, timeout=None, **status):
+		"""
+		add_status() to every system
+		"""
+		return self.run(lambda pvout, system_id: pvout.add_status(date, time, system_id=system_id, **status), timeout)
+
+	def add_batch_status(self, statuses, timeout=None):
+		"""
+		add_batch_status() to every system, the results are the statuses each one didn't add
+		"""
+		return self.run(lambda pvout, system_id: pvout.add_batch_status(statuses, system_id=system_id), timeout)
+
+	def add_output(self, date, generated, timeout=None, **output):
+		"""
+		add_output() to every system
+		"""
+		return self.run(lambda pvout, system_id: pvout.add_output(date, generated, system_id=system_id, **output), timeout)
+
+	def close(self):
+		self.__executor.shutdown(wait=True)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
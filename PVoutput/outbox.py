@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Write-ahead outbox for PVoutput statuses, in a local SQLite file.  Statuses are committed to the
+# outbox first and uploaded from it later (in batches), so a slow or failing pvoutput.org never
+# loses a status - the ones that aren't added are tried again, backing off, until they are.
+
+import os
+import json
+import time
+import socket
+import threading
+from PVoutput.pvoutput import PVoutputError, pvo_batchStatusLimit, status_fields
+
+default_outbox_file = os.path.join(os.path.expanduser('~'), '.pvoutput_outbox.sqlite')
+default_base_delay = 60        # seconds before the first retry of a status, doubling each time after
+default_max_delay = 3600       # longest wait between retries
+default_max_attempts = 48      # attempts before a status is given up on (left in the outbox, but not sent)
+default_keep_days = 7          # days uploaded statuses are kept for
+default_given_up_keep_days = 30  # days statuses given up on are kept for (e.g. to look at last_error) after their last attempt
+
+
+class Outbox():
+	def __init__(self, outbox_file=default_outbox_file, base_delay=default_base_delay, max_delay=default_max_delay,
+			max_attempts=default_max_attempts, slot_index=None):
+		# with a SlotIndex, statuses already uploaded are skipped, and uploads are recorded in it
+		self.slot_index = slot_index
+		self.outbox_file = os.path.abspath(os.path.expanduser(outbox_file))
+		self.base_delay = base_delay
+		self.max_delay = max_delay
+		self.max_attempts = max_attempts
+		self.__lock = threading.Lock()
+		# only imported once an outbox is opened - the scripts import this module for its default file name
+		import sqlite3
+		self.__db = sqlite3.connect(self.outbox_file, timeout=30, check_same_thread=False)
+		with self.__lock:
+			self.__db.execute('PRAGMA journal_mode=WAL')
+			self.__db.execute("""
+				create table if not exists statuses (
+					id integer primary key,
+					system_id text not null,
+					date text not null,
+					time text not null,
+					status_values text not null,
+					attempts integer not null default 0,
+					next_attempt real not null default 0,
+					last_error text,
+					done real,
+					unique (system_id, date, time)
+				)
+			""")
+			self.__db.execute('create index if not exists statuses_pending on statuses (system_id, done, next_attempt)')
+			self.__db.commit()
+
+	def enqueue(self, system_id, statuses):
+		"""
+		Commit statuses (dicts of the add_status() arguments, as for add_batch_status()) for
+		system_id to the outbox.  With a SlotIndex, statuses for slots already uploaded are left
+		out, whatever their values.  A status for a slot that is still in the outbox replaces it,
+		and is sent again if its values have changed.  Returns the number of new or changed statuses.
+		"""
+		system_id = str(system_id)
+		if self.slot_index is not None:
+			statuses = self.slot_index.missing(system_id, statuses)
+		changed = 0
+		with self.__lock:
+			for status in statuses:
+				values = json.dumps(dict((field, status.get(field)) for (field, param) in status_fields if status.get(field) is not None), sort_keys=True)
+				key = (system_id, str(status['date']), str(status['time']))
+				cursor = self.__db.execute('insert or ignore into statuses (system_id, date, time, status_values) values (?, ?, ?, ?)',
+						key + (values,))
+				if cursor.rowcount == 0:
+					cursor = self.__db.execute("""update statuses set status_values = ?, attempts = 0, next_attempt = 0, last_error = null, done = null
+							where system_id = ? and date = ? and time = ? and status_values != ?""", (values,) + key + (values,))
+				changed += cursor.rowcount
+			self.__db.commit()
+		return changed
+
+	def pending(self, system_id, limit=None, now=None):
+		"""
+		The statuses for system_id that are due to be sent, oldest first, as (id, status) pairs
+		"""
+		if now is None:
+			now = time.time()
+		sql = """select id, date, time, status_values from statuses
+				where system_id = ? and done is null and attempts < ? and next_attempt <= ? order by date, time"""
+		params = (str(system_id), self.max_attempts, now)
+		if limit is not None:
+			sql += ' limit ?'
+			params += (limit,)
+		with self.__lock:
+			rows = self.__db.execute(sql, params).fetchall()
+		pending = []
+		for (row_id, date, time_, values) in rows:
+			status = json.loads(values)
+			status['date'] = date
+			status['time'] = time_
+			pending.append((row_id, status))
+		return pending
+
+	def __retryDelay(self, attempts):
+		return min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+
+	def __markDone(self, row_ids, now):
+		self.__db.executemany('update statuses set done = ?, last_error = null where id = ?', [(now, row_id) for row_id in row_ids])
+
+	def __markFailed(self, row_ids, error, now):
+		for row_id in row_ids:
+			(attempts,) = self.__db.execute('select attempts + 1 from statuses where id = ?', (row_id,)).fetchone()
+			self.__db.execute('update statuses set attempts = ?, next_attempt = ?, last_error = ? where id = ?',
+					(attempts, now + self.__retryDelay(attempts), error, row_id))
+
+	def drain(self, pvout, system_id=None, batch_size=pvo_batchStatusLimit):
+		"""
+		Upload the due statuses for system_id (default pvout's system) through pvout.add_batch_status(),
+		a batch at a time.  Statuses pvoutput.org added are marked done, the others are retried later.
+		Stops at the first batch that fails outright (e.g. pvoutput.org is down).  Old statuses (and
+		old days of the SlotIndex) are purged afterwards.
+		Returns {'sent': n, 'failed': n, 'error': message or None}.
+		"""
+		if system_id is None:
+			system_id = pvout.system_id
+		result = {'sent':0, 'failed':0, 'error':None}
+		# each status is only tried once per drain, even if its retry is due straight away
+		tried = set()
+		while True:
+			batch = [(row_id, status) for (row_id, status) in self.pending(system_id, batch_size + len(tried)) if row_id not in tried][:batch_size]
+			if not batch:
+				break
+			tried.update(row_id for (row_id, status) in batch)
+			statuses = [status for (row_id, status) in batch]
+			try:
+				failed = pvout.add_batch_status(statuses, system_id=system_id)
+			except (PVoutputError, ValueError, socket.error) as e:
+				now = time.time()
+				with self.__lock:
+					self.__markFailed([row_id for (row_id, status) in batch], str(e), now)
+					self.__db.commit()
+				result['failed'] += len(batch)
+				result['error'] = str(e)
+				break
+			failed_statuses = set(id(status) for status in failed)
+			if self.slot_index is not None:
+				self.slot_index.add(system_id, [(status['date'], status['time']) for status in statuses if id(status) not in failed_statuses])
+			now = time.time()
+			with self.__lock:
+				self.__markDone([row_id for (row_id, status) in batch if id(status) not in failed_statuses], now)
+				self.__markFailed([row_id for (row_id, status) in batch if id(status) in failed_statuses], 'not added', now)
+				self.__db.commit()
+			result['sent'] += len(batch) - len(failed)
+			result['failed'] += len(failed)
+		self.purge()
+		if self.slot_index is not None:
+			self.slot_index.purge()
+		return result
+
+	def purge(self, keep_days=default_keep_days, given_up_keep_days=default_given_up_keep_days):
+		"""
+		Remove the statuses uploaded more than keep_days ago, and the ones given up on more than
+		given_up_keep_days ago (they would otherwise stay for ever)
+		"""
+		now = time.time()
+		with self.__lock:
+			self.__db.execute('delete from statuses where done is not null and done < ?', (now - keep_days * 86400,))
+			# next_attempt is set by the last attempt, never more than max_delay after it
+			self.__db.execute('delete from statuses where done is null and attempts >= ? and next_attempt < ?',
+					(self.max_attempts, now - given_up_keep_days * 86400))
+			self.__db.commit()
+
+	def stats(self, system_id=None):
+		sql = """select count(case when done is not null then 1 end),
+				count(case when done is null and attempts < ? then 1 end),
+				count(case when done is null and attempts >= ? then 1 end) from statuses"""
+		params = (self.max_attempts, self.max_attempts)
+		if system_id is not None:
+			sql += ' where system_id = ?'
+			params += (str(system_id),)
+		with self.__lock:
+			(done, pending, given_up) = self.__db.execute(sql, params).fetchone()
+		return {'done':done, 'pending':pending, 'given_up':given_up}
+
+	def close(self):
+		with self.__lock:
+			self.__db.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
@@ -11,89 +11,464 @@ if six.PY2:
 	import httplib
 elif six.PY3:
 	import http.client as httplib
+import socket
+import datetime
+import threading
+import time
+from collections import namedtuple
 
 pvo_host = "pvoutput.org"
+pvo_https = True               # False for plain HTTP (e.g. a local test server)
+pvo_timeout = 30               # seconds to wait to connect, or for a response
+pvo_maxIdleConnections = 4     # idle keep-alive connections kept per host
+pvo_requestsPerHour = 60       # API requests per hour per key until the headers say otherwise - 60 (300 for donors)
 pvo_statusInterval = 5         # Your PVoutput status interval - normally 5, 10 (default) or 15
+pvo_statusDays = 14            # Days back PVoutput takes statuses for - 14 (90 for donors)
+pvo_batchStatusLimit = 30      # Statuses per addbatchstatus.jsp request - 30 (100 for donors)
+pvo_statusHistoryLimit = 288   # Statuses per getstatus.jsp history request - at most 288
+pvo_batchOutputLimit = 30      # Days per addbatchoutput.jsp request - 30 (100 for donors)
+
+# add_status() keyword arguments and the addstatus.jsp/addbatchstatus.jsp value they are sent as
+status_fields = (('energy_exp', 'v1'), ('power_exp', 'v2'), ('energy_imp', 'v3'), ('power_imp', 'v4'), ('temp', 'v5'), ('vdc', 'v6'))
+
+# add_output() keyword arguments in the order addbatchoutput.jsp wants them, after the date
+output_fields = ('generated', 'exported', 'peak_power', 'peak_time', 'condition', 'min_temp', 'max_temp', 'comments',
+		'import_peak', 'import_offpeak', 'import_shoulder')
+output_conditions = ('Fine', 'Partly Cloudy', 'Mostly Cloudy', 'Cloudy', 'Showers', 'Snow', 'Hazy', 'Fog', 'Dusty', 'Frost', 'Storm')
+
+def output_row(output):
+	"""
+	The addbatchoutput.jsp row for output (a dict of the add_output() arguments), raises ValueError
+	if it wouldn't be accepted
+	"""
+	date = str(output.get('date', ''))
+	try:
+		datetime.datetime.strptime(date, '%Y%m%d')
+	except ValueError:
+		raise ValueError('date must be YYYYMMDD, not %r' % (date))
+	if output.get('generated') is None or float(output['generated']) < 0:
+		raise ValueError('generated must be 0 or more, not %r' % (output.get('generated')))
+	for field in ('exported', 'peak_power', 'import_peak', 'import_offpeak', 'import_shoulder'):
+		if output.get(field) is not None and float(output[field]) < 0:
+			raise ValueError('%s must be 0 or more, not %r' % (field, output[field]))
+	if output.get('peak_time') is not None:
+		try:
+			datetime.datetime.strptime(str(output['peak_time']), '%H:%M')
+		except ValueError:
+			raise ValueError('peak_time must be HH:MM, not %r' % (output['peak_time']))
+	if output.get('condition') is not None and output['condition'] not in output_conditions:
+		raise ValueError('condition must be one of %s, not %r' % (', '.join(output_conditions), output['condition']))
+	if output.get('comments') is not None and (',' in output['comments'] or ';' in output['comments']):
+		raise ValueError('comments can\'t have a , or ; in a batch')
+	row = [date]
+	for field in output_fields:
+		value = output.get(field)
+		row.append('' if value is None else str(value))
+	# trailing empty values can be left off
+	while row[-1] == '':
+		row.pop()
+	return ','.join(row)
+
+def output_params(date, generated, exported=None, peak_power=None, peak_time=None, condition=None, min_temp=None,
+		max_temp=None, comments=None, import_peak=None, import_offpeak=None, import_shoulder=None):
+	"""
+	The addoutput.jsp parameters for the add_output() arguments
+	"""
+	params = {
+			'd': date,
+			'g': generated
+			}
+	if exported:
+		params['e'] = exported
+	if peak_power:
+		params['pp'] = peak_power
+	if peak_time:
+		params['pt'] = peak_time
+	if condition:
+		params['cd'] = condition
+	if min_temp is not None:
+		params['tm'] = min_temp
+	if max_temp is not None:
+		params['tx'] = max_temp
+	if comments:
+		params['cm'] = comments
+	if import_peak:
+		params['ip'] = import_peak
+	if import_offpeak:
+		params['op'] = import_offpeak
+	if import_shoulder:
+		params['is'] = import_shoulder
+	return params
+
+def status_params(date, time, energy_exp=None, power_exp=None, energy_imp=None, power_imp=None, temp=None, vdc=None, cumulative=False):
+	"""
+	The addstatus.jsp parameters for the add_status() arguments
+	"""
+	params = {
+			'd': date,
+			't': time
+			}
+	for (field, value) in zip(('v1', 'v2', 'v3', 'v4', 'v5', 'v6'), (energy_exp, power_exp, energy_imp, power_imp, temp, vdc)):
+		if value is not None:
+			params[field] = value
+	if cumulative:
+		params['c1'] = 1
+	return params
+
+def status_batch_data(statuses):
+	"""
+	The addbatchstatus.jsp data value for statuses - date,time,v1,...,v6 rows separated by ;
+	"""
+	rows = []
+	for status in statuses:
+		row = [str(status['date']), str(status['time'])]
+		for (field, param) in status_fields:
+			value = status.get(field)
+			row.append('' if value is None else str(value))
+		# trailing empty values can be left off
+		while row[-1] == '':
+			row.pop()
+		rows.append(','.join(row))
+	return ';'.join(rows)
+
+def statuses_not_added(statuses, body):
+	"""
+	The statuses an addbatchstatus.jsp response (date,time,status for each row - 1 = added) says
+	weren't added
+	"""
+	results = {}
+	for result in body.decode('utf-8').strip().split(';'):
+		fields = result.split(',')
+		if len(fields) >= 3:
+			results[(fields[0], fields[1])] = fields[2]
+	return [status for status in statuses if results.get((str(status['date']), str(status['time']))) != '1']
+
+def batch_output_results(body):
+	"""
+	{date: status} from an addbatchoutput.jsp response (date,status for each day - 1 = added)
+	"""
+	results = {}
+	for result in body.decode('utf-8').strip().split(';'):
+		fields = result.split(',')
+		if len(fields) >= 2:
+			results[fields[0]] = fields[1]
+	return results
+
+
+# A getstatus.jsp history row - None for the values pvoutput.org doesn't have (NaN)
+StatusRow = namedtuple('StatusRow', ('date', 'time', 'energy_exp', 'efficiency', 'power_exp', 'average_power',
+		'normalised_output', 'energy_imp', 'power_imp', 'temp', 'vdc'))
+status_row_types = (str, str, int, float, int, int, float, int, int, float, float)
+
+def status_row(row):
+	"""
+	Parses one date,time,energy,efficiency,power,... history row into a StatusRow
+	"""
+	values = row.split(',')
+	if len(values) < len(status_row_types):
+		values.extend([''] * (len(status_row_types) - len(values)))
+	return StatusRow._make(None if value in ('', 'NaN') else (int(float(value)) if value_type is int else value_type(value))
+			for (value_type, value) in zip(status_row_types, values))
+
+def parse_status_history(body):
+	"""
+	Generates a StatusRow for each row of a getstatus.jsp history response, parsing them as they are
+	asked for rather than splitting the whole body up front
+	"""
+	if isinstance(body, bytes):
+		body = body.decode('utf-8')
+	start = 0
+	length = len(body)
+	while start < length:
+		end = body.find(';', start)
+		if end == -1:
+			end = length
+		row = body[start:end].strip()
+		start = end + 1
+		if row:
+			yield status_row(row)
+
+
+class PVoutputError(Exception):
+	pass
+
+
+class PVoutputResponse():
+	"""
+	A response read in full, so its connection can go back in the pool straight away
+	"""
+	def __init__(self, response):
+		self.status = response.status
+		self.reason = response.reason
+		self.headers = dict((name.lower(), value) for (name, value) in response.getheaders())
+		self.body = response.read()
+
+	def read(self):
+		return self.body
+
+	def getheader(self, name, default=None):
+		return self.headers.get(name.lower(), default)
+
+
+class ConnectionPool():
+	"""
+	Idle keep-alive connections to one host, shared by every PVoutput_Connection in the process
+	"""
+	def __init__(self, host, https=True, timeout=pvo_timeout, max_idle=pvo_maxIdleConnections):
+		self.host = host
+		self.https = https
+		self.timeout = timeout
+		self.max_idle = max_idle
+		self.connects = 0
+		self.requests = 0
+		self.__idle = []
+		self.__lock = threading.Lock()
+
+	def get(self):
+		"""
+		Returns (connection, reused) - an idle connection if there is one, otherwise a new one
+		"""
+		with self.__lock:
+			self.requests += 1
+			if self.__idle:
+				return (self.__idle.pop(), True)
+			self.connects += 1
+		if self.https:
+			return (httplib.HTTPSConnection(self.host, timeout=self.timeout), False)
+		return (httplib.HTTPConnection(self.host, timeout=self.timeout), False)
+
+	def put(self, conn):
+		with self.__lock:
+			if len(self.__idle) < self.max_idle:
+				self.__idle.append(conn)
+				return
+		conn.close()
+
+	def close(self):
+		with self.__lock:
+			idle = self.__idle
+			self.__idle = []
+		for conn in idle:
+			conn.close()
+
+	def stats(self):
+		return {'host':self.host, 'requests':self.requests, 'connects':self.connects}
+
+
+_connection_pools = {}
+_connection_pools_lock = threading.Lock()
+
+def connection_pool(host, https=True, timeout=pvo_timeout):
+	with _connection_pools_lock:
+		key = (host, https, timeout)
+		if key not in _connection_pools:
+			_connection_pools[key] = ConnectionPool(host, https, timeout)
+		return _connection_pools[key]
+
+def close_connections():
+	"""
+	Closes the idle connections of every pool, e.g. at the end of a run
+	"""
+	with _connection_pools_lock:
+		pools = list(_connection_pools.values())
+	for pool in pools:
+		pool.close()
+
+
+class RateLimit():
+	"""
+	Token bucket for one API key, filled from pvoutput.org's rate limit headers - tokens are the
+	requests left this hour and the bucket refills at the reset time.  Requests go out straight
+	away while there are tokens, and wait for the reset once there aren't.
+	"""
+	def __init__(self, limit=pvo_requestsPerHour):
+		self.limit = limit
+		self.remaining = limit
+		self.reset = None
+		self.waits = 0
+		self.__lock = threading.Lock()
+
+	def __refill(self, now):
+		if self.reset is not None and now >= self.reset:
+			self.remaining = self.limit
+			self.reset = None
+
+	def try_acquire(self):
+		"""
+		Seconds until a request can go (0 if it can now), takes a token if it can
+		"""
+		with self.__lock:
+			now = time.time()
+			self.__refill(now)
+			if self.remaining > 0:
+				self.remaining -= 1
+				return 0
+			if self.reset is None:
+				# out of tokens without a reset time from pvoutput.org, assume a full hour
+				self.reset = now + 3600
+			return self.reset - now
+
+	def acquire(self):
+		while True:
+			wait = self.try_acquire()
+			if wait <= 0:
+				return
+			self.waits += 1
+			time.sleep(wait)
+
+	def update(self, response):
+		"""
+		Take the remaining requests, limit and reset time from the X-Rate-Limit-* headers of a response
+		"""
+		try:
+			remaining = int(response.getheader('X-Rate-Limit-Remaining'))
+			limit = int(response.getheader('X-Rate-Limit-Limit'))
+			reset = float(response.getheader('X-Rate-Limit-Reset'))
+		except (TypeError, ValueError):
+			return
+		with self.__lock:
+			self.limit = limit
+			if reset != self.reset:
+				# a new hour
+				self.remaining = remaining
+			else:
+				# requests still in flight on other threads have already taken their tokens
+				self.remaining = min(self.remaining, remaining)
+			self.reset = reset
+
+	def exhausted(self, response):
+		"""
+		pvoutput.org said the limit has been exceeded - no more requests until the reset
+		"""
+		with self.__lock:
+			self.remaining = 0
+			try:
+				self.reset = float(response.getheader('X-Rate-Limit-Reset'))
+			except (TypeError, ValueError):
+				self.reset = None
+
+	def stats(self):
+		return {'limit':self.limit, 'remaining':self.remaining, 'reset':self.reset, 'waits':self.waits}
+
+
+_rate_limits = {}
+_rate_limits_lock = threading.Lock()
+
+def rate_limit(api_key):
+	"""
+	The RateLimit for api_key, shared by every PVoutput_Connection (and so every system) using it
+	"""
+	with _rate_limits_lock:
+		if api_key not in _rate_limits:
+			_rate_limits[api_key] = RateLimit()
+		return _rate_limits[api_key]
+
+def rate_limit_exceeded(response):
+	return response.status == 403 and b'Exceeded' in response.read()
 
 
 class PVoutput_Connection():
-	def __init__(self, api_key, system_id):
+	def __init__(self, api_key, system_id, timeout=pvo_timeout):
 		self.host = pvo_host
 		self.api_key = api_key
 		self.system_id = system_id
+		self.timeout = timeout
+		self.pool = connection_pool(self.host, pvo_https, timeout)
+		self.rate_limit = rate_limit(api_key)
 
 	def add_output(self, date, generated, exported=None, peak_power=None, peak_time=None, condition=None,
-			min_temp=None, max_temp=None, comments=None, import_peak=None, import_offpeak=None, import_shoulder=None):
+			min_temp=None, max_temp=None, comments=None, import_peak=None, import_offpeak=None, import_shoulder=None, system_id=None):
 		"""
 		Uploads end of day output information
 		"""
 		path = '/service/r1/addoutput.jsp'
-		params = {
-				'd': date,
-				'g': generated
-				}
-		if exported:
-			params['e'] = exported
-		if peak_power:
-			params['pp'] = peak_power
-		if peak_time:
-			params['pt'] = peak_time
-		if condition:
-			params['cd'] = condition
-		if min_temp:
-			params['tm'] = min_temp
-		if max_temp:
-			params['tx'] = max_temp
-		if comments:
-			params['cm'] = comments
-		if import_peak:
-			params['ip'] = import_peak
-		if import_offpeak:
-			params['op'] = import_offpeak
-		if import_shoulder:
-			params['is'] = import_shoulder
+		params = output_params(date, generated, exported, peak_power, peak_time, condition, min_temp, max_temp, comments,
+				import_peak, import_offpeak, import_shoulder)
 		params = urllib.urlencode(params)
 
-		response = self.make_request('POST', path, params)
+		response = self.make_request('POST', path, params, system_id)
 
 		if response.status == 400:
 			raise ValueError(response.read())
 		if response.status != 200:
-			raise StandardError(response.read())
+			raise PVoutputError(response.read())
 
-	def add_status(self, date, time, energy_exp=None, power_exp=None, energy_imp=None, power_imp=None, temp=None, vdc=None, cumulative=False):
+	def add_status(self, date, time, energy_exp=None, power_exp=None, energy_imp=None, power_imp=None, temp=None, vdc=None, cumulative=False, system_id=None):
 		"""
 		Uploads live output data
 		"""
 		path = '/service/r2/addstatus.jsp'
-		params = {
-				'd': date,
-				't': time
-				}
-		if energy_exp:
-			params['v1'] = energy_exp
-		if power_exp:
-			params['v2'] = power_exp
-		if energy_imp:
-			params['v3'] = energy_imp
-		if power_imp:
-			params['v4'] = power_imp
-		if temp:
-			params['v5'] = temp
-		if vdc:
-			params['v6'] = vdc
-		if cumulative:
-			params['c1'] = 1
+		params = status_params(date, time, energy_exp, power_exp, energy_imp, power_imp, temp, vdc, cumulative)
 		params = urllib.urlencode(params)
 
-		response = self.make_request('POST', path, params)
+		response = self.make_request('POST', path, params, system_id)
 
 		if response.status == 400:
 			raise ValueError(response.read())
 		if response.status != 200:
-			raise StandardError(response.read())
+			raise PVoutputError(response.read())
 
-	def get_status(self, date=None, time=None):
+	def add_batch_status(self, statuses, cumulative=False, batch_size=pvo_batchStatusLimit, system_id=None):
+		"""
+		Uploads many statuses, batch_size per request.  Each status is a dict of the add_status()
+		arguments, i.e. date, time and optionally energy_exp, power_exp, energy_imp, power_imp, temp, vdc.
+		Returns the statuses that weren't added (in order), so they can be queued again.
+		"""
+		path = '/service/r2/addbatchstatus.jsp'
+		failed = []
+		for start in range(0, len(statuses), batch_size):
+			batch = statuses[start:start + batch_size]
+			params = {'data': status_batch_data(batch)}
+			if cumulative:
+				params['c1'] = 1
+			params = urllib.urlencode(params)
+
+			response = self.make_request('POST', path, params, system_id)
+
+			if response.status == 400:
+				raise ValueError(response.read())
+			if response.status != 200:
+				raise PVoutputError(response.read())
+
+			failed.extend(statuses_not_added(batch, response.read()))
+		return failed
+
+	def add_batch_output(self, outputs, batch_size=pvo_batchOutputLimit, system_id=None):
+		"""
+		Uploads many days of end of day output, batch_size days per request.  Each output is a dict of
+		the add_output() arguments.  Rows are checked before they are sent, the ones that fail aren't.
+		Returns {date: outcome} - 'added', 'not added' (with why, if pvoutput.org said), or why the row
+		is invalid.
+		"""
+		path = '/service/r1/addbatchoutput.jsp'
+		outcomes = {}
+		rows = []
+		for output in outputs:
+			try:
+				rows.append((str(output['date']), output_row(output)))
+			except (KeyError, TypeError, ValueError) as e:
+				outcomes[str(output.get('date'))] = 'invalid - %s' % (e)
+
+		for start in range(0, len(rows), batch_size):
+			batch = rows[start:start + batch_size]
+			params = urllib.urlencode({'data': ';'.join(row for (date, row) in batch)})
+
+			response = self.make_request('POST', path, params, system_id)
+
+			if response.status == 400:
+				# a rejected batch only costs its own days
+				for (date, row) in batch:
+					outcomes[date] = 'not added - %s' % (response.read().decode('utf-8', 'replace').strip())
+				continue
+			if response.status != 200:
+				raise PVoutputError(response.read())
+
+			results = batch_output_results(response.read())
+			for (date, row) in batch:
+				outcomes[date] = 'added' if results.get(date) == '1' else 'not added'
+		return outcomes
+
+	def get_status(self, date=None, time=None, system_id=None):
 		"""
 		Retrieves status information
 		"""
@@ -105,16 +480,51 @@ class PVoutput_Connection():
 			params['t'] = time
 		params = urllib.urlencode(params)
 
-		response = self.make_request("GET", path, params)
+		response = self.make_request("GET", path, params, system_id)
 
 		if response.status == 400:
 			raise ValueError(response.read())
 		if response.status != 200:
-			raise StandardError(response.read())
+			raise PVoutputError(response.read())
 
 		return response.read()
 
-	def delete_status(self, date, time):
+	def get_status_history(self, date_from, date_to=None, time_from=None, time_to=None, limit=pvo_statusHistoryLimit, system_id=None):
+		"""
+		Retrieves the statuses from date_from to date_to (YYYYMMDD, default just date_from) with
+		getstatus.jsp history requests (up to limit statuses per request, one request per day) and
+		generates them as StatusRows, oldest day first, fetching each day as it is reached
+		"""
+		path = '/service/r1/getstatus.jsp'
+		day = datetime.datetime.strptime(str(date_from), '%Y%m%d').date()
+		last_day = datetime.datetime.strptime(str(date_to or date_from), '%Y%m%d').date()
+		while day <= last_day:
+			params = {
+					'd': day.strftime('%Y%m%d'),
+					'h': 1,
+					'asc': 1,
+					'limit': limit
+					}
+			if time_from:
+				params['from'] = time_from
+			if time_to:
+				params['to'] = time_to
+			params = urllib.urlencode(params)
+
+			response = self.make_request("GET", path, params, system_id)
+
+			if response.status == 400 and b'No status found' in response.read():
+				pass
+			elif response.status == 400:
+				raise ValueError(response.read())
+			elif response.status != 200:
+				raise PVoutputError(response.read())
+			else:
+				for row in parse_status_history(response.read()):
+					yield row
+			day += datetime.timedelta(days=1)
+
+	def delete_status(self, date, time, system_id=None):
 		"""
 		Removes an existing status
 		"""
@@ -125,29 +535,72 @@ class PVoutput_Connection():
 				}
 		params = urllib.urlencode(params)
 
-		response = self.make_request("POST", path, params)
+		response = self.make_request("POST", path, params, system_id)
 
 		if response.status == 400:
 			raise ValueError(response.read())
 		if response.status != 200:
-			raise StandardError(response.read())
+			raise PVoutputError(response.read())
 
 		return response.read()
 
-	def make_request(self, method, path, params=None):
-		conn = httplib.HTTPConnection(self.host)
+	def make_request(self, method, path, params=None, system_id=None):
+		"""
+		Sends a request, paced by the API key's rate limit, and if pvoutput.org still says the
+		limit was exceeded, waits for the reset and sends it once more
+		"""
+		for attempt in range(2):
+			self.rate_limit.acquire()
+			response = self.send_request(method, path, params, system_id)
+			if not rate_limit_exceeded(response):
+				self.rate_limit.update(response)
+				return response
+			print('%s: rate limit exceeded, waiting for the reset' % (self.__class__.__name__))
+			self.rate_limit.exhausted(response)
+		return response
+
+	def send_request(self, method, path, params=None, system_id=None):
+		"""
+		Sends a request on a pooled keep-alive connection (system_id defaults to the connection's).
+		A connection the server has closed while it sat idle is replaced and the request sent again.
+		"""
 		headers = {
 				'Content-type': 'application/x-www-form-urlencoded',
 				'Accept': 'text/plain',
 				'X-Pvoutput-Apikey': self.api_key,
-				'X-Pvoutput-SystemId': self.system_id
+				'X-Pvoutput-SystemId': system_id or self.system_id,
+				'X-Rate-Limit': '1'
 				}
-		conn.request(method, path, params, headers)
+		if method == 'GET' and params:
+			path = '%s?%s' % (path, params)
+			params = None
 
-		try:
-			response = conn.getresponse()
-		except httplib.BadStatusLine as e:
-			print('%s: request failed - %s' % (self.__class__.__name__, e))
-			response = False
+		while True:
+			(conn, reused) = self.pool.get()
+			try:
+				conn.request(method, path, params, headers)
+				response = PVoutputResponse(conn.getresponse())
+			except socket.timeout:
+				# the connection is in an unknown state, so it isn't reused
+				conn.close()
+				raise
+			except (httplib.BadStatusLine, httplib.CannotSendRequest, socket.error) as e:
+				conn.close()
+				if reused:
+					continue
+				raise PVoutputError('%s: request failed - %s' % (self.__class__.__name__, e))
+			except:
+				conn.close()
+				raise
 
-		return response
+			if response.getheader('Connection', '').lower() == 'close':
+				conn.close()
+			else:
+				self.pool.put(conn)
+			return response
+
+	def connection_stats(self):
+		return self.pool.stats()
+
+	def rate_limit_stats(self):
+		return self.rate_limit.stats()
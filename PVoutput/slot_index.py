@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Local index of the status slots already uploaded to each PVoutput system, so a status that is
+# already there isn't sent again.  Each system's day is a bitmap of its status interval slots
+# (288 five minute slots fit in 36 bytes), kept in a SQLite file and in memory once looked at.
+
+import os
+import datetime
+import threading
+from PVoutput.pvoutput import pvo_statusInterval
+
+default_slot_index_file = os.path.join(os.path.expanduser('~'), '.pvoutput_slots.sqlite')
+default_keep_days = 90         # days of slots kept
+
+
+class SlotIndex():
+	def __init__(self, index_file=default_slot_index_file, interval=pvo_statusInterval):
+		self.index_file = os.path.abspath(os.path.expanduser(index_file))
+		self.interval = interval
+		self.slots_per_day = 1440 // interval
+		# (system_id, date) -> bytearray bitmap
+		self.__days = {}
+		self.__lock = threading.Lock()
+		# only imported once an index is opened - the scripts import this module for its default file name
+		import sqlite3
+		self.__db = sqlite3.connect(self.index_file, timeout=30, check_same_thread=False)
+		with self.__lock:
+			self.__db.execute('PRAGMA journal_mode=WAL')
+			self.__db.execute("""
+				create table if not exists slots (
+					system_id text not null,
+					date text not null,
+					bitmap blob not null,
+					primary key (system_id, date)
+				)
+			""")
+			self.__db.commit()
+
+	def slot(self, time_):
+		"""
+		The slot number for a HH:MM time
+		"""
+		return (int(time_[0:2]) * 60 + int(time_[3:5])) // self.interval
+
+	def __day(self, system_id, date):
+		key = (str(system_id), str(date))
+		bitmap = self.__days.get(key)
+		if bitmap is None:
+			row = self.__db.execute('select bitmap from slots where system_id = ? and date = ?', key).fetchone()
+			if row is not None:
+				bitmap = bytearray(row[0])
+			else:
+				bitmap = bytearray((self.slots_per_day + 7) // 8)
+			self.__days[key] = bitmap
+		return bitmap
+
+	def contains(self, system_id, date, time_):
+		"""
+		True if the status for date (YYYYMMDD) and time (HH:MM) has been uploaded to system_id
+		"""
+		slot = self.slot(time_)
+		with self.__lock:
+			return bool(self.__day(system_id, date)[slot >> 3] & (1 << (slot & 7)))
+
+	def missing(self, system_id, statuses):
+		"""
+		The statuses (dicts with a date and time) that aren't in the index yet
+		"""
+		return [status for status in statuses if not self.contains(system_id, status['date'], status['time'])]
+
+	def add(self, system_id, date_times):
+		"""
+		Record (date, time) pairs as uploaded to system_id, returns the number of days that changed
+		"""
+		changed = {}
+		with self.__lock:
+			# another process may have added slots since a day was loaded, so read the days being changed again
+			self.__db.execute('begin immediate')
+			try:
+				reloaded = set()
+				for (date, time_) in date_times:
+					key = (str(system_id), str(date))
+					if key not in reloaded:
+						self.__days.pop(key, None)
+						reloaded.add(key)
+					bitmap = self.__day(system_id, date)
+					slot = self.slot(time_)
+					if not bitmap[slot >> 3] & (1 << (slot & 7)):
+						bitmap[slot >> 3] |= 1 << (slot & 7)
+						changed[key] = bitmap
+				self.__db.executemany('insert or replace into slots (system_id, date, bitmap) values (?, ?, ?)',
+						[(key[0], key[1], bytes(bitmap)) for (key, bitmap) in changed.items()])
+				self.__db.commit()
+			except:
+				self.__db.rollback()
+				raise
+		return len(changed)
+
+	def reconcile(self, system_id, date_times):
+		"""
+		Bring the index up to date with the statuses pvoutput.org has for system_id, e.g. from its
+		status history - returns the number of days that changed
+		"""
+		return self.add(system_id, date_times)
+
+	def reconcile_history(self, pvout, date_from, date_to=None, system_id=None):
+		"""
+		Reconcile system_id (default pvout's system) from date_from to date_to (YYYYMMDD) with
+		pvoutput.org's status history - returns the number of days that changed
+		"""
+		if system_id is None:
+			system_id = pvout.system_id
+		date_times = [(row.date, row.time) for row in pvout.get_status_history(date_from, date_to, system_id=system_id)]
+		return self.reconcile(system_id, date_times)
+
+	def count(self, system_id, date):
+		"""
+		The number of slots uploaded for system_id on date
+		"""
+		with self.__lock:
+			bitmap = self.__day(system_id, date)
+			return sum(bin(byte).count('1') for byte in bitmap)
+
+	def purge(self, keep_days=default_keep_days):
+		"""
+		Remove the days older than keep_days
+		"""
+		oldest = (datetime.date.today() - datetime.timedelta(days=keep_days)).strftime('%Y%m%d')
+		with self.__lock:
+			self.__db.execute('delete from slots where date < ?', (oldest,))
+			self.__db.commit()
+			for key in [key for key in self.__days if key[1] < oldest]:
+				del self.__days[key]
+
+	def close(self):
+		with self.__lock:
+			self.__db.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Loads history for a site: fetches a range of days from the SolarmanPV API in parallel (rate
+# limited), hands each day's samples on in date order and checkpoints the last day done, so an
+# interrupted run carries on from where it stopped.
+
+import os
+import datetime
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from util import DEBUG, RateLimiter, write_json_atomically, read_json_file
+
+default_checkpoint_file = os.path.join(os.path.expanduser('~'), '.solarmanpv_backfill.json')
+# days fetched at the same time
+default_max_workers = 4
+# SolarmanPV API requests per minute
+default_requests_per_minute = 30
+
+# The days from start_date to end_date (inclusive) as YYYY-MM-DD strings
+def dateRange(start_date, end_date):
+	day = datetime.datetime.strptime(start_date, '%Y-%m-%d').date()
+	last_day = datetime.datetime.strptime(end_date, '%Y-%m-%d').date()
+	while day <= last_day:
+		yield day.strftime('%Y-%m-%d')
+		day += datetime.timedelta(days=1)
+
+class Backfill:
+	def __init__(self, client, site, checkpoint_file=default_checkpoint_file, max_workers=default_max_workers,
+			requests_per_minute=default_requests_per_minute):
+		self.client = client
+		self.site = site
+		self.checkpoint_file = checkpoint_file
+		self.max_workers = max_workers
+		self.rate_limiter = RateLimiter(requests_per_minute / 60.0, capacity=max_workers)
+		self.__lock = threading.Lock()
+
+	def __checkpointKey(self):
+		return '%s:%s' % (self.site.cursorKey(), self.site.pvo_system_id)
+
+	# The last day completed by a previous run, or None
+	def lastDayDone(self):
+		return read_json_file(self.checkpoint_file).get(self.__checkpointKey())
+
+	def __checkpoint(self, day):
+		with self.__lock:
+			checkpoints = read_json_file(self.checkpoint_file)
+			checkpoints[self.__checkpointKey()] = day
+			write_json_atomically(self.checkpoint_file, checkpoints)
+
+	# All the samples for one day, oldest first
+	def __fetchDay(self, day):
+		self.rate_limiter.acquire()
+		DEBUG('%s: fetching %s' % (self.site.name, day))
+		if self.site.data_method == 'inverter':
+			samples = []
+			for sample in self.client.iterInverterData(self.site.device_id, day, day):
+				samples.append(sample)
+			samples.sort(key=lambda sample: sample.timestamp)
+			return samples
+		return self.client.getPower(day, since=0) or []
+
+	# Fetch start_date to end_date and call publish(day, samples) for each day, in date order, days
+	# already done by an earlier run are skipped.  publish() returns the days (its own or earlier ones)
+	# whose upload has been acknowledged - None for just its own day - and flush() (if given) is called
+	# at the end for the days still held back, e.g. in a part filled batch.  The checkpoint only moves
+	# up to the last day with every day before it acknowledged, so a failed batch is redone next run.
+	# Returns the number of days acknowledged.
+	def run(self, start_date, end_date, publish, flush=None):
+		last_day_done = self.lastDayDone()
+		days = [day for day in dateRange(start_date, end_date) if last_day_done is None or day > last_day_done]
+		if last_day_done is not None:
+			DEBUG('%s: resuming after %s' % (self.site.name, last_day_done))
+
+		days_done = 0
+		# days published but not acknowledged yet, oldest first, and the ones acknowledged out of order
+		unconfirmed = deque()
+		confirmed = set()
+		def acknowledge(days):
+			confirmed.update(days)
+			last_day = None
+			while unconfirmed and unconfirmed[0] in confirmed:
+				last_day = unconfirmed.popleft()
+				confirmed.discard(last_day)
+			if last_day is not None:
+				self.__checkpoint(last_day)
+
+		# only keep a window of days in flight, so memory stays bounded for long ranges
+		pending = deque()
+		executor = ThreadPoolExecutor(max_workers=self.max_workers)
+		try:
+			remaining = iter(days)
+			for day in remaining:
+				pending.append((day, executor.submit(self.__fetchDay, day)))
+				if len(pending) >= self.max_workers * 2:
+					break
+			while pending:
+				(day, future) = pending.popleft()
+				samples = future.result()
+				for next_day in remaining:
+					pending.append((next_day, executor.submit(self.__fetchDay, next_day)))
+					break
+				DEBUG('%s: %s has %d sample(s)' % (self.site.name, day, len(samples)))
+				unconfirmed.append(day)
+				acknowledged = publish(day, samples)
+				before = len(unconfirmed)
+				acknowledge([day] if acknowledged is None else acknowledged)
+				days_done += before - len(unconfirmed)
+			if flush is not None and unconfirmed:
+				before = len(unconfirmed)
+				acknowledge(flush() or [])
+				days_done += before - len(unconfirmed)
+			if unconfirmed:
+				raise IOError('%d day(s) from %s were not acknowledged' % (len(unconfirmed), unconfirmed[0]))
+		finally:
+			for (day, future) in pending:
+				future.cancel()
+			executor.shutdown(wait=True)
+		return days_done
+
+	def reset(self):
+		with self.__lock:
+			checkpoints = read_json_file(self.checkpoint_file)
+			if self.__checkpointKey() in checkpoints:
+				del checkpoints[self.__checkpointKey()]
+				write_json_atomically(self.checkpoint_file, checkpoints)
+
+# END OF FILE
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Runs a poll cycle over and over from one long running process instead of cron, so the SolarmanPV
+# clients and access tokens, PVoutput connections and Weewx connection stay open between cycles.
+# Cycles start on the PVoutput status interval boundaries (local time, like the status slots) plus a
+# random delay, so that many daemons don't all hit the APIs at the same second.  A daily job (e.g. the
+# end of day outputs) runs once per local day, apart from the cycles.  SIGTERM/SIGINT stop it once the
+# cycle in progress is done, SIGHUP reloads the config before the next cycle.
+
+import time
+import datetime
+import random
+import signal
+import threading
+from PVoutput.pvoutput import pvo_statusInterval
+
+# most seconds a cycle is started after its interval boundary
+default_jitter = 30
+
+# Seconds local time is ahead of UTC at the unix timestamp now
+def utcOffset(now):
+	if time.localtime(now).tm_isdst > 0:
+		return -time.altzone
+	return -time.timezone
+
+# The first interval (seconds) boundary in local time after now, as a unix timestamp
+def nextBoundary(now, interval):
+	offset = utcOffset(now)
+	return (int((now + offset) // interval) + 1) * interval - offset
+
+class Scheduler:
+	def __init__(self, interval=pvo_statusInterval * 60, jitter=default_jitter):
+		self.interval = interval
+		self.jitter = min(jitter, interval)
+		self.__stopped = threading.Event()
+
+	# Sleep until the next cycle is due, returns False (straight away) if stop() is called first
+	def wait(self):
+		now = time.time()
+		due = nextBoundary(now, self.interval) + random.uniform(0, self.jitter)
+		self.__stopped.wait(max(0, due - now))
+		return not self.__stopped.is_set()
+
+	def stop(self):
+		self.__stopped.set()
+
+	def stopped(self):
+		return self.__stopped.is_set()
+
+class Daemon:
+	# cycle() is run at each interval, reload() (if given) before the next cycle after a SIGHUP, and
+	# daily() (if given) once a local day, after the day's first cycle.  An exception from any of them is
+	# printed, and the daemon carries on with the next cycle - a failed daily() is tried again after it.
+	def __init__(self, cycle, reload=None, scheduler=None, daily=None):
+		self.cycle = cycle
+		self.reload = reload
+		self.scheduler = scheduler if scheduler is not None else Scheduler()
+		self.daily = daily
+		self.cycles = 0
+		self.__reload_requested = False
+		# the local day daily() last succeeded on
+		self.__daily_done = None
+
+	def __onStop(self, signum, frame):
+		print('%s: signal %d, stopping after the current cycle' % (self.__class__.__name__, signum))
+		self.scheduler.stop()
+
+	def __onReload(self, signum, frame):
+		print('%s: signal %d, reloading before the next cycle' % (self.__class__.__name__, signum))
+		self.__reload_requested = True
+
+	# Only from the main thread - python only runs signal handlers there
+	def installSignalHandlers(self):
+		signal.signal(signal.SIGTERM, self.__onStop)
+		signal.signal(signal.SIGINT, self.__onStop)
+		if hasattr(signal, 'SIGHUP'):
+			signal.signal(signal.SIGHUP, self.__onReload)
+
+	def run(self, first_now=True):
+		if first_now and not self.scheduler.stopped():
+			self.__runCycle()
+			self.__runDaily()
+		while self.scheduler.wait():
+			if self.__reload_requested and self.reload is not None:
+				self.__reload_requested = False
+				try:
+					self.reload()
+				except Exception as e:
+					print('%s: reload failed, carrying on as before - %s' % (self.__class__.__name__, e))
+			self.__runCycle()
+			self.__runDaily()
+
+	def __runCycle(self):
+		self.cycles += 1
+		try:
+			self.cycle()
+		except Exception as e:
+			print('%s: cycle %d failed - %s' % (self.__class__.__name__, self.cycles, e))
+
+	def __runDaily(self):
+		today = datetime.date.today()
+		if self.daily is None or self.__daily_done == today:
+			return
+		try:
+			self.daily()
+			self.__daily_done = today
+		except Exception as e:
+			print('%s: daily job failed, trying again after the next cycle - %s' % (self.__class__.__name__, e))
+
+# END OF FILE
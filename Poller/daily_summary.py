@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Works out a day's end of day output for PVoutput (the add_output() arguments) from its power
+# samples: the energy generated (trapezoidal rule), the peak power and its time, and the min/max
+# temperature - in one pass over a day, or with NumPy (if it is installed) for a batch of days.
+
+import time
+import datetime
+
+# NumPy is slow to import, so it is only imported once a batch big enough for it comes along - False
+# if it isn't installed
+numpy = None
+
+# samples further apart than this (seconds) aren't integrated across - the data is missing, not zero
+default_max_gap = 3600
+# smallest batch worth handing to NumPy
+numpy_min_samples = 5000
+
+# (start, end) unix timestamps of a local date (YYYY-MM-DD), e.g. for the day's Weewx temperatures
+def dayBounds(date):
+	day = datetime.datetime.strptime(date, '%Y-%m-%d')
+	start = time.mktime(day.timetuple())
+	end = time.mktime((day + datetime.timedelta(days=1)).timetuple())
+	return (int(start), int(end))
+
+# The day before today (local time) as YYYY-MM-DD - the last whole day, so the one whose end of day
+# output is sent
+def outputDay():
+	return (datetime.date.today() - datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+
+# The add_output() arguments for one day of samples (oldest first, PowerSample/InverterSample) and
+# optionally that day's temperatures, None if there aren't any samples
+def summariseDay(samples, temps=None, max_gap=default_max_gap):
+	generated = 0.0
+	peak = None
+	previous = None
+	for sample in samples:
+		if sample.power is None:
+			continue
+		if previous is not None:
+			elapsed = sample.timestamp - previous.timestamp
+			if 0 < elapsed <= max_gap:
+				# W x seconds / 2 (trapezoid) / 3600 = Wh
+				generated += (previous.power + sample.power) * elapsed / 7200.0
+		if peak is None or sample.power > peak.power:
+			peak = sample
+		previous = sample
+	if previous is None:
+		return None
+	return dayOutput(previous, generated, peak, temps)
+
+def dayOutput(last_sample, generated, peak, temps):
+	output = {'date':last_sample.pvoDate(), 'generated':int(round(generated))}
+	if peak is not None and peak.power > 0:
+		output['peak_power'] = peak.power
+		output['peak_time'] = peak.pvoTime()
+	if temps is not None:
+		min_temp = None
+		max_temp = None
+		for temp in temps:
+			if temp is None:
+				continue
+			if min_temp is None or temp < min_temp:
+				min_temp = temp
+			if max_temp is None or temp > max_temp:
+				max_temp = temp
+		if min_temp is not None:
+			output['min_temp'] = min_temp
+			output['max_temp'] = max_temp
+	return output
+
+def loadNumpy():
+	global numpy
+	if numpy is None:
+		try:
+			import numpy as numpy_module
+			numpy = numpy_module
+		except ImportError:
+			numpy = False
+	return numpy
+
+# summariseDay() for each of days (a list of sample lists), with temps a matching list (or None).
+# Big batches (e.g. many systems or a backfill) are worked out with NumPy when it is installed.
+def summariseDays(days, temps=None, max_gap=default_max_gap):
+	if temps is None:
+		temps = [None] * len(days)
+	days = [[sample for sample in samples if sample.power is not None] for samples in days]
+	if sum(len(samples) for samples in days) < numpy_min_samples or not loadNumpy():
+		return [summariseDay(samples, day_temps, max_gap) for (samples, day_temps) in zip(days, temps)]
+
+	non_empty = [index for (index, samples) in enumerate(days) if samples]
+	lengths = numpy.array([len(days[index]) for index in non_empty])
+	starts = numpy.concatenate(([0], numpy.cumsum(lengths)[:-1]))
+	timestamps = numpy.array([sample.timestamp for index in non_empty for sample in days[index]], dtype=numpy.float64)
+	power = numpy.array([sample.power for index in non_empty for sample in days[index]], dtype=numpy.float64)
+	day_of = numpy.repeat(numpy.arange(len(non_empty)), lengths)
+
+	elapsed = numpy.diff(timestamps)
+	# only integrate between samples of the same day that are close enough together
+	same_day = day_of[1:] == day_of[:-1]
+	valid = same_day & (elapsed > 0) & (elapsed <= max_gap)
+	areas = numpy.where(valid, (power[1:] + power[:-1]) * elapsed / 7200.0, 0.0)
+	generated = numpy.bincount(day_of[1:], weights=areas, minlength=len(non_empty))
+
+	outputs = [None] * len(days)
+	for (position, index) in enumerate(non_empty):
+		start = starts[position]
+		samples = days[index]
+		peak = samples[int(numpy.argmax(power[start:start + lengths[position]]))]
+		outputs[index] = dayOutput(samples[-1], generated[position], peak, temps[index])
+	return outputs
+
+# END OF FILE
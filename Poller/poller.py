@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Polls many SolarmanPV plants/devices concurrently from one process and uploads each one's new
+# samples to its PVoutput system as soon as they arrive.
+
+import json
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from util import DEBUG
+from SolarmanPVAPI.fetch_cursor import FetchCursor, default_cursor_file
+from PVoutput.pvoutput import PVoutput_Connection, PVoutputError, close_connections
+from PVoutput.fanout import FanOut
+from PVoutput.outbox import Outbox, default_outbox_file
+from PVoutput.slot_index import SlotIndex, default_slot_index_file
+from Poller.upload import queueStatuses, drainOutbox
+from Poller.daily_summary import summariseDays, outputDay
+
+# total number of plants/devices fetched at the same time
+default_max_workers = 8
+# number of requests in flight at the same time for one SolarmanPV account (client_id)
+default_max_per_account = 2
+
+class Site:
+	# One plant (power data) or device (inverter data) uploaded to one PVoutput system
+	def __init__(self, config):
+		for key in ('smpv_client_id', 'smpv_client_secret', 'smpv_plant_id', 'pvo_key', 'pvo_system_id'):
+			if not config.get(key):
+				raise ValueError('site is missing %s: %s' % (key, config.get('name', config)))
+		self.client_id = str(config['smpv_client_id'])
+		self.client_secret = str(config['smpv_client_secret'])
+		self.plant_id = str(config['smpv_plant_id'])
+		self.device_id = config.get('smpv_device_id')
+		if self.device_id is not None:
+			self.device_id = str(self.device_id)
+		# 'china' uses SolarmanPVAPI, 'global' uses SolarmanPVGlobalAPI
+		self.api = config.get('smpv_api', 'china')
+		if self.api not in ('china', 'global'):
+			raise ValueError('smpv_api must be china or global, not %s' % (self.api))
+		self.data_method = config.get('data_method', 'inverter' if self.device_id else 'power')
+		if self.data_method not in ('power', 'inverter'):
+			raise ValueError('data_method must be power or inverter, not %s' % (self.data_method))
+		if self.data_method == 'inverter' and self.device_id is None:
+			raise ValueError('smpv_device_id is needed for inverter data: %s' % (config.get('name', self.plant_id)))
+		self.pvo_key = str(config['pvo_key'])
+		self.pvo_system_id = str(config['pvo_system_id'])
+		# the PVoutput systems the site is uploaded to - its own, and any it is mirrored to
+		self.pvo_targets = [(self.pvo_key, self.pvo_system_id)]
+		for mirror in config.get('pvo_mirrors', []):
+			if not mirror.get('pvo_system_id'):
+				raise ValueError('pvo_mirrors entry is missing pvo_system_id: %s' % (config.get('name', self.pvo_system_id)))
+			self.pvo_targets.append((str(mirror.get('pvo_key', self.pvo_key)), str(mirror['pvo_system_id'])))
+		self.name = config.get('name', self.cursorKey())
+
+	# Same keys as the single site scripts use, so a site can be moved between them
+	def cursorKey(self):
+		if self.data_method == 'inverter':
+			return 'device:%s' % (self.device_id)
+		return 'plant:%s' % (self.plant_id)
+
+	def __str__(self):
+		return '%s -> PVoutput system %s' % (self.name, self.pvo_system_id)
+
+# Read the list of sites (and optional settings) from a JSON config file, e.g.
+# {"max_workers": 8, "max_per_account": 2, "sites": [{"smpv_client_id": ..., "pvo_system_id": ...}, ...]}
+def loadConfig(config_file):
+	with open(config_file, 'r') as f:
+		config = json.load(f)
+	if isinstance(config, list):
+		config = {'sites':config}
+	config['sites'] = [Site(site_config) for site_config in config.get('sites', [])]
+	return config
+
+# Create a SolarmanPVAPI object for site (only importing the API flavour that is actually used),
+# raises IOError if it can't connect
+def createClient(site, session=None, debug=False):
+	if site.api == 'global':
+		from SolarmanPVGlobalAPI.solarmanpv_api import SolarmanPVAPI
+	else:
+		from SolarmanPVAPI.solarmanpv_api import SolarmanPVAPI
+	client = SolarmanPVAPI(site.client_id, site.client_secret, site.plant_id, session=session)
+	client.setDebug(debug)
+	if client.connected is not True:
+		raise IOError('an issue with connection to the SolarmanPV API for %s' % (site.name))
+	return client
+
+class Poller:
+	def __init__(self, sites, max_workers=default_max_workers, max_per_account=default_max_per_account,
+			cursor_file=default_cursor_file, debug=False, outbox_file=default_outbox_file,
+			slot_index_file=default_slot_index_file):
+		self.sites = list(sites)
+		self.max_workers = max_workers
+		self.max_per_account = max_per_account
+		self.cursor = FetchCursor(cursor_file)
+		self.slot_index = SlotIndex(slot_index_file)
+		self.outbox = Outbox(outbox_file, slot_index=self.slot_index)
+		self.debug = debug
+		self.__executor = ThreadPoolExecutor(max_workers=max_workers)
+		# publish() runs on its own pool, so slow uploads don't hold up the fetches still to go
+		self.__upload_executor = ThreadPoolExecutor(max_workers=max_workers)
+		self.__lock = threading.Lock()
+		# per PVoutput system: a lock so two sites' uploads don't drain (and send) the same statuses
+		self.__drain_locks = {}
+		# per SolarmanPV account: a semaphore limiting requests in flight, and the shared session
+		self.__account_semaphores = {}
+		self.__account_sessions = {}
+		# one SolarmanPVAPI per (account, plant), kept between polls
+		self.__clients = {}
+		# one PVoutput_Connection per (key, system), and a FanOut per site with mirrors
+		self.__pvo_connections = {}
+		self.__fanouts = {}
+
+	def __accountSemaphore(self, site):
+		with self.__lock:
+			if site.client_id not in self.__account_semaphores:
+				self.__account_semaphores[site.client_id] = threading.BoundedSemaphore(self.max_per_account)
+			return self.__account_semaphores[site.client_id]
+
+	def __drainLock(self, system_id):
+		with self.__lock:
+			return self.__drain_locks.setdefault(system_id, threading.Lock())
+
+	def __client(self, site):
+		key = (site.api, site.client_id, site.plant_id)
+		with self.__lock:
+			client = self.__clients.get(key)
+			if client is not None:
+				return client
+			if site.api == 'global':
+				from SolarmanPVGlobalAPI.solarmanpv_api import createSession
+			else:
+				from SolarmanPVAPI.solarmanpv_api import createSession
+			session_key = (site.api, site.client_id)
+			if session_key not in self.__account_sessions:
+				self.__account_sessions[session_key] = createSession(pool_size=self.max_per_account)
+			session = self.__account_sessions[session_key]
+
+		# connect outside the lock, the token cache makes sure there is only one token refresh per account
+		client = createClient(site, session, self.debug)
+		with self.__lock:
+			return self.__clients.setdefault(key, client)
+
+	# Returns the new samples for a site (oldest first), run on the thread pool
+	def __fetch(self, site, date_to_retrieve):
+		with self.__accountSemaphore(site):
+			client = self.__client(site)
+			last_uploaded = self.cursor.get(site.cursorKey())
+			if site.data_method == 'inverter':
+				if last_uploaded is None:
+					sample = client.getInverterData(date_to_retrieve, site.device_id, True)
+					return [sample] if sample is not None else []
+				return client.getInverterData(date_to_retrieve, site.device_id, since=last_uploaded) or []
+			else:
+				if last_uploaded is None:
+					sample = client.getPower(date_to_retrieve, True)
+					return [sample] if sample is not None else []
+				return client.getPower(date_to_retrieve, since=last_uploaded) or []
+
+	# All of a site's samples for a day (oldest first), run on the thread pool
+	def __fetchDay(self, site, date_to_retrieve):
+		with self.__accountSemaphore(site):
+			client = self.__client(site)
+			if site.data_method == 'inverter':
+				return sorted(client.iterInverterData(site.device_id, date_to_retrieve, date_to_retrieve), key=lambda sample: sample.timestamp)
+			return client.getPower(date_to_retrieve, since=0) or []
+
+	def pvoConnection(self, site):
+		key = (site.pvo_key, site.pvo_system_id)
+		with self.__lock:
+			if key not in self.__pvo_connections:
+				self.__pvo_connections[key] = PVoutput_Connection(site.pvo_key, site.pvo_system_id)
+			return self.__pvo_connections[key]
+
+	def fanOut(self, site):
+		key = (site.cursorKey(), site.pvo_system_id)
+		with self.__lock:
+			if key not in self.__fanouts:
+				self.__fanouts[key] = FanOut(site.pvo_targets)
+			return self.__fanouts[key]
+
+	# Commit a site's new samples to the outbox (advancing its cursor past them), then upload what is
+	# due in the outbox for its PVoutput system(s) - mirrors are uploaded to at the same time.  With temps
+	# ((timestamp, temp) pairs, oldest first) each status gets the temperature nearest to its sample.
+	def publish(self, site, samples, temp=None, temps=None):
+		if len(site.pvo_targets) == 1:
+			queueStatuses(self.outbox, site.pvo_system_id, samples, temp, lambda sample: self.cursor.advance(site.cursorKey(), sample.timestamp), site.name, temps)
+			with self.__drainLock(site.pvo_system_id):
+				drainOutbox(self.outbox, self.pvoConnection(site), site.name)
+			return
+
+		for (pvo_key, pvo_system_id) in site.pvo_targets[1:]:
+			queueStatuses(self.outbox, pvo_system_id, samples, temp, name=site.name, temps=temps)
+		queueStatuses(self.outbox, site.pvo_system_id, samples, temp, lambda sample: self.cursor.advance(site.cursorKey(), sample.timestamp), site.name, temps)
+		def drain(pvout, system_id):
+			with self.__drainLock(system_id):
+				return drainOutbox(self.outbox, pvout, '%s (%s)' % (site.name, system_id), system_id)
+		(results, failures) = self.fanOut(site).run(drain)
+		if failures:
+			# whatever wasn't sent is still in the outbox for next time
+			raise PVoutputError('uploads to system(s) %s failed' % (', '.join(sorted(failures))))
+
+	# Fetch all the sites concurrently, publish() each site's samples (on the upload pool, alongside the
+	# other sites' fetches and uploads) as soon as its fetch completes.  A failure for one site doesn't
+	# stop the others; returns {site name: exception} for the failures.
+	def poll(self, temp=None, date_to_retrieve=None, temps=None):
+		if date_to_retrieve is None:
+			date_to_retrieve = datetime.date.today().strftime('%Y-%m-%d')
+
+		fetches = {}
+		for site in self.sites:
+			fetches[self.__executor.submit(self.__fetch, site, date_to_retrieve)] = site
+
+		failures = {}
+		uploads = {}
+		for future in as_completed(fetches):
+			site = fetches[future]
+			try:
+				samples = future.result()
+				DEBUG('%s: %d new sample(s)' % (site.name, len(samples)))
+				uploads[self.__upload_executor.submit(self.publish, site, samples, temp, temps)] = site
+			except Exception as e:
+				print('%s: %s failed - %s' % (self.__class__.__name__, site, e))
+				failures[site.name] = e
+		for future in as_completed(uploads):
+			site = uploads[future]
+			try:
+				future.result()
+			except Exception as e:
+				print('%s: %s failed - %s' % (self.__class__.__name__, site, e))
+				failures[site.name] = e
+		return failures
+
+	# The sites whose end of day output for date_to_retrieve (YYYY-MM-DD) hasn't been sent yet
+	def outputsDue(self, date_to_retrieve):
+		return [site for site in self.sites if not self.cursor.outputDone(site.cursorKey(), date_to_retrieve)]
+
+	# Upload each site's end of day output (energy, peak power and time, and min/max temperature when
+	# temps - the day's temperatures - are given) worked out from all of its samples for the day (by
+	# default the day before), one add_output() call per site and day - the sites it has already been
+	# sent for are left out.  Returns {site name: exception} for the failures, like poll().
+	def addOutputs(self, temps=None, date_to_retrieve=None):
+		if date_to_retrieve is None:
+			date_to_retrieve = outputDay()
+
+		futures = [(site, self.__executor.submit(self.__fetchDay, site, date_to_retrieve)) for site in self.outputsDue(date_to_retrieve)]
+		failures = {}
+		fetched = []
+		for (site, future) in futures:
+			try:
+				fetched.append((site, future.result()))
+			except Exception as e:
+				print('%s: %s failed - %s' % (self.__class__.__name__, site, e))
+				failures[site.name] = e
+
+		outputs = summariseDays([samples for (site, samples) in fetched], [temps] * len(fetched))
+		for ((site, samples), output) in zip(fetched, outputs):
+			try:
+				if output is not None:
+					DEBUG('%s: adding output %s' % (site.name, output))
+					if len(site.pvo_targets) == 1:
+						self.pvoConnection(site).add_output(**output)
+					else:
+						(results, output_failures) = self.fanOut(site).add_output(**output)
+						if output_failures:
+							raise PVoutputError('add_output to system(s) %s failed' % (', '.join(sorted(output_failures))))
+				# not tried again for the day, a day without samples included
+				self.cursor.outputSent(site.cursorKey(), date_to_retrieve)
+			except Exception as e:
+				print('%s: %s failed - %s' % (self.__class__.__name__, site, e))
+				failures[site.name] = e
+		return failures
+
+	def close(self):
+		self.__executor.shutdown(wait=True)
+		self.__upload_executor.shutdown(wait=True)
+		for fanout in self.__fanouts.values():
+			fanout.close()
+		if self.__pvo_connections or self.__fanouts:
+			close_connections()
+		with self.__lock:
+			for client in self.__clients.values():
+				client.close()
+			for session in self.__account_sessions.values():
+				session.close()
+			self.__clients = {}
+			self.__account_sessions = {}
+		self.outbox.close()
+		self.slot_index.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+# END OF FILE
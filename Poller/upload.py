@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Turns SolarmanPV samples into PVoutput statuses and uploads them
+
+from util import DEBUG
+
+# furthest (seconds) a temperature reading can be from a sample and still be used for it
+default_temp_tolerance = 600
+
+# The PVoutput date, time and status values for a PowerSample/InverterSample
+def sampleStatus(sample):
+	status = {'date':sample.pvoDate(), 'time':sample.pvoTime(), 'power_exp':sample.power}
+	if getattr(sample, 'vac1', None) is not None:
+		status['vdc'] = sample.vac1
+	return status
+
+# The temperature nearest in time to each of samples (oldest first), from temps - (timestamp, temp)
+# pairs, oldest first, e.g. from WeewxInfo.getOutsideTemps() - or None where there isn't a reading
+# within tolerance seconds.  An as-of join: one pass over both lists, as both are in time order.
+def nearestTemps(samples, temps, tolerance=default_temp_tolerance):
+	nearest = []
+	index = 0
+	last = len(temps) - 1
+	for sample in samples:
+		timestamp = sample.timestamp
+		# readings get closer until the nearest one, then further away again
+		while index < last and abs(temps[index + 1][0] - timestamp) <= abs(temps[index][0] - timestamp):
+			index += 1
+		if last >= 0 and abs(temps[index][0] - timestamp) <= tolerance:
+			nearest.append(temps[index][1])
+		else:
+			nearest.append(None)
+	return nearest
+
+# (sample, status) for the samples with power > 0 - the ones worth uploading.  Each status gets temp,
+# or with temps ((timestamp, temp) pairs, oldest first) the temperature nearest to its sample.  Samples
+# without a power value (or with one that isn't a number) are skipped.
+def samplesToUpload(samples, temp=None, name='PVoutput', temps=None):
+	if temps is not None:
+		sample_temps = nearestTemps(samples, temps)
+	else:
+		sample_temps = [temp] * len(samples)
+	to_upload = []
+	for (sample, sample_temp) in zip(samples, sample_temps):
+		status = sampleStatus(sample)
+		if isinstance(status['power_exp'], bool) or not isinstance(status['power_exp'], (int, float)):
+			DEBUG('%s: skipping status %s %s - no power value (%r)' % (name, status['date'], status['time'], status['power_exp']))
+		elif status['power_exp'] > 0:
+			DEBUG('%s: adding status %s %s %sW' % (name, status['date'], status['time'], status['power_exp']))
+			status['temp'] = sample_temp
+			to_upload.append((sample, status))
+		else:
+			DEBUG('%s: no need to update - power %dW' % (name, status['power_exp']))
+	return to_upload
+
+# Upload samples (oldest first) to PVoutput as statuses, in batches (only the ones with power > 0,
+# and with a SlotIndex, only the ones not uploaded already).  uploaded(sample) is called for each
+# sample in order, up to the first one PVoutput didn't add.  Returns the samples that weren't added.
+def uploadStatuses(pvout, samples, temp=None, uploaded=None, name='PVoutput', slot_index=None, temps=None):
+	to_upload = samplesToUpload(samples, temp, name, temps)
+	if slot_index is not None:
+		to_upload = [(sample, status) for (sample, status) in to_upload if not slot_index.contains(pvout.system_id, status['date'], status['time'])]
+
+	not_added = []
+	if to_upload:
+		failed = pvout.add_batch_status([status for (sample, status) in to_upload])
+		failed_statuses = set(id(status) for status in failed)
+		not_added = [sample for (sample, status) in to_upload if id(status) in failed_statuses]
+		if slot_index is not None:
+			slot_index.add(pvout.system_id, [(status['date'], status['time']) for (sample, status) in to_upload if id(status) not in failed_statuses])
+		if not_added:
+			print('%s: %d status(es) not added by PVoutput' % (name, len(not_added)))
+
+	if uploaded is not None:
+		for sample in samples:
+			if not_added and sample.timestamp >= not_added[0].timestamp:
+				break
+			uploaded(sample)
+	return not_added
+
+# Commit samples (oldest first) to the outbox as statuses for system_id (in one transaction), then
+# call uploaded(sample) once, with the newest sample - they are all safe on disk from here, and get
+# uploaded by outbox.drain()
+def queueStatuses(outbox, system_id, samples, temp=None, uploaded=None, name='PVoutput', temps=None):
+	to_upload = samplesToUpload(samples, temp, name, temps)
+	if to_upload:
+		outbox.enqueue(system_id, [status for (sample, status) in to_upload])
+	if uploaded is not None and samples:
+		uploaded(max(samples, key=lambda sample: sample.timestamp))
+
+# Upload what is due in the outbox for system_id (default pvout's system), printing the outcome if
+# not everything went
+def drainOutbox(outbox, pvout, name='PVoutput', system_id=None):
+	result = outbox.drain(pvout, system_id)
+	DEBUG('%s: %d status(es) uploaded from the outbox' % (name, result['sent']))
+	if result['failed']:
+		print('%s: %d status(es) not added by PVoutput, kept in the outbox to retry%s' % (name, result['failed'],
+				' - %s' % (result['error']) if result['error'] else ''))
+	return result
+
+# END OF FILE
@@ -30,7 +30,7 @@ from PVoutput.pvoutput import PVoutput_Connection  # API for talking to the PVou
 inverters = {'192.168.1.123': [1, ]}
 
 # get pvoutput API details
-apiDelay = 5  # time to delay after API calls
+# (no fixed delay between API calls - PVoutput_Connection paces them from pvoutput.org's rate limit headers)
 # API Key and SystemId must be entered as arguments for script.
 
 if len(sys.argv) != 3:
@@ -76,8 +76,6 @@ for sm in smlist:
             if (PowerGeneration):  # make sure that we have actual values...
                 pvoutz.add_status(powerdate, powerTime, power_exp=PowerGeneration, temp=Temperature, vdc=Voltage)
                 print "Sucessful Log "
-                #Ensure API limits adhered to
-                time.sleep(apiDelay)
             else:
                 print "aint no data bitch.. make the sun come up"
 
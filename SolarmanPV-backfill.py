@@ -0,0 +1,150 @@
+#!/usr/bin/python
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Load the history for a date range from the SolarmanPV API and upload it to PVoutput, e.g. when
+# onboarding a site or after an outage.  Progress is checkpointed, re-running carries on from the
+# last day done.
+
+
+import sys
+import argparse
+import datetime
+from util import DEBUG
+from Poller.poller import Site, createClient
+from Poller.upload import uploadStatuses
+from Poller.daily_summary import summariseDay
+from Poller.backfill import Backfill, default_checkpoint_file, default_max_workers, default_requests_per_minute
+from SolarmanPVAPI.exceptions import SolarmanPVAPIError
+# API for talking to the PVoutput inverter
+from PVoutput.pvoutput import PVoutput_Connection, PVoutputError, pvo_batchOutputLimit, pvo_statusDays
+# statuses already uploaded, so they aren't sent again
+from PVoutput.slot_index import SlotIndex, default_slot_index_file
+
+
+if sys.version_info < (2, 7):
+	raise "must user Python 2.7 or greater"
+
+appVersion = 0.3
+
+parser = argparse.ArgumentParser(prog=sys.argv[0])
+parser.add_argument("-d", "--debug", help="turn on debug output", action="store_true")
+parser.add_argument("-v", "--version", action="version", version="%(prog)s " + str(appVersion))
+parser.add_argument("--smpv_client_id", help="SolarmanPV API client ID", required=True)
+parser.add_argument("--smpv_client_secret", help="SolarmanPV API client secret", required=True)
+parser.add_argument("--smpv_plant_id", help="ID of the plant (i.e. The solar PV site within SolarmanPV)", required=True)
+parser.add_argument("--smpv_device_id", help="ID of the device (i.e. The solar PV inverter within the site within SolarmanPV)")
+parser.add_argument("--smpv_api", help="SolarmanPV API to use (default %(default)s)", choices=['china', 'global'], default='china')
+parser.add_argument("--pvo_key", help="PVoutput API key", required=True)
+parser.add_argument("--pvo_system_id", help="PVoutput system ID", required=True)
+parser.add_argument("--power_data", help="Use the getPower() i.e. SolarmanPVAPI plant/power method.  Default is getInverterData() when --smpv_device_id is given", required=False, action="store_true")
+parser.add_argument("--start_date", help="First day to load (YYYY-MM-DD)", required=True)
+parser.add_argument("--end_date", help="Last day to load (YYYY-MM-DD, default yesterday)", default=(datetime.date.today() - datetime.timedelta(days=1)).strftime('%Y-%m-%d'))
+parser.add_argument("--checkpoint_file", help="File to keep progress in (default %(default)s)", default=default_checkpoint_file)
+parser.add_argument("--restart", help="Ignore the checkpoint and start from --start_date again", action="store_true")
+parser.add_argument("--max_workers", help="Days fetched at the same time (default %(default)s)", type=int, default=default_max_workers)
+parser.add_argument("--requests_per_minute", help="SolarmanPV API requests per minute (default %(default)s)", type=float, default=default_requests_per_minute)
+parser.add_argument("--slot_index_file", help="File to keep the status slots already uploaded to PVoutput in (default %(default)s)", default=default_slot_index_file)
+parser.add_argument("--add_output", help="Also upload each day's end of day output (energy, peak power and time), %d days per request" % (pvo_batchOutputLimit), action="store_true")
+parser.add_argument("--outputs_only", help="Only upload the end of day outputs, not the statuses", action="store_true")
+parser.add_argument("--status_days", help="Days back PVoutput takes statuses for - older days only get their end of day output (default %(default)s, 90 for donors)", type=int, default=pvo_statusDays)
+args = parser.parse_args()
+if args.status_days < 1:
+	parser.error('--status_days must be at least 1')
+
+debug = False
+if args.debug:
+	print("debug turned on")
+	debug = True
+
+site_config = {
+		'smpv_client_id': args.smpv_client_id,
+		'smpv_client_secret': args.smpv_client_secret,
+		'smpv_plant_id': args.smpv_plant_id,
+		'smpv_device_id': args.smpv_device_id,
+		'smpv_api': args.smpv_api,
+		'pvo_key': args.pvo_key,
+		'pvo_system_id': args.pvo_system_id
+		}
+if args.power_data:
+	site_config['data_method'] = 'power'
+try:
+	site = Site(site_config)
+except ValueError as e:
+	print(e)
+	sys.exit(1)
+
+try:
+	smpv = createClient(site, debug=debug)
+except IOError as e:
+	print(e)
+	sys.exit(1)
+
+pvout = PVoutput_Connection(site.pvo_key, site.pvo_system_id)
+# PVoutput turns down (HTTP 400) a batch with any status older than this
+first_status_day = (datetime.date.today() - datetime.timedelta(days=args.status_days - 1)).strftime('%Y-%m-%d')
+if not args.outputs_only and args.start_date < first_status_day:
+	print('%s: the days before %s are too old for PVoutput statuses, only their end of day outputs will be uploaded' % (site.name, first_status_day))
+slot_index = SlotIndex(args.slot_index_file)
+
+# (day, end of day output) pairs waiting to go in the next addbatchoutput.jsp request
+outputs = []
+
+# Send the waiting outputs, returns the days they were for once PVoutput has added them all
+def uploadOutputs():
+	if not outputs:
+		return []
+	outcomes = pvout.add_batch_output([output for (day, output) in outputs])
+	not_added = sorted((date, outcome) for (date, outcome) in outcomes.items() if outcome != 'added')
+	if not_added:
+		# none of the batch's days are checkpointed, so it goes again next run
+		for (date, outcome) in not_added:
+			print('%s: output for %s %s' % (site.name, date, outcome))
+		raise IOError('%d output(s) were not added by PVoutput' % (len(not_added)))
+	days = [day for (day, output) in outputs]
+	del outputs[:]
+	return days
+
+# Upload a day, returns the days now on PVoutput - none while its output waits for a full batch
+def publish(day, samples):
+	statuses = not args.outputs_only and day >= first_status_day
+	if statuses:
+		not_added = uploadStatuses(pvout, samples, name=site.name, slot_index=slot_index)
+		if not_added:
+			# stop here, so the day isn't checkpointed and is tried again next run
+			raise IOError('%d status(es) for %s were not added by PVoutput' % (len(not_added), day))
+	if args.add_output or not statuses:
+		output = summariseDay(samples)
+		if output is not None:
+			outputs.append((day, output))
+			if len(outputs) >= pvo_batchOutputLimit:
+				return uploadOutputs()
+			return []
+	return [day]
+
+backfill = Backfill(smpv, site, args.checkpoint_file, args.max_workers, args.requests_per_minute)
+if args.restart:
+	backfill.reset()
+try:
+	# the last part filled batch of outputs goes once every day is fetched
+	days_done = backfill.run(args.start_date, args.end_date, publish, flush=uploadOutputs)
+except SolarmanPVAPIError as e:
+	print('An issue with the SolarmanPV API - %s (re-run to carry on from the last day done)' % (e))
+	sys.exit(2)
+except (IOError, PVoutputError, ValueError) as e:
+	print('An issue with PVoutput - %s (re-run to carry on from the last day done)' % (e))
+	sys.exit(2)
+DEBUG('%d day(s) loaded' % (days_done))
+
+# END OF FILE
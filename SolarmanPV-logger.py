@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# One entry point for the SolarmanPV to PVoutput uploaders:
+#   SolarmanPV-logger.py <command> [the command's arguments]
+# Nothing but argparse is imported until a command is picked, then the command's script is run and
+# imports only what it needs - the SolarmanPV API (and requests) once its arguments are good, and only
+# the flavour asked for, MySQLdb only for a MySQL Weewx archive, NumPy only for big batches of days.
+# See benchmarks/bench_startup.py for the start up time budget.
+
+import os
+import sys
+import argparse
+
+appVersion = 0.3
+
+# command: (script, help)
+commands = {
+	'power':(
+		'SolarmanPV-to-PVoutput.py',
+		"a plant's power data to PVoutput (--smpv_api global for the global API)"),
+	'inverter':(
+		'SolarmanPV-to-PVoutput-inverter-data.py',
+		"a device's inverter data, with Weewx temperatures, to PVoutput"),
+	'multi':(
+		'SolarmanPV-to-PVoutput-multi.py',
+		'all the plants/devices in a JSON config file, once or as a daemon'),
+	'backfill':(
+		'SolarmanPV-backfill.py',
+		"load a date range of a plant/device's history to PVoutput"),
+}
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(prog=os.path.basename(sys.argv[0]),
+			description='\n'.join('  %-10s %s' % (command, commands[command][1]) for command in sorted(commands)),
+			formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("-v", "--version", action="version", version="%(prog)s " + str(appVersion))
+	parser.add_argument("command", help="what to run (see above)", choices=sorted(commands))
+	parser.add_argument("arguments", help="the command's arguments (see <command> --help)", nargs=argparse.REMAINDER)
+	args = parser.parse_args(argv)
+
+	script = os.path.join(os.path.dirname(os.path.abspath(__file__)), commands[args.command][0])
+	# the script parses sys.argv itself, as it does when it is run on its own (runpy.run_path() would
+	# put the script's path in sys.argv[0], and so in its usage messages)
+	sys.argv = ['%s %s' % (parser.prog, args.command)] + args.arguments
+	with open(script) as f:
+		code = compile(f.read(), script, 'exec')
+	exec(code, {'__name__':'__main__', '__file__':script})
+
+if __name__ == '__main__':
+	main()
+
+# END OF FILE
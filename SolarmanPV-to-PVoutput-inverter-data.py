@@ -20,15 +20,20 @@
 import sys
 import argparse
 import datetime
-from util import DEBUG, utc_to_local
-# class for talking to the Solarman PV API
-from SolarmanPVAPI.solarmanpv_api import SolarmanPVAPI
+from util import DEBUG
+from SolarmanPVAPI.exceptions import SolarmanPVAPIError
+# high-water mark of the samples already uploaded
+from SolarmanPVAPI.fetch_cursor import FetchCursor, default_cursor_file
 # API for talking to the PVoutput inverter
-from PVoutput.pvoutput import PVoutput_Connection
-# class for getting Weewx info
+from PVoutput.pvoutput import PVoutput_Connection, PVoutputError
+# durable queue of statuses waiting to go to pvoutput.org
+from PVoutput.outbox import Outbox, default_outbox_file
+# statuses already uploaded, so they aren't sent again
+from PVoutput.slot_index import SlotIndex, default_slot_index_file
+from Poller.upload import queueStatuses, drainOutbox
+from Poller.daily_summary import summariseDay, dayBounds, outputDay
+# class for getting Weewx info (MySQLdb is only imported for a MySQL archive)
 from Weewx.weewx import WeewxInfo
-import requests
-import socket
 
 
 if sys.version_info < (2, 7):
@@ -43,7 +48,7 @@ appVersion = 0.3
 debug = False
 smpv_client_id = smpv_client_secret = smpv_plant_id = None
 pvo_key = pvo_system_id = None
-weewx_user = weewx_password = weewx_host = weewx_database = None
+weewx_user = weewx_password = weewx_host = weewx_database = weewx_sqlite_file = None
 
 parser = argparse.ArgumentParser(prog=sys.argv[0])
 parser.add_argument("-d", "--debug", help="turn on debug output", action="store_true")
@@ -51,15 +56,23 @@ parser.add_argument("-v", "--version", action="version", version="%(prog)s " + s
 parser.add_argument("--smpv_client_id", help="SolarmanPV API client ID", required=True)
 parser.add_argument("--smpv_client_secret", help="SolarmanPV API client secret", required=True)
 parser.add_argument("--smpv_plant_id", help="ID of the plant (i.e. The solar PV site within SolarmanPV)", required=True)
+parser.add_argument("--smpv_api", help="SolarmanPV API to use (default %(default)s)", choices=['china', 'global'], default='china')
 parser.add_argument("--smpv_device_id", help="ID of the device (i.e. The solar PV inverter within the site within SolarmanPV)", required=True)
 parser.add_argument("--pvo_key", help="PVoutput API key", required=True)
 parser.add_argument("--pvo_system_id", help="PVoutput system ID", required=True)
 parser.add_argument("--power_data", help="Use the getPower() i.e. SolarmanPVAPI plant/power method.  Default is getInverterData()", required=False, action="store_true")
-parser.add_argument("--weewx_user", help="Weewx MySQL username", required=True)
-parser.add_argument("--weewx_password", help="Weewx MySQL password", required=True)
-parser.add_argument("--weewx_host", help="Weewx MySQL host", required=True)
-parser.add_argument("--weewx_database", help="Weewx MySQL database", required=True)
+parser.add_argument("--weewx_user", help="Weewx MySQL username")
+parser.add_argument("--weewx_password", help="Weewx MySQL password")
+parser.add_argument("--weewx_host", help="Weewx MySQL host")
+parser.add_argument("--weewx_database", help="Weewx MySQL database")
+parser.add_argument("--weewx_sqlite_file", help="Weewx SQLite archive (e.g. /var/lib/weewx/weewx.sdb), instead of the MySQL database")
+parser.add_argument("--cursor_file", help="File to keep the time of the last uploaded sample in (default %(default)s)", default=default_cursor_file)
+parser.add_argument("--outbox_file", help="File to queue the statuses for PVoutput in until they are uploaded (default %(default)s)", default=default_outbox_file)
+parser.add_argument("--slot_index_file", help="File to keep the status slots already uploaded to PVoutput in (default %(default)s)", default=default_slot_index_file)
+parser.add_argument("--add_output", help="Also upload the end of day output (energy, peak power and time, min/max temperature) worked out from the day before's samples, once on the first run after midnight", action="store_true")
 args = parser.parse_args()
+if args.weewx_sqlite_file is None and None in (args.weewx_user, args.weewx_password, args.weewx_host, args.weewx_database):
+	parser.error("either --weewx_sqlite_file or all of --weewx_user, --weewx_password, --weewx_host and --weewx_database are required")
 
 if args.debug:
 	print("debug turned on")
@@ -75,12 +88,19 @@ weewx_user = args.weewx_user
 weewx_password = args.weewx_password
 weewx_host = args.weewx_host
 weewx_database = args.weewx_database
+weewx_sqlite_file = args.weewx_sqlite_file
 
 if args.power_data:
 	data_method = 'power'
 else:
 	data_method = 'inverter'
 
+# class for talking to the Solarman PV API - only imported now the arguments are good, and only the one asked for
+if args.smpv_api == 'global':
+	from SolarmanPVGlobalAPI.solarmanpv_api import SolarmanPVAPI
+else:
+	from SolarmanPVAPI.solarmanpv_api import SolarmanPVAPI
+
 # Create the SolarmanAPI object
 smpv = SolarmanPVAPI(client_id, client_secret, plant_id)
 smpv.setDebug(debug)
@@ -88,96 +108,107 @@ if smpv.connected is not True:
 	print('An issue with connection to the SolarmanPV API')
 	sys.exit(1)
 
-# get temperature data from Weewx
-# create an instance for a Weewx class and call the get "current outside temp" method
+# get temperature data from Weewx - the day's outside temperatures in one query, each sample gets the one nearest to it
+date_to_retrieve = datetime.date.today().strftime("%Y-%m-%d")
 try:
-	weather_info = WeewxInfo(weewx_user, weewx_password, weewx_host, weewx_database)
-	current_outside_temp = weather_info.getCurrentOutsideTemp()
+	with WeewxInfo(weewx_user, weewx_password, weewx_host, weewx_database, sqlite_file=weewx_sqlite_file) as weather_info:
+		day_temps = weather_info.getOutsideTemps(*dayBounds(date_to_retrieve))
 except:
-	current_outside_temp = None
-DEBUG('current outside temp == ' + str(current_outside_temp))
+	day_temps = None
+DEBUG('outside temps today == ' + str(len(day_temps) if day_temps is not None else None))
+
+# Only the samples newer than the last one uploaded are handled, so none are lost between runs
+cursor = FetchCursor(args.cursor_file)
+# Create connection to pvoutput.org
+pvout = PVoutput_Connection(pvo_key, pvo_system_id)
+outbox = Outbox(args.outbox_file, slot_index=SlotIndex(args.slot_index_file))
 
 # testing getInverterData() instead (see below after this if statement)
 if data_method == 'power':
-	power_details = smpv.getPower(datetime.date.today().strftime("%Y-%m-%d"), True)
-	if power_details is not None:
-		power = power_details['power']
-		# need to convert date and time value from UTC to local time before uploading to pvoutput.org
-		power_datetime_local = utc_to_local(datetime.datetime.strptime(power_details['time'], "%Y-%m-%dT%H:%M:%SZ"))
-		power_date = power_datetime_local.strftime("%Y%m%d")
-		power_time = power_datetime_local.strftime("%H:%M")
-
-		DEBUG('power == ' + str(power) + ' and power_date == ' + power_date)
-
-		try:
-			# Create connection to pvoutput.org
-			pvout = PVoutput_Connection(pvo_key, pvo_system_id)
-			# update pvoutput - but only if there is a value power value (i.e. > 0)
-
-			# add_output() is for end of day output - therfore the peak power, peak time, etc
-#			pvout.add_output(power_date, generated=power)
-
-			if power > 0:
-				DEBUG('adding inverter data to PVOutput')
-				pvout.add_status(power_date, power_time, power_exp=power, temp=current_outside_temp)
+	cursor_key = 'plant:%s' % (plant_id)
+	last_uploaded = cursor.get(cursor_key)
+	try:
+		if last_uploaded is None:
+			# first run, start from the most recent value
+			power_details = smpv.getPower(date_to_retrieve, True)
+			if power_details is not None:
+				power_samples = [power_details]
 			else:
-				DEBUG('no need to update - power %dW' % power)
-		except:
-			print('An error with PVoutput ', sys.exc_info()[0])
-			raise
+				power_samples = None
+		else:
+			power_samples = smpv.getPower(date_to_retrieve, since=last_uploaded)
+	except SolarmanPVAPIError as e:
+		print('An issue with the SolarmanPV API - %s' % (e))
+		sys.exit(2)
+
+	if power_samples is not None:
+		DEBUG('%d new power sample(s) since last upload' % (len(power_samples)))
+		# commit the samples with a power value (i.e. > 0) to the outbox - once they are there the cursor can move past them
+		queueStatuses(outbox, pvo_system_id, power_samples, uploaded=lambda sample: cursor.advance(cursor_key, sample.timestamp), temps=day_temps)
 	else:
 		# Changed this to a DEBUG, so that it won't output when in a CRON job
 		DEBUG('Invalid power data from SolarmanPV API - no further action')
 
 elif data_method == 'inverter':
-	date_to_retrieve = datetime.date.today().strftime("%Y-%m-%d")
-	inverter_details = smpv.getInverterData(date_to_retrieve, device_id, True)
-	if inverter_details is not None:
-		DEBUG('inverter_details == ' + str(inverter_details))
-		DEBUG('power == %sW' % (inverter_details['power']))
-		DEBUG('input current 1 == %sA and 2 == %sA' % (inverter_details['iPv1'], inverter_details['iPv2']))
-		DEBUG('input voltage 1 == %sV and 2 == %sV' % (inverter_details['vPv1'], inverter_details['vPv2']))
-		DEBUG('output current 1 == %sA' % (inverter_details['iac1']))
-		DEBUG('output voltage 1 == %sV' % (inverter_details['vac1']))
-		DEBUG('frequency == %sHz' % (inverter_details['fac']))
-		DEBUG('time == %s' % (inverter_details['time']))
-		inverter_datetime_local = datetime.datetime.strptime(inverter_details['time'], "%Y-%m-%dT%H:%M:%S+10:00")
-		inverter_date = inverter_datetime_local.strftime("%Y%m%d")
-		inverter_time = inverter_datetime_local.strftime("%H:%M")
-		DEBUG('inverter power == ' + str(inverter_details['power']) + ' and inverter_date == ' + inverter_date + ' inverter_time == ' + inverter_time)
-
-		#	power = power_details['power']
-		#	# need to convert date and time value from UTC to local time before uploading to pvoutput.org
-		#	power_datetime_local = utc_to_local(datetime.datetime.strptime(power_details['time'], "%Y-%m-%dT%H:%M:%SZ"))
-		#	power_date = power_datetime_local.strftime("%Y%m%d")
-		#	power_time = power_datetime_local.strftime("%H:%M")
-
-		#	DEBUG('power == ' + str(power) + ' and power_date == ' + power_date)
-
-		try:
-			# Create connection to pvoutput.org
-			pvout = PVoutput_Connection(pvo_key, pvo_system_id)
-			# update pvoutput - but only if there is a value power value (i.e. > 0)
-
-			# add_output() is for end of day output - therfore the peak power, pear time, etc
-#			pvout.add_output(power_date, generated=power)
-
-			if inverter_details['power'] > 0:
-				DEBUG('adding inverter data to PVOutput')
-				pvout.add_status(inverter_date, inverter_time, power_exp=inverter_details['power'], vdc=inverter_details['vac1'], temp=current_outside_temp)
+	cursor_key = 'device:%s' % (device_id)
+	last_uploaded = cursor.get(cursor_key)
+	try:
+		if last_uploaded is None:
+			# first run, start from the most recent value
+			inverter_details = smpv.getInverterData(date_to_retrieve, device_id, True)
+			if inverter_details is not None:
+				inverter_samples = [inverter_details]
 			else:
-				DEBUG('no need to update - power %dW' % inverter_details['power'])
-		except requests.exceptions.Timeout as e:
-			print('PVoutput_Connection: request failed on a timeout - %s' % (e))
-		except socket.error as e:
-			print('PVoutput_Connection: request/socket failed on a timeout - %s' % (e))
-		except:
-			print('An error with PVoutput ', sys.exc_info()[0])
-			raise
+				inverter_samples = None
+		else:
+			inverter_samples = smpv.getInverterData(date_to_retrieve, device_id, since=last_uploaded)
+	except SolarmanPVAPIError as e:
+		print('An issue with the SolarmanPV API - %s' % (e))
+		sys.exit(2)
+
+	if inverter_samples is not None:
+		DEBUG('%d new inverter sample(s) since last upload' % (len(inverter_samples)))
+		for inverter_details in inverter_samples:
+			DEBUG('inverter_details == ' + str(inverter_details))
+		# commit the samples with a power value (i.e. > 0) to the outbox - once they are there the cursor can move past them
+		queueStatuses(outbox, pvo_system_id, inverter_samples, uploaded=lambda sample: cursor.advance(cursor_key, sample.timestamp), temps=day_temps)
 	else:
 		# Changed this to a DEBUG, so that it won't output when in a CRON job
 		DEBUG('Invalid inverter data from SolarmanPV API - no further action')
 
+# update pvoutput in batches from the outbox - these samples, and any from earlier runs that weren't added
+# (a timeout or pvoutput.org being down leaves them in the outbox, to be tried again next run)
+try:
+	drainOutbox(outbox, pvout)
+except:
+	print('An error with PVoutput ', sys.exc_info()[0])
+	raise
+outbox.close()
+
+# end of day output (generated energy, peak power and its time, min/max temperature) worked out from the day before's samples,
+# one add_output() call for the day - on the first run after midnight, later runs find it sent
+output_day = outputDay()
+if args.add_output and not cursor.outputDone(cursor_key, output_day):
+	try:
+		with WeewxInfo(weewx_user, weewx_password, weewx_host, weewx_database, sqlite_file=weewx_sqlite_file) as weather_info:
+			output_temps = weather_info.getOutsideTemps(*dayBounds(output_day))
+	except:
+		output_temps = None
+	try:
+		if data_method == 'inverter':
+			day_samples = sorted(smpv.iterInverterData(device_id, output_day, output_day), key=lambda sample: sample.timestamp)
+		else:
+			day_samples = smpv.getPower(output_day, since=0) or []
+		output = summariseDay(day_samples, [temp for (timestamp, temp) in output_temps] if output_temps is not None else None)
+		if output is not None:
+			DEBUG('adding output ' + str(output))
+			pvout.add_output(**output)
+		cursor.outputSent(cursor_key, output_day)
+	except SolarmanPVAPIError as e:
+		print('An issue with the SolarmanPV API - %s' % (e))
+	except (PVoutputError, ValueError) as e:
+		print('An error with PVoutput - %s' % (e))
+
 # temporary exit, looking to include voltage and current data - but need to find out why the current day data doesn't come back through the API
 sys.exit(5)
 
@@ -0,0 +1,137 @@
+#!/usr/bin/python
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Multi site version of SolarmanPV-to-PVoutput.py/SolarmanPV-to-PVoutput-inverter-data.py - one
+# process (i.e. one cron line) for all the plants/devices listed in a JSON config file.  With --daemon
+# it keeps running instead, polling every PVoutput status interval.
+
+
+import sys
+import argparse
+import datetime
+from util import DEBUG
+from Poller.poller import Poller, loadConfig, default_max_workers, default_max_per_account
+from Poller.daily_summary import dayBounds, outputDay
+from Poller.daemon import Daemon, Scheduler, default_jitter
+from SolarmanPVAPI.fetch_cursor import default_cursor_file
+from PVoutput.outbox import default_outbox_file
+from PVoutput.slot_index import default_slot_index_file
+
+
+if sys.version_info < (2, 7):
+	raise "must user Python 2.7 or greater"
+
+appVersion = 0.3
+
+parser = argparse.ArgumentParser(prog=sys.argv[0])
+parser.add_argument("-d", "--debug", help="turn on debug output", action="store_true")
+parser.add_argument("-v", "--version", action="version", version="%(prog)s " + str(appVersion))
+parser.add_argument("--config", help="JSON file listing the plants/devices and their PVoutput systems", required=True)
+parser.add_argument("--max_workers", help="Number of plants/devices fetched at the same time (default from config or %d)" % (default_max_workers), type=int)
+parser.add_argument("--max_per_account", help="Number of requests at the same time per SolarmanPV account (default from config or %d)" % (default_max_per_account), type=int)
+parser.add_argument("--cursor_file", help="File to keep the time of the last uploaded sample in (default %(default)s)", default=default_cursor_file)
+parser.add_argument("--outbox_file", help="File to queue the statuses for PVoutput in until they are uploaded (default %(default)s)", default=default_outbox_file)
+parser.add_argument("--slot_index_file", help="File to keep the status slots already uploaded to PVoutput in (default %(default)s)", default=default_slot_index_file)
+parser.add_argument("--add_output", help="Also upload each site's end of day output (energy, peak power and time) worked out from the day before's samples, once on the first poll after midnight", action="store_true")
+parser.add_argument("--daemon", help="Keep running, polling every PVoutput status interval (SIGTERM stops it, SIGHUP reloads the config)", action="store_true")
+parser.add_argument("--jitter", help="Most seconds a --daemon poll starts after the interval boundary (default %(default)s)", type=int, default=default_jitter)
+args = parser.parse_args()
+
+debug = False
+if args.debug:
+	print("debug turned on")
+	debug = True
+
+config = loadConfig(args.config)
+max_workers = args.max_workers or config.get('max_workers', default_max_workers)
+max_per_account = args.max_per_account or config.get('max_per_account', default_max_per_account)
+
+# Weewx (once for all of the sites), only if it is configured - None if it isn't, or can't be reached
+def openWeewx(config):
+	if not config.get('weewx'):
+		return None
+	try:
+		from Weewx.weewx import WeewxInfo
+		weewx = config['weewx']
+		return WeewxInfo(weewx.get('user'), weewx.get('password'), weewx.get('host'), weewx.get('database'), sqlite_file=weewx.get('sqlite_file'))
+	except:
+		print('An issue connecting to Weewx - carrying on without temperatures')
+		return None
+
+# A day's (timestamp, temp) pairs from Weewx in one query, None without Weewx or if it can't be reached
+def dayTemps(weather_info, date):
+	day_temps = None
+	if weather_info is not None:
+		try:
+			day_temps = weather_info.getOutsideTemps(*dayBounds(date))
+		except:
+			day_temps = None
+		DEBUG('outside temps %s == %s' % (date, len(day_temps) if day_temps is not None else None))
+	return day_temps
+
+# One poll of all the sites, returns {site name: exception} for the failures
+def pollOnce(poller, weather_info):
+	# each sample gets the temperature nearest to it
+	return poller.poll(temps=dayTemps(weather_info, datetime.date.today().strftime('%Y-%m-%d')))
+
+# The day before's outputs, for the sites they haven't been sent for yet, returns {site name: exception} for the failures
+def addOutputs(poller, weather_info):
+	output_day = outputDay()
+	if not poller.outputsDue(output_day):
+		return {}
+	output_temps = dayTemps(weather_info, output_day)
+	return poller.addOutputs([temp for (timestamp, temp) in output_temps] if output_temps is not None else None, output_day)
+
+weather_info = openWeewx(config)
+with Poller(config['sites'], max_workers, max_per_account, args.cursor_file, debug, args.outbox_file, args.slot_index_file) as poller:
+	if not args.daemon:
+		failures = pollOnce(poller, weather_info)
+		if args.add_output:
+			failures.update(addOutputs(poller, weather_info))
+	else:
+		state = {'weather_info':weather_info}
+
+		def cycle():
+			failures = pollOnce(poller, state['weather_info'])
+			if failures:
+				print('%d site(s) failed: %s' % (len(failures), ', '.join(sorted(failures))))
+
+		# its own job, once a local day rather than every cycle - the sites that failed go again after the next cycle
+		def daily():
+			failures = addOutputs(poller, state['weather_info'])
+			if failures:
+				raise IOError('outputs for %d site(s) failed: %s' % (len(failures), ', '.join(sorted(failures))))
+
+		# the sites and Weewx settings are reloaded, the other settings stay as they were started with
+		def reload():
+			new_config = loadConfig(args.config)
+			poller.sites = list(new_config['sites'])
+			if state['weather_info'] is not None:
+				state['weather_info'].close()
+			state['weather_info'] = openWeewx(new_config)
+			print('reloaded %s - %d site(s)' % (args.config, len(poller.sites)))
+
+		daemon = Daemon(cycle, reload, Scheduler(jitter=args.jitter), daily if args.add_output else None)
+		daemon.installSignalHandlers()
+		daemon.run()
+		failures = None
+		weather_info = state['weather_info']
+if weather_info is not None:
+	weather_info.close()
+
+if failures:
+	sys.exit(2)
+
+# END OF FILE
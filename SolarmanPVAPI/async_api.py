@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# asyncio version of SolarmanPVAPI (python 3 only), with the same methods as coroutines, for one
+# process polling many plants without a thread each.  It shares the token cache, response cache,
+# retry policy and circuit breakers with SolarmanPVAPI, and its connections come from an
+# AsyncHTTPClient that can be shared (along with its connection limits) by many plants.
+
+import json
+import asyncio
+import weakref
+import datetime
+from urllib.parse import urlparse
+from util import DEBUG
+import SolarmanPVAPI.solarmanpv_api as solarmanpv_api
+from SolarmanPVAPI.solarmanpv_api import default_perpage
+from SolarmanPVAPI.token_cache import TokenCache, default_token_cache_file
+from SolarmanPVAPI.records import PowerSample, InverterSample
+from SolarmanPVAPI.exceptions import SolarmanPVAPIError, SolarmanPVConnectionError, SolarmanPVTimeout, SolarmanPVCircuitOpen
+from SolarmanPVAPI.resilience import RetryPolicy, circuitBreakerFor
+from SolarmanPVAPI.response_cache import CachedResponse, ResponseCache, sharedResponseCache, default_response_cache_file
+from async_http import AsyncHTTPClient, AsyncHTTPError
+
+# {event loop: {client_id: asyncio.Lock}} - the plants polled from one loop on the same client_id
+# take turns at getting a token, so only the first of them fetches one (an asyncio.Lock belongs to
+# the loop it is first used on, hence one set per loop)
+_refresh_locks = weakref.WeakKeyDictionary()
+
+def refreshLock(client_id):
+	locks = _refresh_locks.setdefault(asyncio.get_running_loop(), {})
+	return locks.setdefault(client_id, asyncio.Lock())
+
+class AsyncSolarmanPVAPI:
+	# As SolarmanPVAPI, but connect() has to be awaited before the first request (or use "async with")
+	# If client is None an AsyncHTTPClient is created (and owned) by this object
+	# timeout is the deadline for each attempt at a request, asyncio.TimeoutError is never raised -
+	# a request that runs out of time is retried (and raises SolarmanPVTimeout) as SolarmanPVAPI does
+	def __init__(self, client_id, client_secret, plant_id, client=None, token_cache_file=default_token_cache_file,
+			response_cache_file=default_response_cache_file, retry_policy=None, timeout=7):
+		self.__client_id = client_id
+		self.__client_secret = client_secret
+		self.__plant_id = plant_id
+		self.__auth_headers = {}
+		self.__timeout = timeout
+		self.connected = False
+		self.debug = False
+
+		if client is None:
+			self.__client = AsyncHTTPClient(timeout=timeout)
+			self.__owns_client = True
+		else:
+			self.__client = client
+			self.__owns_client = False
+
+		if retry_policy is None:
+			retry_policy = RetryPolicy()
+		self.__retry_policy = retry_policy
+
+		if response_cache_file is not None:
+			self.__response_cache = sharedResponseCache(response_cache_file)
+		else:
+			self.__response_cache = None
+
+		if token_cache_file is not None:
+			self.__token_cache = TokenCache(token_cache_file)
+		else:
+			self.__token_cache = None
+
+	def setDebug(self, debug):
+		self.debug = debug
+
+	def getClient(self):
+		return self.__client
+
+	def getConnectionStats(self):
+		return self.__client.stats()
+
+	def getResilienceStats(self):
+		return {'retry':self.__retry_policy.stats(), 'circuit_breaker':circuitBreakerFor(urlparse(solarmanpv_api.solarman_pv_api_base).netloc).stats()}
+
+	async def close(self):
+		if self.__owns_client:
+			await self.__client.close()
+
+	async def __aenter__(self):
+		await self.connect()
+		return self
+
+	async def __aexit__(self, exc_type, exc_value, traceback):
+		await self.close()
+
+	# The token and response caches do file I/O (and wait on file locks), run them off the event loop
+	async def __inExecutor(self, function, *args):
+		return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+	# GET with retries for connection failures and timeouts, failing fast whilst the host's circuit
+	# breaker is open - as SolarmanPVAPI.__requests_get()
+	async def __get(self, url, timeout=None, headers=None, params=None):
+		if timeout is None:
+			timeout = self.__timeout
+		breaker = circuitBreakerFor(urlparse(url).netloc)
+
+		attempts = 0
+		while True:
+			if not breaker.allow():
+				raise SolarmanPVCircuitOpen('%s is failing, not trying again for %ds' % (breaker.host, breaker.retryAfter()))
+			attempts += 1
+			try:
+				response = await self.__client.get(url, params, headers, timeout)
+			except asyncio.TimeoutError:
+				error = SolarmanPVTimeout('request timed out after %ss' % (timeout))
+			except (AsyncHTTPError, OSError) as e:
+				error = SolarmanPVConnectionError('connection failed - %s' % (e))
+			except BaseException:
+				# cancelled (or an outer deadline) - no outcome to record, but don't leave a half open
+				# breaker waiting for this request as its trial
+				breaker.releaseTrial()
+				raise
+			else:
+				if response.status >= 500:
+					breaker.recordFailure()
+				else:
+					breaker.recordSuccess()
+				return response
+
+			breaker.recordFailure()
+			if not self.__retry_policy.allowRetry(attempts):
+				print('%s: %s (giving up after %d attempt(s))' % (self.__class__.__name__, error, attempts))
+				raise error
+			delay = self.__retry_policy.delay(attempts - 1)
+			if self.debug:
+				DEBUG('%s - retrying in %.1fs' % (error, delay))
+			await asyncio.sleep(delay)
+
+	# Get a new access token from the API, returns {'uid', 'token', 'expires_in'} or None
+	async def __fetchToken(self):
+		url = solarmanpv_api.solarman_pv_api_base + '/oauth2/accessToken'
+		params = {'client_id':self.__client_id, 'client_secret':self.__client_secret, 'grant_type':'client_credentials'}
+		try:
+			response = await self.__get(url, 15, params=params)
+			data = response.json()['data']
+			return {'uid':data['uid'], 'token':data['access_token'], 'expires_in':data.get('expires_in')}
+		except SolarmanPVAPIError as e:
+			print('%s: __fetchToken(): %s' % (self.__class__.__name__, e))
+		except (ValueError, KeyError, TypeError) as e:
+			print('%s: __fetchToken(): bad response - %s' % (self.__class__.__name__, e))
+		return None
+
+	# Get the authorisation token required for subsequent requests, from the token cache if there is
+	# a valid one in there.  stale_token is a token the API has just rejected.  As SolarmanPVAPI, the
+	# refresh goes through TokenCache.getOrRefresh() so that only one process refreshes a client_id's
+	# token, and refreshLock() does the same for the coroutines in this one.
+	async def connect(self, stale_token=None):
+		if self.__token_cache is None:
+			token = await self.__fetchToken()
+		else:
+			loop = asyncio.get_running_loop()
+			# getOrRefresh() runs in a worker thread and calls this (holding the file lock) to have the
+			# token fetched on the event loop
+			def refresh():
+				return asyncio.run_coroutine_threadsafe(self.__fetchToken(), loop).result()
+			async with refreshLock(self.__client_id):
+				token = await self.__inExecutor(self.__token_cache.getOrRefresh, self.__client_id, refresh, stale_token)
+		if token is None:
+			self.connected = False
+			return False
+
+		self.__auth_headers = {'uid':token['uid'], 'token':token['token']}
+		self.connected = True
+		return True
+
+	def __tokenRejected(self, response, payload):
+		if response.status in (401, 403):
+			return True
+		if isinstance(payload, dict) and 'data' not in payload:
+			message = str(payload.get('msg', payload.get('message', ''))).lower()
+			return 'token' in message
+		return False
+
+	def __decode(self, response):
+		try:
+			return response.json()
+		except ValueError:
+			return None
+
+	# GET with the auth headers, returns (response, payload) - as SolarmanPVAPI.__authorisedGet()
+	async def __authorisedGet(self, url, timeout, params, cache_date=None):
+		if not self.connected:
+			await self.connect()
+
+		cache_key = None
+		if self.__response_cache is not None and cache_date is not None:
+			cache_key = ResponseCache.makeKey(url, params)
+			body = await self.__inExecutor(self.__response_cache.get, cache_key)
+			if body is not None:
+				try:
+					return (CachedResponse(url, body), json.loads(body))
+				except ValueError:
+					pass
+
+		response = await self.__get(url, timeout, self.__auth_headers, params)
+		payload = self.__decode(response)
+		if self.__tokenRejected(response, payload):
+			if self.debug:
+				DEBUG('access token rejected - getting a new one')
+			stale_token = self.__auth_headers.get('token')
+			if self.__token_cache is not None:
+				await self.__inExecutor(self.__token_cache.invalidate, self.__client_id, stale_token)
+			if await self.connect(stale_token):
+				response = await self.__get(url, timeout, self.__auth_headers, params)
+				payload = self.__decode(response)
+
+		if cache_key is not None and response.status == 200 and isinstance(payload, dict) and 'data' in payload:
+			await self.__inExecutor(self.__response_cache.put, cache_key, response.text, cache_date)
+		return (response, payload)
+
+	# Returns power data as a JSON object, the most recent value as a PowerSample, or (since given)
+	# the PowerSamples newer than since, oldest first
+	async def getPower(self, date_to_retrieve=None, most_recent_value=None, since=None, timeout=40):
+		if date_to_retrieve is None:
+			date_to_retrieve = datetime.date.today().strftime('%Y-%m-%d')
+
+		url = solarmanpv_api.solarman_pv_api_base + '/plant/power'
+		params = {'plant_id':self.__plant_id, 'date':date_to_retrieve, 'timezone_id':'Australia/Canberra'}
+		(response, payload) = await self.__authorisedGet(url, timeout, params, date_to_retrieve)
+
+		if not isinstance(payload, dict) or ('data' not in payload and 'powers' not in payload):
+			print('%s:getPower(): data or powers not in response: %s' % (self.__class__.__name__, response.text))
+			return None
+
+		if since is None and most_recent_value is not True:
+			return payload
+
+		try:
+			power_data = payload['data']['powers']
+		except (KeyError, TypeError):
+			power_data = None
+		if not isinstance(power_data, list):
+			return [] if since is not None else None
+
+		samples = []
+		for row in power_data:
+			try:
+				samples.append(PowerSample.fromJSON(row))
+			except (KeyError, ValueError, TypeError, IndexError):
+				continue
+		if since is not None:
+			return sorted([sample for sample in samples if sample.timestamp > since], key=lambda sample: sample.timestamp)
+		if not samples:
+			return None
+		return max(samples, key=lambda sample: sample.timestamp)
+
+	# Returns one page of rows from /device/inverter/data (a list), or None on an error
+	async def __getInverterDataPage(self, device_id, start_date, end_date, page, perpage, timeout):
+		url = solarmanpv_api.solarman_pv_api_base + '/device/inverter/data'
+		params = {'device_id':device_id, 'start_date':start_date, 'end_date':end_date, 'timezone_id':'Australia/Canberra', 'page':str(page), 'perpage':str(perpage)}
+		(response, payload) = await self.__authorisedGet(url, timeout, params, end_date)
+
+		try:
+			rows = payload['data']['datas']
+		except (KeyError, TypeError):
+			print('%s: data or datas not in response: %s' % (self.__class__.__name__, response.text.strip()))
+			return None
+		if not isinstance(rows, list):
+			return []
+		return rows
+
+	# Async generator over the InverterSamples for device_id between start_date and end_date (inclusive,
+	# YYYY-MM-DD).  The next page is fetched (as a task) whilst the rows of the current page are consumed.
+	async def iterInverterData(self, device_id, start_date=None, end_date=None, perpage=default_perpage, timeout=40):
+		if start_date is None:
+			start_date = datetime.date.today().strftime('%Y-%m-%d')
+		if end_date is None:
+			end_date = start_date
+
+		if str(device_id).isdigit() is not True:
+			print('device id is not a number')
+			return
+
+		page = 1
+		next_page = asyncio.ensure_future(self.__getInverterDataPage(device_id, start_date, end_date, page, perpage, timeout))
+		try:
+			while next_page is not None:
+				rows = await next_page
+				next_page = None
+				if not rows:
+					if rows is None:
+						print('%s: iterInverterData(): stopped at page %d' % (self.__class__.__name__, page))
+					return
+
+				page += 1
+				if len(rows) >= perpage:
+					next_page = asyncio.ensure_future(self.__getInverterDataPage(device_id, start_date, end_date, page, perpage, timeout))
+
+				for row in rows:
+					try:
+						sample = InverterSample.fromJSON(row)
+					except (KeyError, ValueError, TypeError, IndexError):
+						print('%s: iterInverterData(): skipping row without a valid time: %s' % (self.__class__.__name__, str(row)))
+						continue
+					yield sample
+		finally:
+			# the consumer stopped early (or was cancelled), don't leave the prefetch running
+			if next_page is not None and not next_page.done():
+				next_page.cancel()
+
+	# Returns inverter data as a JSON object, the most recent value as an InverterSample, or (since
+	# given) the InverterSamples newer than since, oldest first
+	async def getInverterData(self, date_to_retrieve=None, device_id=None, most_recent_value=None, since=None, timeout=40):
+		if date_to_retrieve is None:
+			date_to_retrieve = datetime.date.today().strftime('%Y-%m-%d')
+
+		if str(device_id).isdigit() is not True:
+			print('device id is not a number')
+			return None
+
+		if since is not None:
+			samples = [sample async for sample in self.iterInverterData(device_id, date_to_retrieve, date_to_retrieve, timeout=timeout)
+					if sample.timestamp > since]
+			samples.sort(key=lambda sample: sample.timestamp)
+			return samples
+		if most_recent_value is True:
+			# the newest row can be on any page of a long day, so look at them all
+			latest = None
+			async for sample in self.iterInverterData(device_id, date_to_retrieve, date_to_retrieve, timeout=timeout):
+				if latest is None or sample.timestamp > latest.timestamp:
+					latest = sample
+			return latest
+
+		url = solarmanpv_api.solarman_pv_api_base + '/device/inverter/data'
+		params = {'device_id':device_id, 'start_date':date_to_retrieve, 'end_date':date_to_retrieve, 'timezone_id':'Australia/Canberra', 'perpage': str(default_perpage)}
+		(response, payload) = await self.__authorisedGet(url, timeout, params, date_to_retrieve)
+
+		if not isinstance(payload, dict) or ('data' not in payload and 'datas' not in payload):
+			print('%s: data or datas not in response: %s' % (self.__class__.__name__, response.text.strip()))
+			return None
+		return payload
+
+# END OF FILE
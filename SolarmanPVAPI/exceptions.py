@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Errors raised by SolarmanPVAPI (instead of exiting the whole process)
+
+class SolarmanPVAPIError(Exception):
+	# the request failed and won't be retried
+	pass
+
+class SolarmanPVConnectionError(SolarmanPVAPIError):
+	# DNS lookup, connect or SSL failure - retried with backoff
+	pass
+
+class SolarmanPVTimeout(SolarmanPVConnectionError):
+	# no response within the timeout - retried with backoff
+	pass
+
+class SolarmanPVCircuitOpen(SolarmanPVAPIError):
+	# the API host has been failing, so the request wasn't even tried
+	pass
+
+# END OF FILE
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Persisted high-water mark (unix timestamp of the newest sample uploaded) per plant/device, so
+# that each run only hands on the samples that arrived since the last one, and next to it the last
+# day whose end of day output was sent, so that goes once a day.  One cursor file can be shared by
+# cron runs, a daemon and a backfill, so updates are done under a lock file as well.
+
+import os
+import threading
+from util import write_json_atomically, read_json_file
+try:
+	import fcntl
+except ImportError:
+	# not available on Windows - only the in-process lock is used
+	fcntl = None
+
+default_cursor_file = os.path.join(os.path.expanduser('~'), '.solarmanpv_cursor.json')
+
+class FetchCursor:
+	# one lock per cursor file, shared by all the threads in this process
+	__thread_locks = {}
+	__thread_locks_lock = threading.Lock()
+
+	def __init__(self, cursor_file=default_cursor_file):
+		self.cursor_file = os.path.abspath(os.path.expanduser(cursor_file))
+		with FetchCursor.__thread_locks_lock:
+			self.__thread_lock = FetchCursor.__thread_locks.setdefault(self.cursor_file, threading.Lock())
+
+	# Cross-process lock, so that processes sharing the file don't write over each other's cursors
+	def __lockFile(self):
+		if fcntl is None:
+			return None
+		lock_file = open(self.cursor_file + '.lock', 'a')
+		fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+		return lock_file
+
+	def __unlockFile(self, lock_file):
+		if lock_file is not None:
+			fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+			lock_file.close()
+
+	# Returns the timestamp of the last sample handled for key, or None if nothing has been yet
+	def get(self, key):
+		value = read_json_file(self.cursor_file).get(key)
+		if value is None:
+			return None
+		return int(value)
+
+	# Move the high-water mark for key forward to timestamp (it never goes backwards)
+	def advance(self, key, timestamp):
+		timestamp = int(timestamp)
+		with self.__thread_lock:
+			lock_file = self.__lockFile()
+			try:
+				cursors = read_json_file(self.cursor_file)
+				if cursors.get(key) is not None and int(cursors[key]) >= timestamp:
+					return
+				cursors[key] = timestamp
+				write_json_atomically(self.cursor_file, cursors)
+			finally:
+				self.__unlockFile(lock_file)
+
+	# True if the end of day output for day (YYYY-MM-DD), or a later day, has been sent for key
+	def outputDone(self, key, day):
+		last_day = read_json_file(self.cursor_file).get(self.__outputKey(key))
+		return last_day is not None and last_day >= day
+
+	# Record the end of day output for day (YYYY-MM-DD) as sent for key (it never goes backwards)
+	def outputSent(self, key, day):
+		with self.__thread_lock:
+			lock_file = self.__lockFile()
+			try:
+				cursors = read_json_file(self.cursor_file)
+				if cursors.get(self.__outputKey(key)) is not None and cursors[self.__outputKey(key)] >= day:
+					return
+				cursors[self.__outputKey(key)] = day
+				write_json_atomically(self.cursor_file, cursors)
+			finally:
+				self.__unlockFile(lock_file)
+
+	def __outputKey(self, key):
+		return '%s:output' % (key)
+
+	def reset(self, key):
+		with self.__thread_lock:
+			lock_file = self.__lockFile()
+			try:
+				cursors = read_json_file(self.cursor_file)
+				if key in cursors:
+					del cursors[key]
+					write_json_atomically(self.cursor_file, cursors)
+			finally:
+				self.__unlockFile(lock_file)
+
+# END OF FILE
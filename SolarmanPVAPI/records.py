@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Compact records for the samples returned by the SolarmanPV API.  Only the fields that get used are
+# kept (the JSON rows carry dozens more), in __slots__ so there is no per-record __dict__.  The field
+# names are the same as the JSON keys, and sample['power'] style access still works.
+
+import math
+import time
+import datetime
+from util import parse_timestamp, parse_utc_offset
+
+# UTC offset (in seconds) on the end of an API timestamp, None for Z (UTC) or no offset
+def utcOffset(value):
+	zone = value.strip()[16:]
+	if zone[:1] == ':':
+		# the seconds (and any fraction of them)
+		zone = zone[3:].lstrip('.0123456789')
+	return parse_utc_offset(zone)
+
+# A JSON value as a number - the API has been known to send numbers as strings, or null - None if it
+# isn't one
+def number(value):
+	if isinstance(value, bool):
+		return None
+	if isinstance(value, int):
+		return value
+	try:
+		value = float(value)
+	except (TypeError, ValueError):
+		return None
+	if math.isnan(value) or math.isinf(value):
+		return None
+	return int(value) if value.is_integer() else value
+
+class Sample(object):
+	__slots__ = ('timestamp', 'utc_offset')
+
+	def __getitem__(self, key):
+		if key == 'time':
+			return self.isoTime()
+		try:
+			return getattr(self, key)
+		except AttributeError:
+			raise KeyError(key)
+
+	def get(self, key, default=None):
+		try:
+			return self[key]
+		except KeyError:
+			return default
+
+	# The local date and time of the sample - the plant's time when the API gave an offset,
+	# otherwise (UTC times) the local time of this machine
+	def localDateTime(self):
+		if self.utc_offset is None:
+			return datetime.datetime.fromtimestamp(self.timestamp)
+		return datetime.datetime.utcfromtimestamp(self.timestamp + self.utc_offset)
+
+	# date and time as PVoutput wants them, i.e. YYYYMMDD and HH:MM
+	def pvoDate(self):
+		return self.localDateTime().strftime("%Y%m%d")
+
+	def pvoTime(self):
+		return self.localDateTime().strftime("%H:%M")
+
+	# The time as the API gave it, e.g. 2016-10-18T16:45:00+10:00
+	def isoTime(self):
+		if self.utc_offset is None:
+			return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.timestamp))
+		offset = abs(self.utc_offset)
+		return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(self.timestamp + self.utc_offset)) + \
+				'%s%02d:%02d' % ('-' if self.utc_offset < 0 else '+', offset // 3600, (offset % 3600) // 60)
+
+	def __repr__(self):
+		return '%s(%s)' % (self.__class__.__name__, ', '.join(['time=%s' % (self.isoTime())] +
+				['%s=%r' % (field, getattr(self, field)) for field in self.__slots__]))
+
+class PowerSample(Sample):
+	# a /plant/power sample
+	__slots__ = ('power',)
+
+	def __init__(self, timestamp, power, utc_offset=None):
+		self.timestamp = timestamp
+		self.utc_offset = utc_offset
+		self.power = power
+
+	@classmethod
+	def fromJSON(cls, row):
+		return cls(parse_timestamp(row['time']), number(row.get('power')), utcOffset(row['time']))
+
+class InverterSample(Sample):
+	# a /device/inverter/data row
+	__slots__ = ('power', 'vac1', 'iac1', 'fac', 'iPv1', 'iPv2', 'vPv1', 'vPv2')
+
+	def __init__(self, timestamp, power, vac1=None, iac1=None, fac=None, iPv1=None, iPv2=None, vPv1=None, vPv2=None, utc_offset=None):
+		self.timestamp = timestamp
+		self.utc_offset = utc_offset
+		self.power = power
+		self.vac1 = vac1
+		self.iac1 = iac1
+		self.fac = fac
+		self.iPv1 = iPv1
+		self.iPv2 = iPv2
+		self.vPv1 = vPv1
+		self.vPv2 = vPv2
+
+	@classmethod
+	def fromJSON(cls, row):
+		get = row.get
+		return cls(parse_timestamp(row['time']), number(get('power')), get('vac1'), get('iac1'), get('fac'),
+				get('iPv1'), get('iPv2'), get('vPv1'), get('vPv2'), utcOffset(row['time']))
+
+# END OF FILE
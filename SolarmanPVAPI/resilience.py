@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Retry policy (exponential backoff with jitter and a retry budget) and a per host circuit breaker,
+# so that a slow or down SolarmanPV API doesn't take every request out with it.
+
+import time
+import random
+import threading
+from collections import deque
+
+class RetryPolicy:
+	# max_attempts - tries per request (including the first)
+	# base_delay/max_delay - backoff is a random delay between 0 and min(max_delay, base_delay * 2^retry)
+	# budget - at most this many retries in any budget_period seconds, over all requests
+	def __init__(self, max_attempts=3, base_delay=1.0, max_delay=20.0, budget=10, budget_period=60):
+		self.max_attempts = max_attempts
+		self.base_delay = base_delay
+		self.max_delay = max_delay
+		self.budget = budget
+		self.budget_period = budget_period
+		self.retries = 0
+		self.__retry_times = deque()
+		self.__lock = threading.Lock()
+
+	# Seconds to wait before retry number retry (0 based), "full jitter"
+	def delay(self, retry):
+		return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** retry)))
+
+	def __expire(self, now):
+		while self.__retry_times and self.__retry_times[0] <= now - self.budget_period:
+			self.__retry_times.popleft()
+
+	# True (and uses up some of the budget) if a request that has had attempts tries may try again
+	def allowRetry(self, attempts):
+		if attempts >= self.max_attempts:
+			return False
+		with self.__lock:
+			now = time.time()
+			self.__expire(now)
+			if len(self.__retry_times) >= self.budget:
+				return False
+			self.__retry_times.append(now)
+			self.retries += 1
+			return True
+
+	def budgetRemaining(self):
+		with self.__lock:
+			self.__expire(time.time())
+			return self.budget - len(self.__retry_times)
+
+	def stats(self):
+		return {'max_attempts':self.max_attempts, 'retries':self.retries, 'budget':self.budget,
+				'budget_period':self.budget_period, 'budget_remaining':self.budgetRemaining()}
+
+class CircuitBreaker:
+	CLOSED = 'closed'
+	OPEN = 'open'
+	HALF_OPEN = 'half_open'
+
+	# Opens after failure_threshold failures in a row, then fails fast for reset_timeout seconds,
+	# after which one trial request is let through (half open) to see if the host is back.  A trial
+	# that never reports back (e.g. it was cancelled) is given up on after reset_timeout seconds.
+	def __init__(self, host, failure_threshold=5, reset_timeout=60):
+		self.host = host
+		self.failure_threshold = failure_threshold
+		self.reset_timeout = reset_timeout
+		self.state = CircuitBreaker.CLOSED
+		self.failures = 0
+		self.opened_at = None
+		self.times_opened = 0
+		self.__trial_in_progress = False
+		self.__trial_started = None
+		self.__lock = threading.Lock()
+
+	# True if a request may be sent now
+	def allow(self):
+		with self.__lock:
+			if self.state == CircuitBreaker.CLOSED:
+				return True
+			if self.state == CircuitBreaker.OPEN:
+				if time.time() - self.opened_at < self.reset_timeout:
+					return False
+				self.state = CircuitBreaker.HALF_OPEN
+				self.__trial_in_progress = False
+			# half open - only one trial request at a time
+			now = time.time()
+			if self.__trial_in_progress and now - self.__trial_started < self.reset_timeout:
+				return False
+			self.__trial_in_progress = True
+			self.__trial_started = now
+			return True
+
+	def recordSuccess(self):
+		with self.__lock:
+			self.state = CircuitBreaker.CLOSED
+			self.failures = 0
+			self.__trial_in_progress = False
+
+	def recordFailure(self):
+		with self.__lock:
+			self.failures += 1
+			self.__trial_in_progress = False
+			if self.state == CircuitBreaker.HALF_OPEN or self.failures >= self.failure_threshold:
+				if self.state != CircuitBreaker.OPEN:
+					self.times_opened += 1
+				self.state = CircuitBreaker.OPEN
+				self.opened_at = time.time()
+
+	# The request allow() let through ended without an outcome (e.g. it was cancelled), let another one try
+	def releaseTrial(self):
+		with self.__lock:
+			self.__trial_in_progress = False
+
+	# Seconds until a trial request will be let through, 0 if not open
+	def retryAfter(self):
+		with self.__lock:
+			if self.state != CircuitBreaker.OPEN:
+				return 0
+			return max(0, self.reset_timeout - (time.time() - self.opened_at))
+
+	def stats(self):
+		return {'host':self.host, 'state':self.state, 'failures':self.failures,
+				'times_opened':self.times_opened, 'retry_after':self.retryAfter()}
+
+# One breaker per host, shared by every SolarmanPVAPI object in the process
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+
+def circuitBreakerFor(host):
+	with _circuit_breakers_lock:
+		if host not in _circuit_breakers:
+			_circuit_breakers[host] = CircuitBreaker(host)
+		return _circuit_breakers[host]
+
+# END OF FILE
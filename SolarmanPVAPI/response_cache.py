@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Local SQLite cache of SolarmanPV API responses.  Past days never change, so they are kept until
+# they are evicted (least recently used first, once the cache is over its size cap); today's
+# responses are only kept for a short time.
+
+import os
+import time
+import sqlite3
+import datetime
+import threading
+import six
+# put in place for python2 vs python3 compatibility
+if six.PY2:
+	from urllib import urlencode
+elif six.PY3:
+	from urllib.parse import urlencode
+
+default_response_cache_file = os.path.join(os.path.expanduser('~'), '.solarmanpv_response_cache.sqlite')
+# cap on the total size of the cached response bodies
+default_max_bytes = 50 * 1024 * 1024
+# how long a response for today (or a day that may not be over somewhere yet) is kept for, in seconds
+default_today_ttl = 60
+
+# True once date (YYYY-MM-DD) is over in every timezone, with a margin for data that is uploaded late
+def isPastDate(date):
+	return date <= (datetime.datetime.utcnow() - datetime.timedelta(hours=36)).strftime('%Y-%m-%d')
+
+# Stands in for a requests response when the body comes from the cache
+class CachedResponse:
+	status_code = 200
+	encoding = 'utf-8'
+
+	def __init__(self, url, text):
+		self.url = url
+		self.text = text
+
+	def __str__(self):
+		return '<CachedResponse [%d]>' % (self.status_code)
+
+class ResponseCache:
+	def __init__(self, cache_file=default_response_cache_file, max_bytes=default_max_bytes, today_ttl=default_today_ttl):
+		self.cache_file = os.path.abspath(os.path.expanduser(cache_file))
+		self.max_bytes = max_bytes
+		self.today_ttl = today_ttl
+		self.hits = 0
+		self.misses = 0
+		self.__lock = threading.Lock()
+		self.__db = sqlite3.connect(self.cache_file, timeout=30, check_same_thread=False)
+		with self.__lock:
+			self.__db.execute('PRAGMA journal_mode=WAL')
+			self.__db.execute("""
+				create table if not exists responses (
+					key text primary key,
+					body text not null,
+					size integer not null,
+					expires real,
+					last_used real not null
+				)
+			""")
+			self.__db.execute('create index if not exists responses_last_used on responses (last_used)')
+			self.__db.commit()
+
+	# The cache key - the endpoint and its parameters in a normalised (sorted) order
+	@staticmethod
+	def makeKey(endpoint, params):
+		return endpoint + '?' + urlencode(sorted((str(key), str(value)) for (key, value) in params.items()))
+
+	# Returns the cached body for key, or None if there isn't one (or it has expired)
+	def get(self, key):
+		now = time.time()
+		with self.__lock:
+			row = self.__db.execute('select body, expires from responses where key = ?', (key,)).fetchone()
+			if row is None or (row[1] is not None and row[1] <= now):
+				self.misses += 1
+				return None
+			self.__db.execute('update responses set last_used = ? where key = ?', (now, key))
+			self.__db.commit()
+			self.hits += 1
+			return row[0]
+
+	# Cache body for key, for good if last_date (the last day the response covers) is in the past,
+	# otherwise for today_ttl seconds
+	def put(self, key, body, last_date):
+		now = time.time()
+		if isPastDate(last_date):
+			expires = None
+		else:
+			expires = now + self.today_ttl
+		size = len(body)
+		if size > self.max_bytes:
+			return
+		with self.__lock:
+			self.__db.execute('insert or replace into responses (key, body, size, expires, last_used) values (?, ?, ?, ?, ?)',
+					(key, body, size, expires, now))
+			self.__evict(now)
+			self.__db.commit()
+
+	# Drop the expired responses, then the least recently used ones until the cache is under its cap
+	def __evict(self, now):
+		self.__db.execute('delete from responses where expires is not null and expires <= ?', (now,))
+		total = self.__db.execute('select coalesce(sum(size), 0) from responses').fetchone()[0]
+		if total <= self.max_bytes:
+			return
+		evict_keys = []
+		for (key, size) in self.__db.execute('select key, size from responses order by last_used'):
+			if total <= self.max_bytes:
+				break
+			evict_keys.append((key,))
+			total -= size
+		self.__db.executemany('delete from responses where key = ?', evict_keys)
+
+	def stats(self):
+		with self.__lock:
+			(entries, total) = self.__db.execute('select count(*), coalesce(sum(size), 0) from responses').fetchone()
+		return {'entries':entries, 'bytes':total, 'max_bytes':self.max_bytes, 'hits':self.hits, 'misses':self.misses}
+
+	def close(self):
+		with self.__lock:
+			self.__db.close()
+
+# One ResponseCache per file, shared by every SolarmanPVAPI object in the process
+_shared_caches = {}
+_shared_caches_lock = threading.Lock()
+
+def sharedResponseCache(cache_file=default_response_cache_file):
+	cache_file = os.path.abspath(os.path.expanduser(cache_file))
+	with _shared_caches_lock:
+		if cache_file not in _shared_caches:
+			_shared_caches[cache_file] = ResponseCache(cache_file)
+		return _shared_caches[cache_file]
+
+# END OF FILE
@@ -18,8 +18,14 @@
 # Released to the public in 2016.
 
 import requests
+from requests.adapters import HTTPAdapter
+try:
+	from urllib3.util.retry import Retry
+except ImportError:
+	from requests.packages.urllib3.util.retry import Retry
 import datetime
-from util import DEBUG
+import json
+from util import DEBUG, parse_timestamp
 import sys
 import socket
 import six
@@ -29,12 +35,80 @@ if six.PY2:
 elif six.PY3:
 	from urllib.parse import urlparse
 import subprocess
+import threading
+import time
+from SolarmanPVAPI.token_cache import TokenCache, default_token_cache_file
+from SolarmanPVAPI.records import PowerSample, InverterSample
+from SolarmanPVAPI.exceptions import SolarmanPVAPIError, SolarmanPVConnectionError, SolarmanPVTimeout, SolarmanPVCircuitOpen
+from SolarmanPVAPI.resilience import RetryPolicy, circuitBreakerFor
+from SolarmanPVAPI.response_cache import CachedResponse, ResponseCache, sharedResponseCache, default_response_cache_file
 
 solarman_pv_api_base = 'https://openapi.solarmanpv.com/v1'
 
+# connection pool defaults - one pool per host, with this many keep-alive connections kept open
+default_pool_size = 10
+# retries of 5xx responses done by the transport adapter (connection errors and timeouts are
+# retried by the RetryPolicy, with backoff and the circuit breaker)
+default_max_retries = 2
+
+# Build a requests.Session with pooled keep-alive connections and retrying adapters.  The session
+# can be shared between several SolarmanPVAPI objects (e.g. one per plant) to share the pool.
+def createSession(pool_size=default_pool_size, max_retries=default_max_retries, keep_alive=True):
+	retry_args = {'total':max_retries, 'connect':0, 'read':0, 'status':max_retries, 'backoff_factor':0.5,
+			'status_forcelist':(500, 502, 503, 504), 'raise_on_status':False}
+	try:
+		retry = Retry(allowed_methods=frozenset(['GET']), **retry_args)
+	except TypeError:
+		# urllib3 < 1.26
+		retry = Retry(method_whitelist=frozenset(['GET']), **retry_args)
+	adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+	session = requests.Session()
+	session.mount('https://', adapter)
+	session.mount('http://', adapter)
+	if keep_alive is not True:
+		session.headers['Connection'] = 'close'
+	return session
+
+# rows per page asked for from /device/inverter/data
+default_perpage = 500
+
+# Run fn(*args) on a background thread, returns a function that waits for it and returns its result
+# (or raises its exception)
+def runInBackground(fn, *args):
+	result = {}
+	def run():
+		try:
+			result['value'] = fn(*args)
+		except:
+			result['error'] = sys.exc_info()
+	thread = threading.Thread(target=run)
+	thread.daemon = True
+	thread.start()
+	def wait():
+		thread.join()
+		if 'error' in result:
+			six.reraise(*result['error'])
+		return result['value']
+	return wait
+
+# Unix timestamp of a /plant/power sample, the time is in UTC e.g. 2016-10-18T05:00:00Z
+def powerSampleTimestamp(sample):
+	return parse_timestamp(sample['time'])
+
+# Unix timestamp of a /device/inverter/data sample, the time is local time with its UTC offset
+# e.g. 2016-10-18T16:45:00+10:00
+def inverterSampleTimestamp(sample):
+	return parse_timestamp(sample['time'])
+
 class SolarmanPVAPI:
 	# NOTE: You will need to know the plant_id for the "plant" that you want to retrieve data
-	def __init__(self, client_id, client_secret, plant_id):
+	# If session is None a pooled session is created (and owned) by this object
+	# Access tokens are kept in token_cache_file between runs, set it to None to always get a new token
+	# Failed requests raise SolarmanPVAPIError (see exceptions.py) after the retry_policy has been used up
+	# Day data responses are cached in response_cache_file, set it to None to always go to the API
+	def __init__(self, client_id, client_secret, plant_id, session=None, pool_size=default_pool_size,
+			max_retries=default_max_retries, keep_alive=True, token_cache_file=default_token_cache_file,
+			retry_policy=None, response_cache_file=default_response_cache_file):
 		self.__client_id = client_id
 		self.__client_secret = client_secret
 		self.__plant_id = plant_id
@@ -46,136 +120,274 @@ class SolarmanPVAPI:
 		self.__requests_timeout = 7
 		self.debug = True
 
+		if session is None:
+			self.__session = createSession(pool_size, max_retries, keep_alive)
+			self.__owns_session = True
+		else:
+			self.__session = session
+			self.__owns_session = False
+
+		if retry_policy is None:
+			retry_policy = RetryPolicy()
+		self.__retry_policy = retry_policy
+
+		if response_cache_file is not None:
+			self.__response_cache = sharedResponseCache(response_cache_file)
+		else:
+			self.__response_cache = None
+
+		if token_cache_file is not None:
+			self.__token_cache = TokenCache(token_cache_file)
+		else:
+			self.__token_cache = None
+
 		self.connected = self.__connect()
 
 	def setDebug(self, debug):
 		self.debug = debug
 
+	def getSession(self):
+		return self.__session
+
+	# Returns how many requests have been sent over the session and how many of those reused an
+	# already open connection (rather than paying for a new DNS lookup, TCP connect and TLS handshake).
+	# NOTE: if the session is shared, the figures are for all users of the session
+	def getConnectionStats(self):
+		num_requests = num_connections = 0
+		for adapter in set(self.__session.adapters.values()):
+			poolmanager = getattr(adapter, 'poolmanager', None)
+			if poolmanager is None:
+				continue
+			for key in poolmanager.pools.keys():
+				pool = poolmanager.pools.get(key)
+				if pool is None:
+					continue
+				num_requests += pool.num_requests
+				num_connections += pool.num_connections
+		reused = max(num_requests - num_connections, 0)
+		if num_requests > 0:
+			reuse_ratio = float(reused) / num_requests
+		else:
+			reuse_ratio = 0.0
+		return {'requests':num_requests, 'connections':num_connections, 'reused':reused, 'reuse_ratio':reuse_ratio}
+
+	# The retry budget and the state of the API host's circuit breaker
+	def getResilienceStats(self):
+		return {'retry':self.__retry_policy.stats(), 'circuit_breaker':circuitBreakerFor(urlparse(solarman_pv_api_base).netloc).stats()}
+
+	def getResponseCacheStats(self):
+		if self.__response_cache is None:
+			return None
+		return self.__response_cache.stats()
+
+	def close(self):
+		if self.__owns_session:
+			self.__session.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
 	def __str__(self):
 		return self.__class__.__name__ + ' TO BE COMPLETED'
 
-	def __requests_get(self, url, verify=None, timeout=None, headers=None, params=None):
-		if verify is None:
-			verify = self.__requests_verify
-		if timeout is None:
-			timeout = self.__requests_timeout
+	# One attempt at a GET, the requests exceptions are turned into SolarmanPVAPI ones
+	def __send(self, url, verify, timeout, headers, params):
 		url_components = urlparse(url)
-
 		try:
-			if headers is not None and params is not None:
-				response = requests.get(url, verify=verify, timeout=timeout, headers=headers, params=params)
-			elif headers is not None and params is None:
-				response = requests.get(url, verify=verify, timeout=timeout, headers=headers)
-			elif headers is None and params is not None:
-				response = requests.get(url, verify=verify, timeout=timeout, params=params)
-			elif headers is None and params is None:
-				response = requests.get(url, verify=verify, timeout=timeout)
+			return self.__session.get(url, verify=verify, timeout=timeout, headers=headers, params=params)
 		except requests.exceptions.SSLError as e:
 			if self.debug:
 				DEBUG('SSLError - trying again without verify turned on')
 			try:
 				# This could possibly be an issue with the SSL certificate of the API service being expired 
 				# or something, probably harmless, so try without verifying the certificate
-				if headers is not None and params is not None:
-					response = requests.get(url, verify=False, timeout=timeout, headers=headers, params=params)
-				elif headers is not None and params is None:
-					response = requests.get(url, verify=False, timeout=timeout, headers=headers)
-				elif headers is None and params is not None:
-					response = requests.get(url, verify=False, timeout=timeout, params=params)
-				elif headers is None and params is None:
-					response = requests.get(url, verify=False, timeout=timeout)
-				else:
-					print('here - but why')
-					print('headers == %s params == %s' % (str(headers), str(params)))
+				return self.__session.get(url, verify=False, timeout=timeout, headers=headers, params=params)
 			except:
 				print('%s: SSLError (no verify attempt): %s' % (self.__class__.__name__, e))
 				print('url == %s' % (url))
-				subprocess.call("echo | openssl s_client -showcerts -servername %s -connect %s:443 2>/dev/null | openssl x509 -inform pem -noout -text" % (url_components.netloc, url_components.netloc), shell=True)
-				# catastrophic failure
-				sys.exit(2)
+				if self.debug:
+					subprocess.call("echo | openssl s_client -showcerts -servername %s -connect %s:443 2>/dev/null | openssl x509 -inform pem -noout -text" % (url_components.netloc, url_components.netloc), shell=True)
+				raise SolarmanPVConnectionError('SSLError - %s' % (e))
 		except socket.gaierror as e:
-			print('%s: gaierror - %s\n' % (self.__class__.__name__, e))
-			print('attempt to connect to %s\n' % (url_components['netloc']))
-			sys.exit(2)
-			return False
-		except requests.exceptions.ConnectionError as e:
-			print('%s: connection failed - %s\n' % (self.__class__.__name__, e))
-			sys.exit(2)
-			return False
+			raise SolarmanPVConnectionError('gaierror connecting to %s - %s' % (url_components.netloc, e))
 		except requests.exceptions.Timeout as e:
-			print('%s: request timed out - %s\n' % (self.__class__.__name__, e))
-			# Maybe at this point, we could sleep for 5 seconds and then try again? - to be implemented
-			sys.exit(2)
-			return False
+			raise SolarmanPVTimeout('request timed out - %s' % (e))
+		except requests.exceptions.ConnectionError as e:
+			raise SolarmanPVConnectionError('connection failed - %s' % (e))
 		except requests.exceptions.RequestException as e:
-			print('%s: request failed - %s\n' % (self.__class__.__name__, e))
-			sys.exit(2)
-			return False
-		except:
-			print('%s: request failed - %s\n' % (self.__class__.__name__, sys.exc_info()[0]))
-			return False
+			raise SolarmanPVAPIError('request failed - %s' % (e))
+
+	# GET with retries (exponential backoff with jitter, within the retry budget) for connection
+	# failures and timeouts.  Fails fast with SolarmanPVCircuitOpen whilst the host's circuit
+	# breaker is open, i.e. once the API is known to be down.
+	def __requests_get(self, url, verify=None, timeout=None, headers=None, params=None):
+		if verify is None:
+			verify = self.__requests_verify
+		if timeout is None:
+			timeout = self.__requests_timeout
+		breaker = circuitBreakerFor(urlparse(url).netloc)
 
-		return response
+		attempts = 0
+		while True:
+			if not breaker.allow():
+				raise SolarmanPVCircuitOpen('%s is failing, not trying again for %ds' % (breaker.host, breaker.retryAfter()))
+			attempts += 1
+			try:
+				response = self.__send(url, verify, timeout, headers, params)
+			except SolarmanPVConnectionError as e:
+				breaker.recordFailure()
+				if not self.__retry_policy.allowRetry(attempts):
+					print('%s: %s (giving up after %d attempt(s))' % (self.__class__.__name__, e, attempts))
+					raise
+				delay = self.__retry_policy.delay(attempts - 1)
+				if self.debug:
+					DEBUG('%s - retrying in %.1fs' % (e, delay))
+				time.sleep(delay)
+				continue
+			except SolarmanPVAPIError:
+				breaker.recordFailure()
+				raise
+			except BaseException:
+				# interrupted - no outcome, but a half open breaker mustn't wait on this trial for ever
+				breaker.releaseTrial()
+				raise
+
+			# server errors have already been retried by the session's adapter
+			if response.status_code >= 500:
+				breaker.recordFailure()
+			else:
+				breaker.recordSuccess()
+			return response
 
-	def __connect(self):
-		# Connect to the API and get the authorisation token required for subsequent requests
+	# Get a new access token from the API, returns {'uid', 'token', 'expires_in'} or None
+	def __fetchToken(self):
 		url = solarman_pv_api_base + '/oauth2/accessToken?client_id=%s&client_secret=%s&grant_type=client_credentials' % (self.__client_id, self.__client_secret)
-		response = self.__requests_get(url, timeout=15)
-		"""
 		try:
-			response = requests.get(url, verify=self.__requests_verify, timeout=7)
-		except socket.gaierror as e:
-			print('%s: gaierror - %s\n' % (self.__class__.__name__, e))
-			print('attempt to connect to %s\n' % (solarman_pv_api_base))
-			return False
-		except requests.exceptions.ConnectionError as e:
-			print('%s: connection failed - %s\n' % (self.__class__.__name__, e))
-			return False
-		except requests.exceptions.RequestException as e:
-			print('%s: request failed - %s\n' % (self.__class__.__name__, e))
-			return False
-		"""
+			response = self.__requests_get(url, timeout=15)
+		except SolarmanPVAPIError as e:
+			print('%s: __fetchToken(): %s' % (self.__class__.__name__, e))
+			return None
 
 		# Grab the uid (which is just the client_id returned) and access_token and put them in a 
 		# variable for subsequent API calls
 		try:
-			uid = response.json()['data']['uid']
+			data = response.json()['data']
+			uid = data['uid']
+			token = data['access_token']
 		except ValueError as e:
-			print('%s: __connect(): ValueError == %s\n' % (self.__class__.__name__, e))
+			print('%s: __fetchToken(): ValueError == %s\n' % (self.__class__.__name__, e))
 			print('response == %s\n' % response)
-			return False
+			return None
 		except:
-			print("%s: __connect(): Unexpected error: %s" % (self.__class__.__name__, sys.exc_info()[0]))
+			print("%s: __fetchToken(): Unexpected error: %s" % (self.__class__.__name__, sys.exc_info()[0]))
+			return None
+
+		return {'uid':uid, 'token':token, 'expires_in':data.get('expires_in')}
+
+	# Connect to the API and get the authorisation token required for subsequent requests, from the
+	# token cache if there is a valid one in there.  stale_token is a token the API has just rejected.
+	def __connect(self, stale_token=None):
+		if self.__token_cache is not None:
+			token = self.__token_cache.getOrRefresh(self.__client_id, self.__fetchToken, stale_token)
+		else:
+			token = self.__fetchToken()
+		if token is None:
+			self.__authorised = False
 			return False
 
-		token = response.json()['data']['access_token']
-		self.__auth_headers = {'uid':uid, 'token':token}
+		self.__auth_headers = {'uid':token['uid'], 'token':token['token']}
 
 		self.__authorised = True
 		return True
 
-	# Allows sorting and deals with the case of no time value (shouldn't happen, but could do)
-	def __extractTimePowerData(self, json):
-		# Need to convert datetime to unixtime - even though value is UTC and this will change to localtime, 
-		# not an issue as it is only for a relative comparison
-		unix_ts = datetime.datetime.strptime(json['time'], "%Y-%m-%dT%H:%M:%SZ").strftime("%s")
+	# True if the API turned the request down because of the access token (i.e. it has expired)
+	def __tokenRejected(self, response, payload):
+		if response.status_code in (401, 403):
+			return True
+		if isinstance(payload, dict) and 'data' not in payload:
+			message = str(payload.get('msg', payload.get('message', ''))).lower()
+			return 'token' in message
+		return False
+
+	# Decode the JSON body of a response (once), None if it isn't JSON
+	def __decode(self, response):
+		response.encoding = 'utf-8'
 		try:
-			return int(unix_ts)
-		except KeyError:
-			return 0
+			return response.json()
+		except ValueError:
+			return None
+
+	# GET with the auth headers, returns (response, payload) where payload is the decoded JSON body.
+	# If the token is rejected, get a fresh one and try once more.  Raises SolarmanPVAPIError on failure.
+	# cache_date is the last day (YYYY-MM-DD) the response covers, if it is given the response cache is used.
+	def __authorisedGet(self, url, timeout, params, cache_date=None):
+		cache_key = None
+		if self.__response_cache is not None and cache_date is not None:
+			cache_key = ResponseCache.makeKey(url, params)
+			body = self.__response_cache.get(cache_key)
+			if body is not None:
+				try:
+					return (CachedResponse(url, body), json.loads(body))
+				except ValueError:
+					pass
+
+		response = self.__requests_get(url, self.__requests_verify, timeout, self.__auth_headers, params)
+		payload = self.__decode(response)
+		if self.__tokenRejected(response, payload):
+			if self.debug:
+				DEBUG('access token rejected - getting a new one')
+			stale_token = self.__auth_headers.get('token')
+			if self.__token_cache is not None:
+				self.__token_cache.invalidate(self.__client_id, stale_token)
+			if self.__connect(stale_token):
+				response = self.__requests_get(url, self.__requests_verify, timeout, self.__auth_headers, params)
+				payload = self.__decode(response)
+
+		# only good responses are cached
+		if cache_key is not None and response.status_code == 200 and isinstance(payload, dict) and 'data' in payload:
+			self.__response_cache.put(cache_key, response.text, cache_date)
+		return (response, payload)
 
 	# Allows sorting and deals with the case of no time value (shouldn't happen, but could do)
-	def __extractTimeInverterData(self, json):
-		# Need to convert datetime to unixtime - even though value is UTC and this will change to localtime, 
-		# not an issue as it is only for a relative comparison
-		unix_ts = datetime.datetime.strptime(json['time'], "%Y-%m-%dT%H:%M:%S+10:00").strftime("%s")
+	def __extractTimePowerData(self, json):
 		try:
-			return int(unix_ts)
+			return powerSampleTimestamp(json)
 		except KeyError:
 			return 0
 
-	# Returns power data as a JSON object
-	def getPower(self, date_to_retrieve=None, most_recent_value=None):
+	# Only the samples newer than the since timestamp, oldest first.  The filter is done before
+	# sorting, so only the (few) new samples since the last run get sorted.
+	def __samplesSince(self, samples, since, extract_time):
+		if samples is None or isinstance(samples, dict):
+			return []
+		newer_samples = [sample for sample in samples if extract_time(sample) > since]
+		newer_samples.sort(key=extract_time)
+		return newer_samples
+
+	# The newest sample, found with one pass over the list (no sorting), None for an empty list
+	def __latestSample(self, samples, extract_time):
+		latest_sample = None
+		latest_time = None
+		for sample in samples:
+			sample_time = extract_time(sample)
+			if latest_time is None or sample_time > latest_time:
+				latest_sample = sample
+				latest_time = sample_time
+		return latest_sample
+
+	def __debugResponse(self, response):
+		print('response == ' + str(response))
+		print('response.url == ' + response.url)
+		print('response.encoding == ' + response.encoding)
+		print('response.text == ' + response.text)
+
+	# Returns power data as a JSON object, or the most recent value as a PowerSample
+	# If since (a unix timestamp) is given, returns a list of the PowerSamples newer than it, oldest first
+	# Raises SolarmanPVAPIError if the API can't be reached
+	def getPower(self, date_to_retrieve=None, most_recent_value=None, since=None):
 		if date_to_retrieve is None:
 			date_to_retrieve = datetime.date.today().strftime('%Y-%m-%d')
 
@@ -187,59 +399,44 @@ class SolarmanPVAPI:
 		# Get the power data for a specified date or today
 		url = solarman_pv_api_base + '/plant/power'
 		params = {'plant_id':self.__plant_id, 'date':date_to_retrieve, 'timezone_id':'Australia/Canberra'}
-		response = self.__requests_get(url, self.__requests_verify, 40, self.__auth_headers, params)
-		"""
-		try:
-			response = requests.get(url, verify=self.__requests_verify, timeout=7, headers=self.__auth_headers, params=params)
-		except requests.exceptions.ConnectionError as e:
-			print('%s: connection failed - %s' % (self.__class__.__name__, e))
-			return None
-		"""
-			
-		response.encoding = 'utf-8'
+		(response, payload) = self.__authorisedGet(url, 40, params, date_to_retrieve)
 
 		if self.debug:
-			print('response == ' + str(response))
-			print('response.url == ' + response.url)
-			print('response.encoding == ' + response.encoding)
-			print('response.text == ' + response.text)
-			#print response.json()
+			self.__debugResponse(response)
 
 		# validate response
-		if 'data' not in response.json() and 'powers' not in response.json():
+		if not isinstance(payload, dict) or ('data' not in payload and 'powers' not in payload):
 			# should return None, maybe an exception
 			print('%s:getPower(): data or powers not in response: %s' % (self.__class__.__name__, response.text.encode('ascii', 'replace')))
 			return None
 
-		if most_recent_value is True:
-			# Sort the json() (just to be sure), take the last value
-			power_data = response.json()['data']['powers']
-			most_recent_power_data = None
-			if isinstance(power_data, list): 
-				power_data.sort(key=self.__extractTimePowerData, reverse=True)
-				# temporary exception handler to nut out but first thing in the morning
-				try:
-					most_recent_power_data = power_data[0]
-				except IndexError:
-					# Some error in response from the API, i.e. an empty list
-					most_recent_power_data = None
-				except:
-					# Effectively an unhandled error - retaining this debug whilst in beta testing mode
-					print('%s: Exception: getPower(): An error with power_data %s' % (self.__class__.__name__, sys.exc_info()[0]))
-					print(str(power_data))
-					print(power_data)
-			else:
-				# temporary debug - whilst in beta testing mode
-				print('is this an empty response case? debugs below will help diagnose')
-				print('power_data == ' + str(power_data))
-				print('most_recent_power_data == ' + str(most_recent_power_data))
-				print('response.json() == ' + str(response.json()))
-			return most_recent_power_data
-		else:
-			return response.json()
+		if since is None and most_recent_value is not True:
+			return payload
 
-	# Returns inverter data as a JSON object
-	def getInverterData(self, date_to_retrieve=None, device_id=None, most_recent_value=None):
+		try:
+			power_data = payload['data']['powers']
+		except (KeyError, TypeError):
+			power_data = None
+
+		if since is not None:
+			return [PowerSample.fromJSON(row) for row in self.__samplesSince(power_data, since, self.__extractTimePowerData)]
+
+		if not isinstance(power_data, list):
+			# temporary debug - whilst in beta testing mode
+			print('is this an empty response case? debugs below will help diagnose')
+			print('power_data == ' + str(power_data))
+			print('payload == ' + str(payload))
+			return None
+		# take the most recent value, i.e. None for an empty list
+		most_recent_power_data = self.__latestSample(power_data, self.__extractTimePowerData)
+		if most_recent_power_data is None:
+			return None
+		return PowerSample.fromJSON(most_recent_power_data)
+
+	# Returns inverter data as a JSON object, or the most recent value as an InverterSample
+	# If since (a unix timestamp) is given, returns a list of the InverterSamples newer than it, oldest first
+	# Raises SolarmanPVAPIError if the API can't be reached
+	def getInverterData(self, date_to_retrieve=None, device_id=None, most_recent_value=None, since=None):
 		if date_to_retrieve is None:
 			date_to_retrieve = datetime.date.today().strftime('%Y-%m-%d')
 
@@ -247,6 +444,13 @@ class SolarmanPVAPI:
 			print('device id is not a number')
 			return None
 
+		if since is not None:
+			# filter the rows as they are streamed in, all the pages for the day are looked at
+			return self.__samplesSince(self.iterInverterData(device_id, date_to_retrieve, date_to_retrieve), since, lambda sample: sample.timestamp)
+		if most_recent_value is True:
+			# the newest row can be on any page of a long day, so look at them all
+			return self.__latestSample(self.iterInverterData(device_id, date_to_retrieve, date_to_retrieve), lambda sample: sample.timestamp)
+
 		if self.debug:
 			DEBUG('getInverterData()')
 			DEBUG('today == ' + date_to_retrieve)
@@ -254,64 +458,91 @@ class SolarmanPVAPI:
 
 		# Get the power data for a specified date or today
 		url = solarman_pv_api_base + '/device/inverter/data'
-		params = {'device_id':device_id, 'start_date':date_to_retrieve, 'end_date':date_to_retrieve, 'timezone_id':'Australia/Canberra', 'perpage': '500'}
-		response = self.__requests_get(url, self.__requests_verify, 40, self.__auth_headers, params)
-		"""
-		try:
-			response = requests.get(url, verify=self.__requests_verify, timeout=7, headers=self.__auth_headers, params=params)
-		except requests.exceptions.ConnectionError as e:
-			print('%s: connection failed - %s' % (self.__class__.__name__, e))
-			return None
-		except requests.exceptions.ReadTimeout as e:
-			print('%s: connection timed out - %s' % (self.__class__.__name__, e))
-			return None
-		"""
-			
-		response.encoding = 'utf-8'
+		params = {'device_id':device_id, 'start_date':date_to_retrieve, 'end_date':date_to_retrieve, 'timezone_id':'Australia/Canberra', 'perpage': str(default_perpage)}
+		(response, payload) = self.__authorisedGet(url, 40, params, date_to_retrieve)
 
 		if self.debug:
-			print('response == ' + str(response))
-			print('response.url == ' + response.url)
-			print('response.encoding == ' + response.encoding)
-			print('response.text == ' + response.text)
-			#print(response.json())
+			self.__debugResponse(response)
 
 		# validate response
-		try:
-			if 'data' not in response.json() and 'datas' not in response.json():
-				# should return None, maybe an exception
-				print('%s: data or powers not in response: %s' % (self.__class__.__name__, response.text.encode('utf-8').strip()))
-				return None
-		except:
+		if payload is None:
 			print('exception on response - it should be json but is:')
 			print(str(response.text))
 			return None
+		if not isinstance(payload, dict) or ('data' not in payload and 'datas' not in payload):
+			# should return None, maybe an exception
+			print('%s: data or powers not in response: %s' % (self.__class__.__name__, response.text.encode('utf-8').strip()))
+			return None
 
-		if most_recent_value is True:
-			# Sort the json() (just to be sure), take the last value
-			inverter_data = response.json()['data']['datas']
-			most_recent_inverter_data = None
-			if isinstance(inverter_data, list): 
-				inverter_data.sort(key=self.__extractTimeInverterData, reverse=True)
-				# temporary exception handler to nut out but first thing in the morning
+		return payload
+
+	# Returns one page of rows from /device/inverter/data (a list), or None on an error
+	def __getInverterDataPage(self, device_id, start_date, end_date, page, perpage):
+		url = solarman_pv_api_base + '/device/inverter/data'
+		params = {'device_id':device_id, 'start_date':start_date, 'end_date':end_date, 'timezone_id':'Australia/Canberra', 'page':str(page), 'perpage':str(perpage)}
+		(response, payload) = self.__authorisedGet(url, 40, params, end_date)
+
+		if payload is None:
+			print('exception on response - it should be json but is:')
+			print(str(response.text))
+			return None
+
+		try:
+			rows = payload['data']['datas']
+		except (KeyError, TypeError):
+			print('%s: data or datas not in response: %s' % (self.__class__.__name__, response.text.encode('utf-8').strip()))
+			return None
+		if not isinstance(rows, list):
+			# i.e. an empty response
+			return []
+		return rows
+
+	# Generator over the inverter data rows (as InverterSamples) for device_id between start_date and end_date
+	# (inclusive, YYYY-MM-DD), one row at a time.  The pages are walked lazily, with the next page
+	# fetched in the background whilst the rows of the current page are being consumed, so only two
+	# pages are ever held in memory.
+	def iterInverterData(self, device_id, start_date=None, end_date=None, perpage=default_perpage, prefetch=True):
+		if start_date is None:
+			start_date = datetime.date.today().strftime('%Y-%m-%d')
+		if end_date is None:
+			end_date = start_date
+
+		if str(device_id).isdigit() is not True:
+			print('device id is not a number')
+			return
+
+		if self.debug:
+			DEBUG('iterInverterData()')
+			DEBUG('from ' + start_date + ' to ' + end_date)
+
+		page = 1
+		fetch_page = lambda: self.__getInverterDataPage(device_id, start_date, end_date, page, perpage)
+		while True:
+			rows = fetch_page()
+			if not rows:
+				if rows is None:
+					print('%s: iterInverterData(): stopped at page %d' % (self.__class__.__name__, page))
+				return
+
+			more_pages = len(rows) >= perpage
+			page += 1
+			if more_pages:
+				if prefetch:
+					fetch_page = runInBackground(self.__getInverterDataPage, device_id, start_date, end_date, page, perpage)
+				else:
+					fetch_page = lambda: self.__getInverterDataPage(device_id, start_date, end_date, page, perpage)
+
+			for row in rows:
 				try:
-					most_recent_inverter_data = inverter_data[0]
-				except IndexError:
-					# Some error in response from the API, i.e. an empty list
-					most_recent_inverter_data = None
-				except:
-					# Effectively an unhandled error - retaining this debug whilst in beta testing mode
-					print('%s: Exception: getInverterData(): An error with inverter_data %s' % (self.__class__.__name__, sys.exc_info()[0]))
-					print(str(inverter_data))
-					print(inverter_data)
-			else:
-				# temporary debug - whilst in beta testing mode
-				print('is this an empty response case? debugs below will help diagnose')
-				print('inverter_data == ' + str(inverter_data))
-				print('most_recent_power_data == ' + str(most_recent_power_data))
-				print('response.json() == ' + str(response.json()))
-			return most_recent_inverter_data
-		else:
-			return response.json()
+					sample = InverterSample.fromJSON(row)
+				except (KeyError, ValueError, TypeError, IndexError):
+					# no (or a bad) time value - shouldn't happen, but could do
+					print('%s: iterInverterData(): skipping row without a valid time: %s' % (self.__class__.__name__, str(row)))
+					continue
+				yield sample
+			rows = None
+
+			if not more_pages:
+				return
 
 # END OF FILE
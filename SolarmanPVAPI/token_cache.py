@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# On disk cache of SolarmanPV API access tokens, so that each (cron) run doesn't need to
+# go back to /oauth2/accessToken.  Tokens are keyed by client_id.
+
+import os
+import time
+import threading
+from util import write_json_atomically, read_json_file
+try:
+	import fcntl
+except ImportError:
+	# not available on Windows - only the in-process lock is used
+	fcntl = None
+
+default_token_cache_file = os.path.join(os.path.expanduser('~'), '.solarmanpv_token_cache.json')
+# renew a token this many seconds before it actually expires
+expiry_margin = 300
+# used when the API doesn't say how long a token is valid for
+default_token_lifetime = 3600
+
+class TokenCache:
+	# one lock per cache file, shared by all the threads in this process
+	__thread_locks = {}
+	__thread_locks_lock = threading.Lock()
+
+	def __init__(self, cache_file=default_token_cache_file):
+		self.cache_file = os.path.abspath(os.path.expanduser(cache_file))
+		with TokenCache.__thread_locks_lock:
+			self.__thread_lock = TokenCache.__thread_locks.setdefault(self.cache_file, threading.RLock())
+
+	def __read(self):
+		return read_json_file(self.cache_file)
+
+	def __write(self, entries):
+		write_json_atomically(self.cache_file, entries)
+
+	def __isValid(self, entry):
+		return isinstance(entry, dict) and 'token' in entry and entry.get('expires_at', 0) - expiry_margin > time.time()
+
+	# Cross-process lock, so that concurrent cron runs only do one refresh between them
+	def __lockFile(self):
+		if fcntl is None:
+			return None
+		lock_file = open(self.cache_file + '.lock', 'a')
+		fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+		return lock_file
+
+	def __unlockFile(self, lock_file):
+		if lock_file is not None:
+			fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+			lock_file.close()
+
+	# Returns the cached {'uid', 'token', 'expires_at'} for client_id, or None if there isn't a valid one
+	def get(self, client_id):
+		entry = self.__read().get(client_id)
+		if self.__isValid(entry):
+			return entry
+		return None
+
+	def put(self, client_id, uid, token, expires_in=None):
+		if expires_in is None:
+			expires_in = default_token_lifetime
+		entry = {'uid':uid, 'token':token, 'expires_at':int(time.time() + int(expires_in))}
+		with self.__thread_lock:
+			lock_file = self.__lockFile()
+			try:
+				entries = self.__read()
+				entries[client_id] = entry
+				self.__write(entries)
+			finally:
+				self.__unlockFile(lock_file)
+		return entry
+
+	# Returns a valid token entry for client_id, calling refresh() to get a new one if needed.
+	# refresh() must return a dict with 'uid', 'token' and (optionally) 'expires_in', or None on failure.
+	# Only one thread/process does the refresh, the others wait and then pick up the new token.
+	# If stale_token is given (i.e. it has just been rejected by the API) it is never returned.
+	def getOrRefresh(self, client_id, refresh, stale_token=None):
+		entry = self.get(client_id)
+		if entry is not None and entry['token'] != stale_token:
+			return entry
+
+		with self.__thread_lock:
+			lock_file = self.__lockFile()
+			try:
+				# check again - somebody else may have refreshed it whilst we were waiting
+				entries = self.__read()
+				entry = entries.get(client_id)
+				if self.__isValid(entry) and entry['token'] != stale_token:
+					return entry
+
+				new_token = refresh()
+				if new_token is None:
+					return None
+				expires_in = new_token.get('expires_in')
+				if expires_in is None:
+					expires_in = default_token_lifetime
+				entry = {'uid':new_token['uid'], 'token':new_token['token'], 'expires_at':int(time.time() + int(expires_in))}
+				entries[client_id] = entry
+				self.__write(entries)
+				return entry
+			finally:
+				self.__unlockFile(lock_file)
+
+	# Drop the cached token for client_id (only if it is still the given token, when one is given)
+	def invalidate(self, client_id, token=None):
+		with self.__thread_lock:
+			lock_file = self.__lockFile()
+			try:
+				entries = self.__read()
+				entry = entries.get(client_id)
+				if entry is None or (token is not None and entry.get('token') != token):
+					return
+				del entries[client_id]
+				self.__write(entries)
+			finally:
+				self.__unlockFile(lock_file)
+
+# END OF FILE
@@ -20,11 +20,18 @@
 import sys
 import argparse
 import datetime
-from util import DEBUG, utc_to_local
-# class for talking to the Solarman PV API
-from SolarmanPVGlobalAPI.solarmanpv_api import SolarmanPVAPI
+from util import DEBUG
+from SolarmanPVAPI.exceptions import SolarmanPVAPIError
+# high-water mark of the samples already uploaded
+from SolarmanPVAPI.fetch_cursor import FetchCursor, default_cursor_file
 # API for talking to the PVoutput inverter
-from PVoutput.pvoutput import PVoutput_Connection
+from PVoutput.pvoutput import PVoutput_Connection, PVoutputError
+# durable queue of statuses waiting to go to pvoutput.org
+from PVoutput.outbox import Outbox, default_outbox_file
+# statuses already uploaded, so they aren't sent again
+from PVoutput.slot_index import SlotIndex, default_slot_index_file
+from Poller.upload import queueStatuses, drainOutbox
+from Poller.daily_summary import summariseDay, outputDay
 
 
 if sys.version_info < (2, 7):
@@ -46,8 +53,13 @@ parser.add_argument("-v", "--version", action="version", version="%(prog)s " + s
 parser.add_argument("--smpv_client_id", help="SolarmanPV API client ID", required=True)
 parser.add_argument("--smpv_client_secret", help="SolarmanPV API client secret", required=True)
 parser.add_argument("--smpv_plant_id", help="ID of the plant (i.e. The solar PV site within SolarmanPV)", required=True)
+parser.add_argument("--smpv_api", help="SolarmanPV API to use (default %(default)s)", choices=['china', 'global'], default='global')
 parser.add_argument("--pvo_key", help="PVoutput API key", required=True)
 parser.add_argument("--pvo_system_id", help="PVoutput system ID", required=True)
+parser.add_argument("--cursor_file", help="File to keep the time of the last uploaded sample in (default %(default)s)", default=default_cursor_file)
+parser.add_argument("--outbox_file", help="File to queue the statuses for PVoutput in until they are uploaded (default %(default)s)", default=default_outbox_file)
+parser.add_argument("--slot_index_file", help="File to keep the status slots already uploaded to PVoutput in (default %(default)s)", default=default_slot_index_file)
+parser.add_argument("--add_output", help="Also upload the end of day output (energy, peak power and time) worked out from the day before's samples, once on the first run after midnight", action="store_true")
 args = parser.parse_args()
 
 if args.debug:
@@ -60,6 +72,12 @@ plant_id = args.smpv_plant_id
 pvo_key = args.pvo_key
 pvo_system_id = args.pvo_system_id
 
+# class for talking to the Solarman PV API - only imported now the arguments are good, and only the one asked for
+if args.smpv_api == 'global':
+	from SolarmanPVGlobalAPI.solarmanpv_api import SolarmanPVAPI
+else:
+	from SolarmanPVAPI.solarmanpv_api import SolarmanPVAPI
+
 # Create the SolarmanAPI object
 smpv = SolarmanPVAPI(client_id, client_secret, plant_id)
 smpv.setDebug(debug)
@@ -67,34 +85,58 @@ if smpv.connected is not True:
 	print('An issue with connection to the SolarmanPV API')
 	sys.exit(1)
 
-power_details = smpv.getPower(datetime.date.today().strftime("%Y-%m-%d"), True)
-if power_details is not None:
-	power = power_details['power']
-	# need to convert date and time value from UTC to local time before uploading to pvoutput.org
-	power_datetime_local = utc_to_local(datetime.datetime.strptime(power_details['time'], "%Y-%m-%dT%H:%M:%SZ"))
-	power_date = power_datetime_local.strftime("%Y%m%d")
-	power_time = power_datetime_local.strftime("%H:%M")
-
-	DEBUG('power == ' + str(power) + ' and power_date == ' + power_date)
-
-	try:
-		# Create connection to pvoutput.org
-		pvout = PVoutput_Connection(pvo_key, pvo_system_id)
-		# update pvoutput - but only if there is a value power value (i.e. > 0)
-
-		# add_output() is for end of day output - therfore the peak power, pear time, etc
-#		pvout.add_output(power_date, generated=power)
-
-		if power > 0:
-			pvout.add_status(power_date, power_time, power_exp=power)
+# Only the samples newer than the last one uploaded are handled, so none are lost between runs
+cursor = FetchCursor(args.cursor_file)
+cursor_key = 'plant:%s' % (plant_id)
+last_uploaded = cursor.get(cursor_key)
+try:
+	if last_uploaded is None:
+		# first run, start from the most recent value
+		power_details = smpv.getPower(datetime.date.today().strftime("%Y-%m-%d"), True)
+		if power_details is not None:
+			power_samples = [power_details]
 		else:
-			DEBUG('no need to update - power %dW' % power)
-	except:
-		print('An error with PVoutput ', sys.exc_info()[0])
-		raise
+			power_samples = None
+	else:
+		power_samples = smpv.getPower(datetime.date.today().strftime("%Y-%m-%d"), since=last_uploaded)
+except SolarmanPVAPIError as e:
+	print('An issue with the SolarmanPV API - %s' % (e))
+	sys.exit(2)
+
+# Create connection to pvoutput.org
+pvout = PVoutput_Connection(pvo_key, pvo_system_id)
+outbox = Outbox(args.outbox_file, slot_index=SlotIndex(args.slot_index_file))
+
+if power_samples is not None:
+	DEBUG('%d new power sample(s) since last upload' % (len(power_samples)))
+	# commit the samples with a power value (i.e. > 0) to the outbox - once they are there the cursor can move past them
+	queueStatuses(outbox, pvo_system_id, power_samples, uploaded=lambda sample: cursor.advance(cursor_key, sample.timestamp))
 else:
 	print('Invalid data from SolarmanPV API - no further action')
 
+# update pvoutput in batches from the outbox - these samples, and any from earlier runs that weren't added
+try:
+	drainOutbox(outbox, pvout)
+except:
+	print('An error with PVoutput ', sys.exc_info()[0])
+	raise
+outbox.close()
+
+# end of day output (generated energy, peak power and its time) worked out from the day before's samples,
+# one add_output() call for the day - on the first run after midnight, later runs find it sent
+output_day = outputDay()
+if args.add_output and not cursor.outputDone(cursor_key, output_day):
+	try:
+		output = summariseDay(smpv.getPower(output_day, since=0) or [])
+		if output is not None:
+			DEBUG('adding output ' + str(output))
+			pvout.add_output(**output)
+		cursor.outputSent(cursor_key, output_day)
+	except SolarmanPVAPIError as e:
+		print('An issue with the SolarmanPV API - %s' % (e))
+	except (PVoutputError, ValueError) as e:
+		print('An error with PVoutput - %s' % (e))
+
 # temporary exit, looking to include voltage and current data - but need to find out why the current day data doesn't come back through the API
 sys.exit(5)
 
@@ -15,56 +15,212 @@
 
 # Developed 2017 by Christopher McAvaney <christopher.mcavaney@gmail.com>
 # Intended for own use, but could be used by anybody who is using Weewx with MySQL database.
+# The Weewx SQLite archive (the default for a Weewx install) can be read instead of MySQL.
 
-import MySQLdb
-from MySQLdb.constants import ER
+import os
+import time
+import threading
+try:
+	from urllib.request import pathname2url
+except ImportError:
+	from urllib import pathname2url
 
-class WeewxInfo:
-	db_cnx = None
+# seconds a temperature read is shared for, so sites on the same station cost one query between them
+default_cache_ttl = 60
+# bytes of the SQLite archive read through mmap rather than read() calls
+default_mmap_size = 64 * 1024 * 1024
+
+# Temperature reads shared by every WeewxInfo in the process, {key: (expires, value)}, and a lock per
+# key so that only one of the readers sharing a key queries the database
+_temp_cache = {}
+_temp_cache_locks = {}
+_temp_cache_lock = threading.Lock()
+
+# The value cached for key if it is less than ttl seconds old, otherwise read() (and cache) it
+def cachedRead(key, ttl, read):
+	with _temp_cache_lock:
+		key_lock = _temp_cache_locks.setdefault(key, threading.Lock())
+	with key_lock:
+		now = time.time()
+		with _temp_cache_lock:
+			entry = _temp_cache.get(key)
+		if entry is not None and entry[0] > now:
+			return entry[1]
+		value = read()
+		with _temp_cache_lock:
+			_temp_cache[key] = (now + ttl, value)
+			# drop what has expired, so a long running process doesn't keep every range it has read
+			for expired_key in [cache_key for (cache_key, cache_entry) in _temp_cache.items() if cache_entry[0] <= now]:
+				del _temp_cache[expired_key]
+				_temp_cache_locks.pop(expired_key, None)
+		return value
+
+class MySQLArchive:
+	# The archive in a MySQL database - MySQLdb is only imported when one is used
+	placeholder = '%s'
 
-	def __init__(self, weewx_user, weewx_password, weewx_host, weewx_database):
-		# connect to database
+	def __init__(self, user, password, host, database):
+		import MySQLdb
+		from MySQLdb.constants import ER, CR
+		self.driver = MySQLdb
+		self.error_codes = ER
+		# errors that mean the connection has gone (e.g. wait_timeout on a long running process), worth reconnecting for
+		self.reconnect_errors = (CR.SERVER_GONE_ERROR, CR.SERVER_LOST, CR.CONNECTION_ERROR, CR.CONN_HOST_ERROR)
+		self.connect_args = {'user':user, 'passwd':password, 'host':host, 'db':database}
+		self.cache_key = ('mysql', host, database)
+
+	def connect(self):
 		try:
-			self.db_cnx = MySQLdb.connect(user=weewx_user, passwd=weewx_password, host=weewx_host, db=weewx_database)
-		except MySQLdb.Error as err:
-			if err.args[0] == ER.ACCESS_DENIED_ERROR:
+			return self.driver.connect(**self.connect_args)
+		except self.driver.Error as err:
+			if err.args[0] == self.error_codes.ACCESS_DENIED_ERROR:
 				print("%s: Something is wrong with your user name or password" % (self.__class__.__name__))
-			elif err.args[0] == ER.BAD_DB_ERROR:
+			elif err.args[0] == self.error_codes.BAD_DB_ERROR:
 				print("%s: Database does not exist" % (self.__class__.__name__))
 			else:
 				print("%s: %s" % (self.__class__.__name__, err))
 				raise
+		return None
 
-	def getCurrentOutsideTemp(self):
-		db_cursor = self.db_cnx.cursor()
+	def isDisconnect(self, err):
+		return isinstance(err, self.driver.OperationalError) and err.args[0] in self.reconnect_errors
+
+class SQLiteArchive:
+	# The archive in a Weewx SQLite file (e.g. /var/lib/weewx/weewx.sdb), opened read-only - Weewx is
+	# the only writer, and a reader can't get in the way of it.  sqlite3 is only imported when one is used.
+	placeholder = '?'
+
+	def __init__(self, archive_file, mmap_size=default_mmap_size):
+		import sqlite3
+		self.driver = sqlite3
+		self.archive_file = os.path.abspath(os.path.expanduser(archive_file))
+		self.mmap_size = mmap_size
+		self.cache_key = ('sqlite', self.archive_file)
+
+	def connect(self):
+		try:
+			db_cnx = self.driver.connect('file:%s?mode=ro' % (pathname2url(self.archive_file)), uri=True, timeout=10, check_same_thread=False)
+		except TypeError:
+			# python 2 - no URI filenames
+			db_cnx = self.driver.connect(self.archive_file, timeout=10, check_same_thread=False)
+			db_cnx.execute('PRAGMA query_only = 1')
+		db_cnx.execute('PRAGMA mmap_size = %d' % (int(self.mmap_size)))
+		return db_cnx
+
+	def isDisconnect(self, err):
+		return False
+
+class WeewxInfo:
+	db_cnx = None
+
+	# The archive is in MySQL (weewx_user, weewx_password, weewx_host, weewx_database), or in the SQLite
+	# file sqlite_file.  The connection is kept open between reads (and reopened if the server has
+	# dropped it), so one WeewxInfo can be used for the life of a daemon.  cache_ttl is how long reads
+	# are shared for (0 to always query).  close() it, or use it in a with statement.
+	def __init__(self, weewx_user=None, weewx_password=None, weewx_host=None, weewx_database=None, cache_ttl=default_cache_ttl,
+			sqlite_file=None):
+		if sqlite_file is not None:
+			self.archive = SQLiteArchive(sqlite_file)
+		else:
+			self.archive = MySQLArchive(weewx_user, weewx_password, weewx_host, weewx_database)
+		self.cache_ttl = cache_ttl
+		self.reconnects = 0
+		self.__lock = threading.Lock()
+		self.db_cnx = self.archive.connect()
+
+	# Run query (with %s placeholders) and return all of its rows, reconnecting (once) if the connection has gone
+	def __query(self, query, params=()):
+		if self.archive.placeholder != '%s':
+			query = query.replace('%s', self.archive.placeholder)
+		with self.__lock:
+			for attempt in range(2):
+				if self.db_cnx is None:
+					self.db_cnx = self.archive.connect()
+					if self.db_cnx is None:
+						raise self.archive.driver.OperationalError('%s: not connected' % (self.__class__.__name__))
+				try:
+					db_cursor = self.db_cnx.cursor()
+					try:
+						db_cursor.execute(query, params)
+						return db_cursor.fetchall()
+					finally:
+						db_cursor.close()
+				except self.archive.driver.Error as err:
+					if attempt > 0 or not self.archive.isDisconnect(err):
+						raise
+					print("%s: connection lost (%s), reconnecting" % (self.__class__.__name__, err))
+					self.reconnects += 1
+					self.__disconnect()
 
+	def __read(self, key, read):
+		if not self.cache_ttl:
+			return read()
+		return cachedRead(self.archive.cache_key + key, self.cache_ttl, read)
+
+	# The queries only use SQL that MySQL and SQLite both understand (the times are worked out here, and
+	# 5.0 / 9 keeps SQLite from doing integer division)
+	def getCurrentOutsideTemp(self):
 		query = """
 			-- o = observations
 			-- within the last 15 minutes
 			select
-				from_unixtime(o.dateTime) day_for_timestamp,
-				round((o.outTemp - 32) * 5/9, 1) last_outTemp
+				o.dateTime,
+				round((o.outTemp - 32) * 5.0 / 9, 1) last_outTemp
 			from
 				archive o
 			where
-				o.dateTime >= (unix_timestamp(now()) - (15 * 60))
+				o.dateTime >= %s
 			order by
 				o.dateTime desc
-			limit 0,1
+			limit 1
+		"""
+
+		def read():
+			rows = self.__query(query, (int(time.time()) - (15 * 60),))
+			if not rows or rows[0][1] is None:
+				return None
+			return float(rows[0][1])
+		return self.__read(('current',), read)
+
+	def getOutsideTemps(self, start_time, end_time):
+		"""
+		The outside temperatures (C) recorded from start_time up to end_time (unix timestamps), as
+		(timestamp, temp) pairs, oldest first - one range query on dateTime, the archive's primary key
+		"""
+		query = """
+			-- o = observations
+			select
+				o.dateTime,
+				round((o.outTemp - 32) * 5.0 / 9, 1) outTemp
+			from
+				archive o
+			where
+				o.dateTime >= %s
+				and o.dateTime < %s
+				and o.outTemp is not null
+			order by
+				o.dateTime
 		"""
 
-		db_cursor.execute(query)
-		data = db_cursor.fetchone()
-		rows = db_cursor.rowcount
-		db_cursor.close()
+		params = (int(start_time), int(end_time))
+		return self.__read(('range',) + params, lambda: [(int(row[0]), float(row[1])) for row in self.__query(query, params)])
+
+	def __disconnect(self):
+		if self.db_cnx is not None:
+			try:
+				self.db_cnx.close()
+			except self.archive.driver.Error:
+				pass
+			self.db_cnx = None
+
+	def close(self):
+		with self.__lock:
+			self.__disconnect()
 
-		temp = None
-		if rows != 0:
-			temp = data[1]
-		
-		return temp
+	def __enter__(self):
+		return self
 
 	def __exit__(self, exc_type, exc_value, traceback):
-		self.db_cnx.close()
+		self.close()
 
 # END OF FILE
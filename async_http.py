@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# A minimal asyncio HTTP/1.1 client (python 3 only) for the async PVoutput and SolarmanPV clients:
+# keep-alive connections pooled per host, a limit on the connections open at once (in total and per
+# host) shared by everything using the same AsyncHTTPClient, and a deadline on each request.  A
+# request that times out or is cancelled closes its connection rather than putting it back.
+
+import ssl
+import json
+import asyncio
+from urllib.parse import urlsplit, urlencode
+
+default_limit = 100            # connections open at the same time, over all hosts
+default_limit_per_host = 10    # connections open at the same time to one host
+default_timeout = 30           # seconds for a whole request (connect, send and read the response)
+
+
+class AsyncHTTPError(Exception):
+	pass
+
+
+class AsyncHTTPResponse:
+	def __init__(self, url, status, reason, headers, body):
+		self.url = url
+		self.status = status
+		self.status_code = status
+		self.reason = reason
+		self.headers = headers
+		self.body = body
+		self.encoding = 'utf-8'
+
+	def read(self):
+		return self.body
+
+	def getheader(self, name, default=None):
+		return self.headers.get(name.lower(), default)
+
+	@property
+	def text(self):
+		return self.body.decode(self.encoding, 'replace')
+
+	def json(self):
+		return json.loads(self.text)
+
+	def __str__(self):
+		return '<AsyncHTTPResponse [%d]>' % (self.status)
+
+
+class _HostPool:
+	# The idle connections to one host, and the semaphore limiting the connections open to it
+	def __init__(self, host, port, use_ssl, limit):
+		self.host = host
+		self.port = port
+		self.use_ssl = use_ssl
+		self.semaphore = asyncio.Semaphore(limit)
+		self.idle = []
+		self.connects = 0
+		self.requests = 0
+
+	async def connect(self):
+		self.connects += 1
+		ssl_context = ssl.create_default_context() if self.use_ssl else None
+		return await asyncio.open_connection(self.host, self.port, ssl=ssl_context)
+
+
+class AsyncHTTPClient:
+	def __init__(self, limit=default_limit, limit_per_host=default_limit_per_host, timeout=default_timeout):
+		self.limit = limit
+		self.limit_per_host = limit_per_host
+		self.timeout = timeout
+		self.__semaphore = asyncio.Semaphore(limit)
+		self.__pools = {}
+
+	def __pool(self, scheme, host, port):
+		key = (scheme, host, port)
+		if key not in self.__pools:
+			self.__pools[key] = _HostPool(host, port, scheme == 'https', self.limit_per_host)
+		return self.__pools[key]
+
+	async def get(self, url, params=None, headers=None, timeout=None):
+		if params:
+			url = url + ('&' if '?' in url else '?') + urlencode(params)
+		return await self.request('GET', url, headers=headers, timeout=timeout)
+
+	async def post(self, url, data=None, headers=None, timeout=None):
+		if isinstance(data, dict):
+			data = urlencode(data)
+		headers = dict(headers or {})
+		headers.setdefault('Content-Type', 'application/x-www-form-urlencoded')
+		return await self.request('POST', url, data, headers, timeout)
+
+	async def request(self, method, url, body=None, headers=None, timeout=None):
+		"""
+		Sends a request and reads the whole response, within timeout seconds (the client's default
+		if None).  Raises asyncio.TimeoutError once the deadline has passed.
+		"""
+		if timeout is None:
+			timeout = self.timeout
+		return await asyncio.wait_for(self.__request(method, url, body, headers or {}), timeout)
+
+	async def __request(self, method, url, body, headers):
+		parts = urlsplit(url)
+		port = parts.port or (443 if parts.scheme == 'https' else 80)
+		pool = self.__pool(parts.scheme, parts.hostname, port)
+		path = parts.path or '/'
+		if parts.query:
+			path += '?' + parts.query
+		if isinstance(body, str):
+			body = body.encode('utf-8')
+
+		lines = ['%s %s HTTP/1.1' % (method, path), 'Host: %s' % (parts.netloc), 'Connection: keep-alive']
+		for (name, value) in headers.items():
+			lines.append('%s: %s' % (name, value))
+		if body is not None:
+			lines.append('Content-Length: %d' % (len(body)))
+		message = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + (body or b'')
+
+		async with self.__semaphore, pool.semaphore:
+			pool.requests += 1
+			while True:
+				reused = bool(pool.idle)
+				if reused:
+					(reader, writer) = pool.idle.pop()
+				else:
+					(reader, writer) = await pool.connect()
+				try:
+					writer.write(message)
+					await writer.drain()
+					(status, reason, response_headers, response_body) = await self.__readResponse(reader, method)
+				except (ConnectionError, asyncio.IncompleteReadError) as e:
+					writer.close()
+					if reused:
+						# the server closed the idle connection, try a new one
+						continue
+					raise AsyncHTTPError('%s %s failed - %s' % (method, url, e))
+				except BaseException:
+					# timed out or cancelled part way through, the connection can't be reused
+					writer.close()
+					raise
+
+				if response_headers.get('connection', '').lower() == 'close':
+					writer.close()
+				else:
+					pool.idle.append((reader, writer))
+				return AsyncHTTPResponse(url, status, reason, response_headers, response_body)
+
+	async def __readResponse(self, reader, method):
+		status_line = await reader.readuntil(b'\r\n')
+		(version, status, reason) = (status_line.decode('latin-1').rstrip('\r\n').split(' ', 2) + [''])[:3]
+		headers = {}
+		while True:
+			line = await reader.readuntil(b'\r\n')
+			if line == b'\r\n':
+				break
+			(name, value) = line.decode('latin-1').split(':', 1)
+			headers[name.strip().lower()] = value.strip()
+
+		if method == 'HEAD' or status in ('204', '304'):
+			body = b''
+		elif headers.get('transfer-encoding', '').lower() == 'chunked':
+			chunks = []
+			while True:
+				size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+				if size == 0:
+					# trailers, up to the blank line
+					while (await reader.readuntil(b'\r\n')) != b'\r\n':
+						pass
+					break
+				chunks.append(await reader.readexactly(size))
+				await reader.readexactly(2)
+			body = b''.join(chunks)
+		elif 'content-length' in headers:
+			body = await reader.readexactly(int(headers['content-length']))
+		else:
+			body = await reader.read()
+			headers['connection'] = 'close'
+		return (int(status), reason, headers, body)
+
+	def stats(self):
+		return dict(('%s://%s:%d' % key, {'requests':pool.requests, 'connects':pool.connects, 'idle':len(pool.idle)})
+				for (key, pool) in self.__pools.items())
+
+	async def close(self):
+		for pool in self.__pools.values():
+			while pool.idle:
+				(reader, writer) = pool.idle.pop()
+				writer.close()
+
+	async def __aenter__(self):
+		return self
+
+	async def __aexit__(self, exc_type, exc_value, traceback):
+		await self.close()
+
+# END OF FILE
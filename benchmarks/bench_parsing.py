@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Micro-benchmark of picking the most recent sample out of a response body:
+#   old - response.json() several times, sort with strptime().strftime("%s") as the key, take [0]
+#   new - decode once, one linear pass using util.parse_timestamp()
+# for a 288 sample (5 minute) /plant/power day and a 500 row /device/inverter/data page.
+#
+# usage: python benchmarks/bench_parsing.py [number of runs]
+
+import os
+import sys
+import json
+import timeit
+import datetime
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from SolarmanPVAPI.solarmanpv_api import SolarmanPVAPI, powerSampleTimestamp, inverterSampleTimestamp
+
+def powerDay():
+	start = datetime.datetime(2016, 10, 17, 14, 0, 0)
+	powers = []
+	for n in range(288):
+		sample_time = start + datetime.timedelta(minutes=5 * n)
+		powers.append({'time':sample_time.strftime("%Y-%m-%dT%H:%M:%SZ"), 'power':n * 10})
+	# the API doesn't promise any order
+	powers.reverse()
+	return json.dumps({'data':{'powers':powers}})
+
+def inverterPage():
+	start = datetime.datetime(2016, 10, 18, 0, 0, 0)
+	datas = []
+	for n in range(500):
+		sample_time = start + datetime.timedelta(minutes=2 * n)
+		row = {'time':sample_time.strftime("%Y-%m-%dT%H:%M:%S+10:00"), 'power':n, 'vac1':240.1, 'iac1':1.5, 'fac':50.0,
+				'iPv1':2.1, 'iPv2':2.2, 'vPv1':310.0, 'vPv2':305.0}
+		# plus the fields that aren't used
+		for field in range(30):
+			row['field%d' % (field)] = field
+		datas.append(row)
+	datas.reverse()
+	return json.dumps({'data':{'datas':datas}})
+
+# As the code was - response.json() called for validation, selection and each debug use
+def oldLatest(body, list_key, time_format):
+	if 'data' not in json.loads(body) and list_key not in json.loads(body):
+		return None
+	samples = json.loads(body)['data'][list_key]
+	samples.sort(key=lambda sample: int(datetime.datetime.strptime(sample['time'], time_format).strftime("%s")), reverse=True)
+	return samples[0]
+
+smpv = SolarmanPVAPI.__new__(SolarmanPVAPI)
+def newLatest(body, list_key, extract_time):
+	payload = json.loads(body)
+	return smpv._SolarmanPVAPI__latestSample(payload['data'][list_key], extract_time)
+
+def bench(name, old, new, runs):
+	old_time = min(timeit.repeat(old, number=runs, repeat=3)) / runs
+	new_time = min(timeit.repeat(new, number=runs, repeat=3)) / runs
+	print('%-28s old %8.3f ms  new %8.3f ms  speed up %5.1fx' % (name, old_time * 1000, new_time * 1000, old_time / new_time))
+
+if __name__ == '__main__':
+	runs = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+	power_body = powerDay()
+	inverter_body = inverterPage()
+	assert oldLatest(power_body, 'powers', "%Y-%m-%dT%H:%M:%SZ") == newLatest(power_body, 'powers', powerSampleTimestamp)
+	assert oldLatest(inverter_body, 'datas', "%Y-%m-%dT%H:%M:%S+10:00") == newLatest(inverter_body, 'datas', inverterSampleTimestamp)
+
+	bench('power day (288 samples)', lambda: oldLatest(power_body, 'powers', "%Y-%m-%dT%H:%M:%SZ"),
+			lambda: newLatest(power_body, 'powers', powerSampleTimestamp), runs)
+	bench('inverter page (500 rows)', lambda: oldLatest(inverter_body, 'datas', "%Y-%m-%dT%H:%M:%S+10:00"),
+			lambda: newLatest(inverter_body, 'datas', inverterSampleTimestamp), runs)
+
+# END OF FILE
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Start up time check for SolarmanPV-logger.py: runs it (and each command's --help) in a new
+# interpreter with python -X importtime, and adds up the time spent importing the modules the
+# program asked for (i.e. after the interpreter's own start up, site and .pth files).  Exits with
+# status 1 if the best of the runs is over the budget, or if a module that should only be imported
+# when it is needed (requests, MySQLdb, NumPy, sqlite3, the SolarmanPV APIs) was imported.  The lazy
+# imports on their own are checked by tests/test_startup.py.
+#
+# usage: python3 benchmarks/bench_startup.py [budget in ms] [number of runs]
+
+import os
+import sys
+import subprocess
+
+# milliseconds - the commands' --help currently take about half of this (importing requests alone takes about as long)
+default_budget = 100
+default_runs = 5
+
+# only needed once a command really runs (or for a big batch, a MySQL archive)
+lazy_modules = ('requests', 'urllib3', 'MySQLdb', 'numpy', 'sqlite3', 'SolarmanPVAPI.solarmanpv_api', 'SolarmanPVGlobalAPI.solarmanpv_api',
+		'SolarmanPVAPI.async_api', 'async_http')
+
+entry_point = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'SolarmanPV-logger.py')
+commands = [[], ['power'], ['inverter'], ['multi'], ['backfill']]
+
+# (milliseconds importing the program's modules, the names of all the modules imported) for one run
+def importTime(arguments):
+	process = subprocess.Popen([sys.executable, '-X', 'importtime', entry_point] + arguments + ['--help'],
+			stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+	(output, errors) = process.communicate()
+	modules = set()
+	program_us = 0
+	after_site = False
+	for line in errors.splitlines():
+		if not line.startswith('import time:') or '|' not in line:
+			continue
+		(self_us, cumulative_us, name) = line[len('import time:'):].split('|')
+		if not cumulative_us.strip().isdigit():
+			# the header line
+			continue
+		modules.add(name.strip())
+		# the modules are listed as they finish, so a top level one is listed after the ones it imported
+		if name.startswith('  '):
+			continue
+		if after_site:
+			program_us += int(cumulative_us)
+		elif name.strip() == 'site':
+			after_site = True
+	return (program_us / 1000.0, modules)
+
+def main():
+	budget = float(sys.argv[1]) if len(sys.argv) > 1 else default_budget
+	runs = int(sys.argv[2]) if len(sys.argv) > 2 else default_runs
+
+	failed = False
+	for arguments in commands:
+		results = [importTime(arguments) for run in range(runs)]
+		best = min(milliseconds for (milliseconds, modules) in results)
+		imported = sorted(set(name for (milliseconds, modules) in results for name in modules if name in lazy_modules))
+		label = ' '.join(['SolarmanPV-logger.py'] + arguments + ['--help'])
+		print('%-45s %7.1fms  (budget %.0fms)%s' % (label, best, budget, '  imported ' + ', '.join(imported) if imported else ''))
+		if best > budget or imported:
+			failed = True
+
+	if failed:
+		print('start up is over budget, or imports modules it should only import when they are needed')
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
+
+# END OF FILE
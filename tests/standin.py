@@ -0,0 +1,99 @@
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# A local HTTP/1.1 server standing in for the SolarmanPV and PVoutput APIs in the tests.  Requests
+# are answered by route(request) functions, keyed on the path without the query string, that return
+# (status, headers, body) - or None once they have written the response themselves.
+
+import json
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+class Request:
+	def __init__(self, handler, body):
+		parts = urlsplit(handler.path)
+		self.handler = handler
+		self.method = handler.command
+		self.path = parts.path
+		self.query = dict((name, values[-1]) for (name, values) in parse_qs(parts.query).items())
+		self.headers = handler.headers
+		self.body = body
+		self.form = dict((name, values[-1]) for (name, values) in parse_qs(body.decode('utf-8')).items())
+		self.client_address = handler.client_address
+
+def jsonResponse(data, status=200):
+	return (status, {'Content-Type':'application/json'}, json.dumps(data).encode('utf-8'))
+
+def textResponse(text, status=200):
+	return (status, {'Content-Type':'text/plain'}, text.encode('utf-8'))
+
+class _Handler(BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+
+	def log_message(self, format, *args):
+		pass
+
+	def __handle(self):
+		length = int(self.headers.get('Content-Length') or 0)
+		request = Request(self, self.rfile.read(length) if length else b'')
+		server = self.server.standin
+		with server.lock:
+			server.requests.append(request)
+			server.connections.add(self.client_address)
+		route = server.routes.get(request.path)
+		if route is None:
+			result = textResponse('not found', 404)
+		else:
+			result = route(request)
+		if result is None:
+			return
+		(status, headers, body) = result
+		self.send_response(status)
+		for (name, value) in headers.items():
+			self.send_header(name, value)
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	do_GET = __handle
+	do_POST = __handle
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+
+class StandInServer:
+	def __init__(self, routes=None):
+		self.routes = dict(routes or {})
+		self.requests = []
+		self.connections = set()
+		self.lock = threading.Lock()
+		self.__server = _ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+		self.__server.standin = self
+		self.port = self.__server.server_port
+		self.netloc = '127.0.0.1:%d' % (self.port)
+		self.url = 'http://' + self.netloc
+		self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+		self.__thread.start()
+
+	def requestsTo(self, path):
+		with self.lock:
+			return [request for request in self.requests if request.path == path]
+
+	def close(self):
+		self.__server.shutdown()
+		self.__server.server_close()
+
+# END OF FILE
@@ -0,0 +1,195 @@
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import json
+import time
+import shutil
+import asyncio
+import tempfile
+import unittest
+from unittest import mock
+import PVoutput.pvoutput as pvoutput
+import SolarmanPVAPI.solarmanpv_api as solarmanpv_api
+from PVoutput.pvoutput import PVoutputError
+from PVoutput.async_pvoutput import AsyncPVoutputConnection
+from SolarmanPVAPI.async_api import AsyncSolarmanPVAPI
+from SolarmanPVAPI.resilience import CircuitBreaker, circuitBreakerFor
+from async_http import AsyncHTTPClient
+from tests.standin import StandInServer, jsonResponse, textResponse
+
+class SolarmanPVStandIn:
+	# Hands out tokens t1, t2, ... and only takes the newest one
+	def __init__(self):
+		self.tokens = 0
+		self.server = StandInServer({
+				'/oauth2/accessToken':self.accessToken,
+				'/plant/power':self.power,
+				})
+
+	def accessToken(self, request):
+		time.sleep(0.05)
+		self.tokens += 1
+		return jsonResponse({'data':{'uid':'uid', 'access_token':'t%d' % (self.tokens), 'expires_in':3600}})
+
+	def power(self, request):
+		if request.headers.get('token') != 't%d' % (self.tokens):
+			return jsonResponse({'msg':'token expired'}, 401)
+		if request.query.get('date') == 'slow':
+			time.sleep(1)
+		return jsonResponse({'data':{'powers':[{'time':'2024-01-01T10:%02d:00+10:00' % (5 * n), 'power':100 * n} for n in range(3)]}})
+
+class AsyncSolarmanPVAPITest(unittest.IsolatedAsyncioTestCase):
+	def setUp(self):
+		self.standin = SolarmanPVStandIn()
+		self.directory = tempfile.mkdtemp()
+		self.token_cache_file = os.path.join(self.directory, 'tokens.json')
+		patcher = mock.patch.object(solarmanpv_api, 'solarman_pv_api_base', self.standin.server.url)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+		# the breakers are per host and live for the whole process - start from a closed one
+		self.breaker = circuitBreakerFor(self.standin.server.netloc)
+		self.breaker.recordSuccess()
+		self.client = AsyncHTTPClient()
+
+	async def asyncTearDown(self):
+		await self.client.close()
+
+	def tearDown(self):
+		self.breaker.reset_timeout = 60
+		self.breaker.recordSuccess()
+		self.standin.server.close()
+		shutil.rmtree(self.directory)
+
+	def api(self, plant_id=1):
+		return AsyncSolarmanPVAPI('client', 'secret', plant_id, self.client, self.token_cache_file, None)
+
+	def cachedToken(self):
+		with open(self.token_cache_file) as f:
+			return json.load(f)['client']['token']
+
+	async def testPlantsShareOneTokenRefresh(self):
+		apis = [self.api(plant_id) for plant_id in range(8)]
+		self.assertEqual(await asyncio.gather(*[api.connect() for api in apis]), [True] * 8)
+		self.assertEqual(self.standin.tokens, 1)
+		self.assertEqual(self.cachedToken(), 't1')
+
+	async def testRejectedTokenReconnects(self):
+		api = self.api()
+		await api.connect()
+		# another process refreshes the token, so the one this client has is rejected
+		self.standin.tokens += 1
+		self.assertEqual(self.standin.tokens, 2)
+
+		sample = await api.getPower('2024-01-01', most_recent_value=True)
+		self.assertEqual(sample.power, 200)
+		self.assertEqual(self.standin.tokens, 3)
+		self.assertEqual(self.cachedToken(), 't3')
+		self.assertEqual([request.headers.get('token') for request in self.standin.server.requestsTo('/plant/power')], ['t1', 't3'])
+
+	async def testCancelledTrialReleasesBreaker(self):
+		api = self.api()
+		await api.connect()
+		self.breaker.reset_timeout = 0.5
+		for failure in range(self.breaker.failure_threshold):
+			self.breaker.recordFailure()
+		self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+		await asyncio.sleep(0.6)
+
+		# the cancelled request was the half open breaker's trial
+		request = asyncio.ensure_future(api.getPower('slow'))
+		await asyncio.sleep(0.1)
+		self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+		request.cancel()
+		with self.assertRaises(asyncio.CancelledError):
+			await request
+
+		sample = await api.getPower('2024-01-01', most_recent_value=True)
+		self.assertEqual(sample.power, 200)
+		self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+class PVoutputStandIn:
+	def __init__(self):
+		self.server = StandInServer({
+				'/service/r2/addstatus.jsp':lambda request: textResponse('OK 200: Added Status'),
+				'/service/r2/addbatchstatus.jsp':self.addBatchStatus,
+				'/service/r1/getstatus.jsp':self.getStatus,
+				'/service/r1/deletestatus.jsp':lambda request: textResponse('Bad request 400: Could not find status', 400),
+				})
+
+	def addBatchStatus(self, request):
+		results = []
+		for row in request.form['data'].split(';'):
+			(date, time) = row.split(',')[:2]
+			# statuses at midnight are "not added"
+			results.append('%s,%s,%d' % (date, time, 0 if time == '00:00' else 1))
+		return textResponse(';'.join(results))
+
+	def getStatus(self, request):
+		if request.query['d'] == '20240102':
+			return textResponse('Bad request 400: No status found', 400)
+		return textResponse('%s,10:00,100,NaN,50,,,,,20.5,;%s,10:05,120,NaN,60,,,,,20.5,' % (request.query['d'], request.query['d']))
+
+class AsyncPVoutputConnectionTest(unittest.IsolatedAsyncioTestCase):
+	def setUp(self):
+		self.standin = PVoutputStandIn()
+		for (name, value) in (('pvo_host', self.standin.server.netloc), ('pvo_https', False)):
+			patcher = mock.patch.object(pvoutput, name, value)
+			patcher.start()
+			self.addCleanup(patcher.stop)
+		self.client = AsyncHTTPClient()
+		# a key of its own, so the rate limit isn't shared with the other tests
+		self.connection = AsyncPVoutputConnection('key-%s' % (self.id()), '1234', self.client)
+
+	async def asyncTearDown(self):
+		await self.connection.close()
+		await self.client.close()
+
+	def tearDown(self):
+		self.standin.server.close()
+
+	async def testAddStatus(self):
+		await self.connection.add_status('20240101', '10:00', energy_exp=100, power_exp=50)
+		await self.connection.add_status('20240101', '10:05', power_exp=60, system_id='5678')
+		requests = self.standin.server.requestsTo('/service/r2/addstatus.jsp')
+		self.assertEqual(requests[0].form, {'d':'20240101', 't':'10:00', 'v1':'100', 'v2':'50'})
+		self.assertEqual(requests[0].headers['X-Pvoutput-SystemId'], '1234')
+		self.assertEqual(requests[1].headers['X-Pvoutput-SystemId'], '5678')
+		# the shared client kept the connection open between them
+		self.assertEqual(self.client.stats()[self.standin.server.url]['connects'], 1)
+
+	async def testAddBatchStatus(self):
+		statuses = [{'date':'20240101', 'time':time, 'power_exp':10} for time in ('00:00', '00:05', '00:10')]
+		failed = await self.connection.add_batch_status(statuses, batch_size=2)
+		self.assertEqual(failed, statuses[:1])
+		self.assertEqual(len(self.standin.server.requestsTo('/service/r2/addbatchstatus.jsp')), 2)
+
+	async def testStatusHistory(self):
+		rows = [row async for row in self.connection.get_status_history('20240101', '20240103')]
+		self.assertEqual([(row.date, row.time, row.power_exp) for row in rows],
+				[('20240101', '10:00', 50), ('20240101', '10:05', 60), ('20240103', '10:00', 50), ('20240103', '10:05', 60)])
+
+	async def testBadRequest(self):
+		with self.assertRaises(ValueError):
+			await self.connection.delete_status('20240101', '10:00')
+
+	async def testConnectionFailed(self):
+		self.standin.server.close()
+		with self.assertRaises((PVoutputError, OSError)):
+			await self.connection.add_status('20240101', '10:00', power_exp=50)
+
+if __name__ == '__main__':
+	unittest.main()
+
+# END OF FILE
@@ -0,0 +1,115 @@
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import asyncio
+import unittest
+from async_http import AsyncHTTPClient
+from tests.standin import StandInServer, textResponse
+
+def chunked(request):
+	handler = request.handler
+	handler.send_response(200)
+	handler.send_header('Content-Type', 'text/plain')
+	handler.send_header('Transfer-Encoding', 'chunked')
+	handler.end_headers()
+	for chunk in (b'hello ', b'chunked ', b'world'):
+		handler.wfile.write(b'%x;name=value\r\n%s\r\n' % (len(chunk), chunk))
+	handler.wfile.write(b'0\r\nX-Trailer: yes\r\n\r\n')
+	handler.wfile.flush()
+	return None
+
+def slow(request):
+	time.sleep(1)
+	return textResponse('too late')
+
+class AsyncHTTPClientTest(unittest.IsolatedAsyncioTestCase):
+	def setUp(self):
+		self.server = StandInServer({
+				'/hello':lambda request: textResponse('hello %s' % (request.query.get('name', request.form.get('name')))),
+				'/chunked':chunked,
+				'/slow':slow,
+				'/close':lambda request: (200, {'Connection':'close'}, b'bye'),
+				})
+		self.client = AsyncHTTPClient(timeout=5)
+
+	async def asyncTearDown(self):
+		await self.client.close()
+
+	def tearDown(self):
+		self.server.close()
+
+	def stats(self):
+		return self.client.stats()[self.server.url]
+
+	async def testKeepAliveReuse(self):
+		for name in ('a', 'b', 'c'):
+			response = await self.client.get(self.server.url + '/hello', {'name':name})
+			self.assertEqual(response.status, 200)
+			self.assertEqual(response.text, 'hello %s' % (name))
+		response = await self.client.post(self.server.url + '/hello', {'name':'d'})
+		self.assertEqual(response.text, 'hello d')
+
+		self.assertEqual(self.stats(), {'requests':4, 'connects':1, 'idle':1})
+		self.assertEqual(len(self.server.connections), 1)
+
+	async def testConnectionClose(self):
+		response = await self.client.get(self.server.url + '/close')
+		self.assertEqual(response.read(), b'bye')
+		self.assertEqual(self.stats()['idle'], 0)
+		await self.client.get(self.server.url + '/hello')
+		self.assertEqual(self.stats()['connects'], 2)
+
+	async def testChunkedBody(self):
+		response = await self.client.get(self.server.url + '/chunked')
+		self.assertEqual(response.read(), b'hello chunked world')
+		# the trailers were read, so the connection is good for the next request
+		response = await self.client.get(self.server.url + '/hello', {'name':'again'})
+		self.assertEqual(response.text, 'hello again')
+		self.assertEqual(self.stats()['connects'], 1)
+
+	async def testTimeoutDropsConnection(self):
+		await self.client.get(self.server.url + '/hello')
+		with self.assertRaises(asyncio.TimeoutError):
+			await self.client.get(self.server.url + '/slow', timeout=0.2)
+		# the connection had a request in flight, it mustn't go back in the pool
+		self.assertEqual(self.stats()['idle'], 0)
+
+		response = await self.client.get(self.server.url + '/hello', {'name':'after'})
+		self.assertEqual(response.text, 'hello after')
+		self.assertEqual(self.stats()['connects'], 2)
+
+	async def testCancellation(self):
+		request = asyncio.ensure_future(self.client.get(self.server.url + '/slow'))
+		await asyncio.sleep(0.2)
+		request.cancel()
+		with self.assertRaises(asyncio.CancelledError):
+			await request
+		self.assertEqual(self.stats()['idle'], 0)
+
+		response = await self.client.get(self.server.url + '/hello', {'name':'after'})
+		self.assertEqual(response.text, 'hello after')
+
+	async def testLimitPerHost(self):
+		client = AsyncHTTPClient(limit_per_host=2)
+		try:
+			await asyncio.gather(*[client.get(self.server.url + '/hello', {'name':n}) for n in range(6)])
+			self.assertEqual(client.stats()[self.server.url]['connects'], 2)
+		finally:
+			await client.close()
+
+if __name__ == '__main__':
+	unittest.main()
+
+# END OF FILE
@@ -0,0 +1,88 @@
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+from Poller.backfill import Backfill
+
+class StandInSite:
+	name = 'test'
+	pvo_system_id = '1234'
+	data_method = 'power'
+
+	def cursorKey(self):
+		return 'test'
+
+class StandInClient:
+	def getPower(self, day, since=0):
+		return [day]
+
+class BatchingPublisher:
+	# holds back days in batches of batch_size, like the outputs in SolarmanPV-backfill.py
+	def __init__(self, batch_size, failing=()):
+		self.batch_size = batch_size
+		self.failing = set(failing)
+		self.waiting = []
+
+	def publish(self, day, samples):
+		self.waiting.append(day)
+		if len(self.waiting) >= self.batch_size:
+			return self.flush()
+		return []
+
+	def flush(self):
+		if self.failing.intersection(self.waiting):
+			raise IOError('not added')
+		days = list(self.waiting)
+		del self.waiting[:]
+		return days
+
+class BackfillTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.backfill = Backfill(StandInClient(), StandInSite(), os.path.join(self.directory, 'checkpoints.json'),
+				max_workers=2, requests_per_minute=6000)
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def testEachDayCheckpointed(self):
+		self.assertEqual(self.backfill.run('2024-01-01', '2024-01-03', lambda day, samples: None), 3)
+		self.assertEqual(self.backfill.lastDayDone(), '2024-01-03')
+		# nothing left to do
+		self.assertEqual(self.backfill.run('2024-01-01', '2024-01-03', lambda day, samples: None), 0)
+
+	def testCheckpointWaitsForTheBatch(self):
+		publisher = BatchingPublisher(3, failing=['2024-01-05'])
+		with self.assertRaises(IOError):
+			self.backfill.run('2024-01-01', '2024-01-05', publisher.publish, flush=publisher.flush)
+		# the first batch went, the part filled one didn't
+		self.assertEqual(self.backfill.lastDayDone(), '2024-01-03')
+
+		publisher = BatchingPublisher(3)
+		self.assertEqual(self.backfill.run('2024-01-01', '2024-01-05', publisher.publish, flush=publisher.flush), 2)
+		self.assertEqual(self.backfill.lastDayDone(), '2024-01-05')
+
+	def testUnacknowledgedDaysAreNotCheckpointed(self):
+		publisher = BatchingPublisher(3)
+		with self.assertRaises(IOError):
+			self.backfill.run('2024-01-01', '2024-01-04', publisher.publish)
+		self.assertEqual(self.backfill.lastDayDone(), '2024-01-03')
+
+if __name__ == '__main__':
+	unittest.main()
+
+# END OF FILE
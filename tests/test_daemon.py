@@ -0,0 +1,50 @@
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+from Poller.daemon import Daemon
+
+class StandInScheduler:
+	# wakes straight away, cycles times in all
+	def __init__(self, cycles):
+		self.wakes = cycles - 1
+
+	def wait(self):
+		self.wakes -= 1
+		return self.wakes >= 0
+
+	def stopped(self):
+		return self.wakes < 0
+
+class DaemonTest(unittest.TestCase):
+	def testDailyJobOncePerDay(self):
+		runs = []
+		daemon = Daemon(lambda: runs.append('cycle'), scheduler=StandInScheduler(3), daily=lambda: runs.append('daily'))
+		daemon.run()
+		self.assertEqual(runs, ['cycle', 'daily', 'cycle', 'cycle'])
+
+	def testFailedDailyJobGoesAgain(self):
+		runs = []
+		def daily():
+			runs.append('daily')
+			if runs.count('daily') == 1:
+				raise IOError('pvoutput.org is down')
+		daemon = Daemon(lambda: runs.append('cycle'), scheduler=StandInScheduler(3), daily=daily)
+		daemon.run()
+		self.assertEqual(runs, ['cycle', 'daily', 'cycle', 'daily', 'cycle'])
+
+if __name__ == '__main__':
+	unittest.main()
+
+# END OF FILE
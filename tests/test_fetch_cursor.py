@@ -0,0 +1,76 @@
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+from SolarmanPVAPI.fetch_cursor import FetchCursor, fcntl
+
+advances = 100
+
+def advanceMany(cursor_file, key):
+	cursor = FetchCursor(cursor_file)
+	for timestamp in range(1, advances + 1):
+		cursor.advance(key, timestamp)
+
+class FetchCursorTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.cursor_file = os.path.join(self.directory, 'cursor.json')
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def testAdvanceNeverGoesBack(self):
+		cursor = FetchCursor(self.cursor_file)
+		self.assertIsNone(cursor.get('plant:1'))
+		cursor.advance('plant:1', 200)
+		cursor.advance('plant:1', 100)
+		self.assertEqual(cursor.get('plant:1'), 200)
+		cursor.reset('plant:1')
+		self.assertIsNone(cursor.get('plant:1'))
+
+	def testOutputDone(self):
+		cursor = FetchCursor(self.cursor_file)
+		cursor.advance('plant:1', 200)
+		self.assertFalse(cursor.outputDone('plant:1', '2024-01-01'))
+		cursor.outputSent('plant:1', '2024-01-02')
+		cursor.outputSent('plant:1', '2024-01-01')
+		self.assertTrue(cursor.outputDone('plant:1', '2024-01-01'))
+		self.assertTrue(cursor.outputDone('plant:1', '2024-01-02'))
+		self.assertFalse(cursor.outputDone('plant:1', '2024-01-03'))
+		# kept apart from the samples' cursor and other plants
+		self.assertEqual(cursor.get('plant:1'), 200)
+		self.assertFalse(cursor.outputDone('plant:2', '2024-01-01'))
+
+	@unittest.skipIf(fcntl is None, 'no file locks on this platform')
+	def testProcessesSharingTheFile(self):
+		keys = ['plant:%d' % (n) for n in range(4)]
+		processes = [multiprocessing.Process(target=advanceMany, args=(self.cursor_file, key)) for key in keys]
+		for process in processes:
+			process.start()
+		for process in processes:
+			process.join()
+			self.assertEqual(process.exitcode, 0)
+
+		# none of them wrote over the others' cursors
+		cursor = FetchCursor(self.cursor_file)
+		self.assertEqual([cursor.get(key) for key in keys], [advances] * len(keys))
+
+if __name__ == '__main__':
+	unittest.main()
+
+# END OF FILE
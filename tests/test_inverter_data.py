@@ -0,0 +1,73 @@
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import shutil
+import tempfile
+import unittest
+import os
+from unittest import mock
+import SolarmanPVAPI.solarmanpv_api as solarmanpv_api
+from SolarmanPVAPI.solarmanpv_api import SolarmanPVAPI, default_perpage
+from SolarmanPVAPI.async_api import AsyncSolarmanPVAPI
+from SolarmanPVAPI.resilience import circuitBreakerFor
+from tests.standin import StandInServer, jsonResponse
+
+# a long day - more rows than fit on one page
+rows = [{'time':'2024-01-01T%02d:%02d:00+10:00' % (n // 60, n % 60), 'power':n} for n in range(700)]
+
+def accessToken(request):
+	return jsonResponse({'data':{'uid':'uid', 'access_token':'token', 'expires_in':3600}})
+
+def inverterData(request):
+	page = int(request.query.get('page', 1))
+	perpage = int(request.query['perpage'])
+	return jsonResponse({'data':{'datas':rows[(page - 1) * perpage:page * perpage]}})
+
+class InverterDataTest(unittest.IsolatedAsyncioTestCase):
+	def setUp(self):
+		self.assertGreater(len(rows), default_perpage)
+		self.server = StandInServer({'/oauth2/accessToken':accessToken, '/device/inverter/data':inverterData})
+		self.directory = tempfile.mkdtemp()
+		self.token_cache_file = os.path.join(self.directory, 'tokens.json')
+		patcher = mock.patch.object(solarmanpv_api, 'solarman_pv_api_base', self.server.url)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+		circuitBreakerFor(self.server.netloc).recordSuccess()
+
+	def tearDown(self):
+		self.server.close()
+		shutil.rmtree(self.directory)
+
+	def testMostRecentValueLooksAtEveryPage(self):
+		api = SolarmanPVAPI('client', 'secret', 1, token_cache_file=self.token_cache_file, response_cache_file=None)
+		api.setDebug(False)
+		try:
+			sample = api.getInverterData('2024-01-01', '42', most_recent_value=True)
+			self.assertEqual(sample.power, 699)
+			samples = api.getInverterData('2024-01-01', '42', since=sample.timestamp - 120)
+			self.assertEqual([sample.power for sample in samples], [698, 699])
+		finally:
+			api.close()
+
+	async def testAsyncMostRecentValueLooksAtEveryPage(self):
+		async with AsyncSolarmanPVAPI('client', 'secret', 1, token_cache_file=self.token_cache_file, response_cache_file=None) as api:
+			sample = await api.getInverterData('2024-01-01', '42', most_recent_value=True)
+			self.assertEqual(sample.power, 699)
+			samples = await api.getInverterData('2024-01-01', '42', since=sample.timestamp - 120)
+			self.assertEqual([sample.power for sample in samples], [698, 699])
+
+if __name__ == '__main__':
+	unittest.main()
+
+# END OF FILE
@@ -0,0 +1,107 @@
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import datetime
+import tempfile
+import unittest
+from PVoutput.pvoutput import PVoutputError
+from PVoutput.outbox import Outbox
+from PVoutput.slot_index import SlotIndex, default_keep_days
+
+class StandInConnection:
+	# add_batch_status() fails outright for statuses at the times in failing, adds the rest
+	def __init__(self, failing=()):
+		self.system_id = '1234'
+		self.failing = set(failing)
+		self.batches = []
+
+	def add_batch_status(self, statuses, system_id=None):
+		self.batches.append([status['time'] for status in statuses])
+		if any(status['time'] in self.failing for status in statuses):
+			raise PVoutputError('pvoutput.org is down')
+		return []
+
+def statuses(*times):
+	return [{'date':'20240101', 'time':time, 'power_exp':100} for time in times]
+
+class OutboxTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.outbox = Outbox(os.path.join(self.directory, 'outbox.sqlite'), base_delay=0, max_attempts=2)
+
+	def tearDown(self):
+		self.outbox.close()
+		shutil.rmtree(self.directory)
+
+	def testDrain(self):
+		self.assertEqual(self.outbox.enqueue('1234', statuses('10:00', '10:05')), 2)
+		result = self.outbox.drain(StandInConnection())
+		self.assertEqual(result, {'sent':2, 'failed':0, 'error':None})
+		self.assertEqual(self.outbox.stats(), {'done':2, 'pending':0, 'given_up':0})
+
+	def testZeroValuesAreKept(self):
+		self.outbox.enqueue('1234', [{'date':'20240101', 'time':'10:00', 'power_exp':10, 'temp':0.0, 'energy_exp':None}])
+		self.assertEqual([status for (row_id, status) in self.outbox.pending('1234')],
+				[{'date':'20240101', 'time':'10:00', 'power_exp':10, 'temp':0.0}])
+
+	def testGivenUpStatusesArePurged(self):
+		self.outbox.enqueue('1234', statuses('10:00'))
+		pvout = StandInConnection(failing=['10:00'])
+		for attempt in range(3):
+			self.outbox.drain(pvout)
+		# not sent again once given up on
+		self.assertEqual(len(pvout.batches), 2)
+		self.assertEqual(self.outbox.stats(), {'done':0, 'pending':0, 'given_up':1})
+
+		self.outbox.enqueue('1234', statuses('10:05'))
+		self.outbox.drain(StandInConnection())
+		# kept for a while after the last attempt
+		self.outbox.purge()
+		self.assertEqual(self.outbox.stats(), {'done':1, 'pending':0, 'given_up':1})
+		self.outbox.purge(given_up_keep_days=0)
+		self.assertEqual(self.outbox.stats(), {'done':1, 'pending':0, 'given_up':0})
+
+class OutboxSlotIndexTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.slot_index = SlotIndex(os.path.join(self.directory, 'slots.sqlite'))
+		self.outbox = Outbox(os.path.join(self.directory, 'outbox.sqlite'), slot_index=self.slot_index)
+
+	def tearDown(self):
+		self.outbox.close()
+		self.slot_index.close()
+		shutil.rmtree(self.directory)
+
+	def testUploadedSlotsAreLeftOut(self):
+		today = datetime.date.today().strftime('%Y%m%d')
+		self.outbox.enqueue('1234', [{'date':today, 'time':'10:00', 'power_exp':100}])
+		self.outbox.drain(StandInConnection())
+		self.assertTrue(self.slot_index.contains('1234', today, '10:00'))
+		# already uploaded, so not queued again even with other values
+		self.assertEqual(self.outbox.enqueue('1234', [{'date':today, 'time':'10:00', 'power_exp':999}]), 0)
+
+	def testDrainPurgesOldSlots(self):
+		old_day = (datetime.date.today() - datetime.timedelta(days=default_keep_days + 1)).strftime('%Y%m%d')
+		today = datetime.date.today().strftime('%Y%m%d')
+		self.slot_index.add('1234', [(old_day, '10:00'), (today, '10:00')])
+		self.outbox.drain(StandInConnection())
+		self.assertEqual(self.slot_index.count('1234', old_day), 0)
+		self.assertEqual(self.slot_index.count('1234', today), 1)
+
+if __name__ == '__main__':
+	unittest.main()
+
+# END OF FILE
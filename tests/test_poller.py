@@ -0,0 +1,77 @@
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+import Poller.poller as poller
+from Poller.poller import Poller, Site
+
+class StandInClient:
+	# getPower() takes delay seconds
+	def __init__(self, delay):
+		self.delay = delay
+
+	def getPower(self, date, latest=False, since=None):
+		time.sleep(self.delay)
+		return []
+
+	def close(self):
+		pass
+
+def site(plant_id):
+	return Site({'name':plant_id, 'smpv_client_id':'client-%s' % (plant_id), 'smpv_client_secret':'secret', 'smpv_plant_id':plant_id,
+			'pvo_key':'key', 'pvo_system_id':plant_id})
+
+class PollTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		delays = {'slow':0.3, 'quick':0}
+		patcher = mock.patch.object(poller, 'createClient', lambda site, session=None, debug=False: StandInClient(delays[site.plant_id]))
+		patcher.start()
+		self.addCleanup(patcher.stop)
+		self.poller = Poller([site('quick'), site('slow')], cursor_file=os.path.join(self.directory, 'cursor.json'),
+				outbox_file=os.path.join(self.directory, 'outbox.sqlite'), slot_index_file=os.path.join(self.directory, 'slots.sqlite'))
+
+	def tearDown(self):
+		self.poller.close()
+		shutil.rmtree(self.directory)
+
+	def testUploadsRunAlongsideEachOther(self):
+		# the quick site's upload only finishes once the slow site's has started
+		slow_started = threading.Event()
+		def publish(site, samples, temp=None, temps=None):
+			if site.name == 'slow':
+				slow_started.set()
+			elif not slow_started.wait(5):
+				raise IOError('uploads ran one after the other')
+		with mock.patch.object(self.poller, 'publish', publish):
+			self.assertEqual(self.poller.poll(date_to_retrieve='2024-01-01'), {})
+
+	def testFailedUploadsAreCollected(self):
+		def publish(site, samples, temp=None, temps=None):
+			if site.name == 'slow':
+				raise IOError('pvoutput.org is down')
+		with mock.patch.object(self.poller, 'publish', publish):
+			failures = self.poller.poll(date_to_retrieve='2024-01-01')
+		self.assertEqual(list(failures), ['slow'])
+
+if __name__ == '__main__':
+	unittest.main()
+
+# END OF FILE
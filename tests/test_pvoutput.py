@@ -0,0 +1,160 @@
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import unittest
+from unittest import mock
+import PVoutput.pvoutput as pvoutput
+from PVoutput.pvoutput import PVoutput_Connection, RateLimit, StatusRow, output_row, status_row, parse_status_history, status_params, status_batch_data
+from PVoutput.async_pvoutput import AsyncPVoutputConnection
+from tests.standin import StandInServer, textResponse
+
+class StandInResponse:
+	def __init__(self, headers):
+		self.headers = headers
+
+	def getheader(self, name, default=None):
+		return self.headers.get(name, default)
+
+def rateLimitHeaders(remaining, limit, reset):
+	return {'X-Rate-Limit-Remaining':str(remaining), 'X-Rate-Limit-Limit':str(limit), 'X-Rate-Limit-Reset':str(reset)}
+
+class StatusDataTest(unittest.TestCase):
+	def testZeroValuesAreSent(self):
+		statuses = [{'date':'20240101', 'time':'10:00', 'power_exp':10, 'temp':0.0},
+				{'date':'20240101', 'time':'10:05', 'energy_exp':0, 'power_exp':0},
+				{'date':'20240101', 'time':'10:10', 'power_exp':20, 'temp':None}]
+		self.assertEqual(status_batch_data(statuses), '20240101,10:00,,10,,,0.0;20240101,10:05,0,0;20240101,10:10,,20')
+		self.assertEqual(status_params('20240101', '10:00', power_exp=0, temp=0.0), {'d':'20240101', 't':'10:00', 'v2':0, 'v5':0.0})
+
+class RateLimitTest(unittest.TestCase):
+	def testTokensUntilExhausted(self):
+		rate_limit = RateLimit(limit=2)
+		self.assertEqual(rate_limit.try_acquire(), 0)
+		self.assertEqual(rate_limit.try_acquire(), 0)
+		# out of tokens with no reset time from pvoutput.org - wait an hour
+		self.assertAlmostEqual(rate_limit.try_acquire(), 3600, delta=5)
+
+	def testUpdateFromHeaders(self):
+		rate_limit = RateLimit(limit=60)
+		reset = time.time() + 600
+		rate_limit.update(StandInResponse(rateLimitHeaders(10, 300, reset)))
+		self.assertEqual(rate_limit.stats(), {'limit':300, 'remaining':10, 'reset':reset, 'waits':0})
+		# a response to a request sent before others took their tokens doesn't give them back
+		rate_limit.try_acquire()
+		rate_limit.update(StandInResponse(rateLimitHeaders(10, 300, reset)))
+		self.assertEqual(rate_limit.remaining, 9)
+		# a new hour does
+		rate_limit.update(StandInResponse(rateLimitHeaders(299, 300, reset + 3600)))
+		self.assertEqual(rate_limit.remaining, 299)
+		# responses without the headers are ignored
+		rate_limit.update(StandInResponse({}))
+		self.assertEqual(rate_limit.remaining, 299)
+
+	def testExhaustedUntilReset(self):
+		rate_limit = RateLimit(limit=60)
+		reset = time.time() + 0.2
+		rate_limit.exhausted(StandInResponse(rateLimitHeaders(0, 60, reset)))
+		self.assertGreater(rate_limit.try_acquire(), 0)
+		time.sleep(0.25)
+		self.assertEqual(rate_limit.try_acquire(), 0)
+		self.assertEqual(rate_limit.remaining, 59)
+
+class RateLimitedConnectionTest(unittest.IsolatedAsyncioTestCase):
+	# pvoutput.org says the limit was exceeded once, and the request goes again after the reset
+	def setUp(self):
+		self.exceeded = 1
+		self.server = StandInServer({'/service/r2/addstatus.jsp':self.addStatus})
+		for (name, value) in (('pvo_host', self.server.netloc), ('pvo_https', False)):
+			patcher = mock.patch.object(pvoutput, name, value)
+			patcher.start()
+			self.addCleanup(patcher.stop)
+
+	def tearDown(self):
+		self.server.close()
+
+	def addStatus(self, request):
+		if self.exceeded:
+			self.exceeded -= 1
+			(status, headers, body) = textResponse('Forbidden 403: Exceeded 60 requests per hour', 403)
+			headers.update(rateLimitHeaders(0, 60, time.time() + 0.3))
+			return (status, headers, body)
+		(status, headers, body) = textResponse('OK 200: Added Status')
+		headers.update(rateLimitHeaders(59, 60, time.time() + 3600))
+		return (status, headers, body)
+
+	async def testWaitsForTheReset(self):
+		async with AsyncPVoutputConnection('key-%s' % (self.id()), '1234') as connection:
+			started = time.time()
+			await connection.add_status('20240101', '10:00', power_exp=50)
+			self.assertGreaterEqual(time.time() - started, 0.2)
+			self.assertEqual(len(self.server.requestsTo('/service/r2/addstatus.jsp')), 2)
+			self.assertEqual(connection.rate_limit_stats()['remaining'], 59)
+			self.assertEqual(connection.rate_limit_stats()['waits'], 1)
+
+class StatusHistoryTest(unittest.TestCase):
+	def testNaNAndEmptyValues(self):
+		self.assertEqual(status_row('20240101,10:00,100,NaN,50.7,45,0.012,,,20.5,NaN'),
+				StatusRow('20240101', '10:00', 100, None, 50, 45, 0.012, None, None, 20.5, None))
+
+	def testShortRows(self):
+		self.assertEqual(status_row('20240101,10:00,100'), StatusRow('20240101', '10:00', 100, *([None] * 8)))
+		self.assertEqual(status_row('20240101,10:00'), StatusRow('20240101', '10:00', *([None] * 9)))
+
+	def testBadValue(self):
+		with self.assertRaises(ValueError):
+			status_row('20240101,10:00,lots')
+
+	def testParseHistory(self):
+		body = b'20240101,10:00,100,NaN,50;20240101,10:05,120,NaN,60; ;'
+		self.assertEqual([(row.time, row.energy_exp, row.power_exp) for row in parse_status_history(body)],
+				[('10:00', 100, 50), ('10:05', 120, 60)])
+		self.assertEqual(list(parse_status_history('')), [])
+
+	def testHistoryFromTheServer(self):
+		def getStatus(request):
+			if request.query['d'] == '20240102':
+				return textResponse('Bad request 400: No status found', 400)
+			return textResponse('%s,10:00,100,NaN,50,,,,,NaN;%s,10:05,120' % (request.query['d'], request.query['d']))
+		server = StandInServer({'/service/r1/getstatus.jsp':getStatus})
+		try:
+			with mock.patch.object(pvoutput, 'pvo_host', server.netloc), mock.patch.object(pvoutput, 'pvo_https', False):
+				connection = PVoutput_Connection('key-%s' % (self.id()), '1234')
+				rows = list(connection.get_status_history('20240101', '20240103'))
+		finally:
+			server.close()
+		self.assertEqual([(row.date, row.time, row.power_exp, row.temp) for row in rows],
+				[('20240101', '10:00', 50, None), ('20240101', '10:05', None, None), ('20240103', '10:00', 50, None), ('20240103', '10:05', None, None)])
+		self.assertEqual([request.query['d'] for request in server.requestsTo('/service/r1/getstatus.jsp')], ['20240101', '20240102', '20240103'])
+
+class OutputRowTest(unittest.TestCase):
+	def testRow(self):
+		self.assertEqual(output_row({'date':'20240101', 'generated':12000}), '20240101,12000')
+		self.assertEqual(output_row({'date':'20240101', 'generated':0, 'peak_power':3500, 'peak_time':'12:05', 'condition':'Fine',
+				'min_temp':0.0, 'max_temp':25}), '20240101,0,,3500,12:05,Fine,0.0,25')
+
+	def testRejected(self):
+		good = {'date':'20240101', 'generated':12000}
+		for (field, value) in (('date', '2024-01-01'), ('generated', None), ('generated', -1), ('exported', -5),
+				('peak_time', '25:00'), ('peak_time', 'noon'), ('peak_time', '12'), ('condition', 'Sunny'), ('condition', 'fine'),
+				('comments', 'new panels, cleaned'), ('comments', 'a;b')):
+			output = dict(good)
+			output[field] = value
+			with self.assertRaises(ValueError, msg='%s=%r' % (field, value)):
+				output_row(output)
+
+if __name__ == '__main__':
+	unittest.main()
+
+# END OF FILE
@@ -0,0 +1,75 @@
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+from PVoutput.slot_index import SlotIndex
+
+class SlotIndexTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.index_file = os.path.join(self.directory, 'slots.sqlite')
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def testSlots(self):
+		with SlotIndex(self.index_file, interval=5) as index:
+			self.assertEqual(index.slot('00:00'), 0)
+			self.assertEqual(index.slot('10:04'), 120)
+			self.assertEqual(index.slot('23:55'), 287)
+
+	def testAddAndContains(self):
+		with SlotIndex(self.index_file) as index:
+			self.assertFalse(index.contains('1234', '20240101', '10:00'))
+			self.assertEqual(index.add('1234', [('20240101', '10:00'), ('20240101', '23:55'), ('20240102', '00:00')]), 2)
+			# nothing new
+			self.assertEqual(index.add('1234', [('20240101', '10:00')]), 0)
+			self.assertTrue(index.contains('1234', '20240101', '10:00'))
+			self.assertTrue(index.contains('1234', '20240101', '23:55'))
+			self.assertFalse(index.contains('1234', '20240101', '10:05'))
+			# systems are kept apart
+			self.assertFalse(index.contains('5678', '20240101', '10:00'))
+			self.assertEqual(index.missing('1234', [{'date':'20240101', 'time':time} for time in ('10:00', '10:05')]),
+					[{'date':'20240101', 'time':'10:05'}])
+
+	def testReloadFromDisk(self):
+		with SlotIndex(self.index_file) as index:
+			index.add('1234', [('20240101', '10:00'), ('20240101', '10:05')])
+		with SlotIndex(self.index_file) as index:
+			self.assertTrue(index.contains('1234', '20240101', '10:00'))
+			self.assertTrue(index.contains('1234', '20240101', '10:05'))
+			self.assertEqual(index.count('1234', '20240101'), 2)
+
+	def testAddsFromAnotherIndexAreKept(self):
+		# e.g. two processes on the same file, each with the day already loaded
+		first = SlotIndex(self.index_file)
+		second = SlotIndex(self.index_file)
+		try:
+			self.assertFalse(first.contains('1234', '20240101', '10:00'))
+			self.assertFalse(second.contains('1234', '20240101', '10:00'))
+			first.add('1234', [('20240101', '10:00')])
+			second.add('1234', [('20240101', '10:05')])
+		finally:
+			first.close()
+			second.close()
+		with SlotIndex(self.index_file) as index:
+			self.assertEqual(index.count('1234', '20240101'), 2)
+
+if __name__ == '__main__':
+	unittest.main()
+
+# END OF FILE
@@ -0,0 +1,69 @@
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# SolarmanPV-logger.py only imports what the chosen command needs - checked on each command's --help,
+# in a new interpreter.  The start up time budget is checked by benchmarks/bench_startup.py.
+
+import os
+import sys
+import unittest
+import subprocess
+
+entry_point = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'SolarmanPV-logger.py')
+
+# only needed once a command really runs - and then only the API flavour asked for, MySQLdb for a
+# MySQL Weewx archive, NumPy for a big batch of days
+lazy_modules = ('MySQLdb', 'numpy', 'sqlite3', 'requests', 'SolarmanPVAPI.solarmanpv_api', 'SolarmanPVGlobalAPI.solarmanpv_api',
+		'SolarmanPVAPI.async_api', 'async_http')
+
+# The names of the modules imported by SolarmanPV-logger.py with arguments
+def importedModules(arguments):
+	process = subprocess.Popen([sys.executable, '-X', 'importtime', entry_point] + arguments,
+			stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+	(output, errors) = process.communicate()
+	if process.returncode != 0:
+		raise AssertionError('%s failed:\n%s' % (' '.join(arguments), errors))
+	modules = set()
+	for line in errors.splitlines():
+		if line.startswith('import time:') and '|' in line:
+			modules.add(line.split('|')[-1].strip())
+	return modules
+
+class LazyImportTest(unittest.TestCase):
+	def assertLazy(self, arguments, also_lazy=()):
+		modules = importedModules(arguments)
+		# make sure importtime output was seen at all
+		self.assertIn('argparse', modules)
+		imported = sorted(name for name in modules if name in lazy_modules + tuple(also_lazy) or name.split('.')[0] in ('MySQLdb', 'numpy'))
+		self.assertEqual(imported, [], 'SolarmanPV-logger.py %s imported %s' % (' '.join(arguments), ', '.join(imported)))
+
+	def testEntryPoint(self):
+		self.assertLazy(['--help'], ('Poller', 'PVoutput', 'SolarmanPVAPI', 'SolarmanPVGlobalAPI', 'Weewx'))
+
+	def testPower(self):
+		self.assertLazy(['power', '--help'])
+
+	def testInverter(self):
+		self.assertLazy(['inverter', '--help'])
+
+	def testMulti(self):
+		self.assertLazy(['multi', '--help'])
+
+	def testBackfill(self):
+		self.assertLazy(['backfill', '--help'])
+
+if __name__ == '__main__':
+	unittest.main()
+
+# END OF FILE
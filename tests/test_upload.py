@@ -0,0 +1,67 @@
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+from SolarmanPVAPI.records import PowerSample, InverterSample, number
+from Poller.upload import samplesToUpload, queueStatuses
+
+def powerRows(*powers):
+	return [{'time':'2024-01-01T10:%02d:00+10:00' % (5 * n), 'power':power} for (n, power) in enumerate(powers)]
+
+class NumberTest(unittest.TestCase):
+	def testNumbers(self):
+		self.assertEqual(number(120), 120)
+		self.assertEqual(number(12.5), 12.5)
+		self.assertEqual(number('120'), 120)
+		self.assertEqual(number('12.5'), 12.5)
+		self.assertIsInstance(number('120.0'), int)
+
+	def testNotNumbers(self):
+		for value in (None, '', 'n/a', 'NaN', float('inf'), True, [], {}):
+			self.assertIsNone(number(value), repr(value))
+
+class SamplesToUploadTest(unittest.TestCase):
+	def testPowerIsCoerced(self):
+		samples = [PowerSample.fromJSON(row) for row in powerRows('150', None, 'n/a', 0)]
+		self.assertEqual([sample.power for sample in samples], [150, None, None, 0])
+		samples = [InverterSample.fromJSON(row) for row in powerRows('7.5', None)]
+		self.assertEqual([sample.power for sample in samples], [7.5, None])
+
+	def testSamplesWithoutPowerAreSkipped(self):
+		samples = [PowerSample.fromJSON(row) for row in powerRows(100, None, 'n/a', 0, '200')]
+		# a sample built by hand, not through fromJSON
+		samples.append(PowerSample(samples[-1].timestamp + 300, 'n/a', 36000))
+		to_upload = samplesToUpload(samples, temp=20.5)
+		self.assertEqual([(status['time'], status['power_exp'], status['temp']) for (sample, status) in to_upload],
+				[('10:00', 100, 20.5), ('10:20', 200, 20.5)])
+
+class QueueStatusesTest(unittest.TestCase):
+	def testCursorAdvancedOnce(self):
+		enqueued = []
+		uploaded = []
+		class StandInOutbox:
+			def enqueue(self, system_id, statuses):
+				enqueued.append((system_id, [status['time'] for status in statuses]))
+		samples = [PowerSample.fromJSON(row) for row in powerRows(100, 0, 200, 300)]
+		queueStatuses(StandInOutbox(), '1234', samples, uploaded=uploaded.append)
+		self.assertEqual(enqueued, [('1234', ['10:00', '10:10', '10:15'])])
+		self.assertEqual(uploaded, [samples[-1]])
+
+		queueStatuses(StandInOutbox(), '1234', [], uploaded=uploaded.append)
+		self.assertEqual(uploaded, [samples[-1]])
+
+if __name__ == '__main__':
+	unittest.main()
+
+# END OF FILE
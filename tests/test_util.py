@@ -0,0 +1,45 @@
+# -* coding: utf-8 *-
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import calendar
+import unittest
+from util import parse_timestamp
+from SolarmanPVAPI.records import utcOffset
+
+# 2016-10-18 06:45:00 UTC
+expected = calendar.timegm((2016, 10, 18, 6, 45, 0, 0, 0, 0))
+
+class ParseTimestampTest(unittest.TestCase):
+	def testApiFormats(self):
+		for value in ('2016-10-18T06:45:00Z', '2016-10-18T06:45:00', '2016-10-18T16:45:00+10:00', '2016-10-18T02:45:00-04:00',
+				'2016-10-18T16:45:00.250+10:00'):
+			self.assertEqual(parse_timestamp(value), expected, value)
+
+	def testOtherOffsets(self):
+		# not the API's format, but not to be misread either
+		for (value, offset) in (('2016-10-18T12:15:00+0530', 19800), ('2016-10-18T16:45:00+10', 36000),
+				('2016-10-18T01:15:00-0530', -19800), ('2016-10-18 12:15:00+05:30', 19800), ('2016-10-18T12:15+05:30', 19800)):
+			self.assertEqual(parse_timestamp(value), expected, value)
+			self.assertEqual(utcOffset(value), offset, value)
+
+	def testInvalid(self):
+		for value in ('', 'garbage', '2016-10-18X06:45:00Z', '2016/10/18T06:45:00Z', '2016-10-18T06:45:00+5:30',
+				'2016-10-18T06:45:00+10:0', '2016-10-18T06:45:00 AEST'):
+			with self.assertRaises(ValueError, msg=value):
+				parse_timestamp(value)
+
+if __name__ == '__main__':
+	unittest.main()
+
+# END OF FILE
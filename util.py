@@ -16,7 +16,13 @@
 # Developed 2016 by Christopher McAvaney <christopher.mcavaney@gmail.com>
 
 import datetime, calendar
+import re
 import sys
+import os
+import json
+import time
+import tempfile
+import threading
 
 # Auxiliary routine
 def DEBUG(*s):
@@ -32,4 +38,136 @@ def utc_to_local(utc_dt):
 	assert utc_dt.resolution >= datetime.timedelta(microseconds=1)
 	return local_dt.replace(microsecond=utc_dt.microsecond)
 
+# Epoch seconds at the start of each YYYY-MM-DD seen by parse_timestamp() (bounded, it is just a cache)
+_day_start_cache = {}
+
+# Anything else ISO 8601 like the API might send - a space for the T, no seconds, +HHMM or +HH offsets
+_timestamp_re = re.compile(r'^(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2})(?::(\d{2})(?:\.\d*)?)?(Z|[+-]\d{2}(?::?\d{2})?)?$')
+
+# UTC offset in seconds of the zone on the end of a timestamp (Z, +HH:MM, +HHMM or +HH, or '' for
+# none), None for UTC.  Raises ValueError for anything else.
+def parse_utc_offset(zone):
+	if zone == 'Z' or zone == '':
+		return None
+	if zone[0] not in '+-' or not zone[1:].replace(':', '').isdigit():
+		raise ValueError('invalid UTC offset: %r' % (zone,))
+	if len(zone) == 6 and zone[3] == ':':
+		offset = int(zone[1:3]) * 3600 + int(zone[4:6]) * 60
+	elif len(zone) == 5:
+		offset = int(zone[1:3]) * 3600 + int(zone[3:5]) * 60
+	elif len(zone) == 3:
+		offset = int(zone[1:3]) * 3600
+	else:
+		raise ValueError('invalid UTC offset: %r' % (zone,))
+	return -offset if zone[0] == '-' else offset
+
+# Fast fixed format parser for the API timestamps, returns a unix timestamp (int).  Handles
+# YYYY-MM-DDTHH:MM:SS followed by optional fractional seconds and Z, +HH:MM or -HH:MM (no offset is UTC),
+# e.g. 2016-10-18T05:00:00Z or 2016-10-18T16:45:00+10:00, and hands anything else to the slower
+# _parse_timestamp_slow().
+def parse_timestamp(value):
+	try:
+		return _parse_timestamp_fast(value)
+	except (ValueError, IndexError):
+		return _parse_timestamp_slow(value)
+
+def _parse_timestamp_fast(value):
+	if value[4] != '-' or value[7] != '-' or value[10] != 'T' or value[13] != ':' or value[16] != ':':
+		raise ValueError('invalid timestamp: %r' % (value,))
+	zone = value[19:]
+	if zone[:1] == '.':
+		# ignore fractional seconds
+		zone = zone.lstrip('.0123456789')
+	if not (zone == 'Z' or zone == '' or (len(zone) == 6 and zone[0] in '+-' and zone[3] == ':')):
+		raise ValueError('invalid timestamp: %r' % (value,))
+
+	day = value[0:10]
+	day_start = _day_start_cache.get(day)
+	if day_start is None:
+		if len(_day_start_cache) > 1024:
+			_day_start_cache.clear()
+		day_start = calendar.timegm((int(value[0:4]), int(value[5:7]), int(value[8:10]), 0, 0, 0, 0, 0, 0))
+		_day_start_cache[day] = day_start
+	timestamp = day_start + int(value[11:13]) * 3600 + int(value[14:16]) * 60 + int(value[17:19])
+
+	if zone == 'Z' or zone == '':
+		return timestamp
+	offset = int(zone[1:3]) * 3600 + int(zone[4:6]) * 60
+	if zone[0] == '+':
+		return timestamp - offset
+	return timestamp + offset
+
+def _parse_timestamp_slow(value):
+	match = _timestamp_re.match(value.strip())
+	if match is None:
+		raise ValueError('invalid timestamp: %r' % (value,))
+	(year, month, day, hour, minute, second, zone) = match.groups()
+	timestamp = calendar.timegm((int(year), int(month), int(day), int(hour), int(minute), int(second or 0), 0, 0, 0))
+	offset = parse_utc_offset(zone or '')
+	if offset is None:
+		return timestamp
+	return timestamp - offset
+
+# Token bucket rate limiter - rate tokens are added per second, up to capacity (the burst allowed).
+# acquire() blocks until there is a token, it can be shared between threads.
+class RateLimiter:
+	def __init__(self, rate, capacity=None):
+		self.rate = float(rate)
+		if capacity is None:
+			capacity = max(1.0, self.rate)
+		self.capacity = float(capacity)
+		self.tokens = self.capacity
+		self.updated = time.time()
+		self.lock = threading.Lock()
+
+	def refill(self, now):
+		self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+		self.updated = now
+
+	# Seconds until tokens are available (0 if they are now), takes them if they are
+	def try_acquire(self, tokens=1):
+		with self.lock:
+			now = time.time()
+			self.refill(now)
+			if self.tokens >= tokens:
+				self.tokens -= tokens
+				return 0
+			return (tokens - self.tokens) / self.rate
+
+	def acquire(self, tokens=1):
+		while True:
+			wait = self.try_acquire(tokens)
+			if wait <= 0:
+				return
+			time.sleep(wait)
+
+# Write obj as JSON to a temporary file in the same directory and rename it over the top, so that
+# readers only ever see a complete file (mkstemp() creates the file as 0600)
+def write_json_atomically(path, obj):
+	fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path), dir=os.path.dirname(os.path.abspath(path)))
+	try:
+		with os.fdopen(fd, 'w') as f:
+			json.dump(obj, f)
+			f.flush()
+			os.fsync(f.fileno())
+		# os.replace() is only in python3, os.rename() is atomic on POSIX anyway
+		getattr(os, 'replace', os.rename)(tmp_path, path)
+	except:
+		try:
+			os.unlink(tmp_path)
+		except OSError:
+			pass
+		raise
+
+# Read a JSON object (dict) from path, an empty dict if it doesn't exist or is corrupt
+def read_json_file(path):
+	try:
+		with open(path, 'r') as f:
+			obj = json.load(f)
+	except (IOError, OSError, ValueError):
+		return {}
+	if not isinstance(obj, dict):
+		return {}
+	return obj
+
 # END OF FILE